@@ -0,0 +1,197 @@
+# Adaptive scans: the next duration of a scanned instruction is proposed from measurement results,
+# instead of running a fixed grid. Results are fed back over a local TCP connection, one number per line for the loaded point, e.g.
+#
+#   import socket
+#   s = socket.create_connection(("127.0.0.1", 6341))
+#   s.sendall(b"1.234\n")
+#
+# Strategies propose durations in ns, quantized to the 10 ns time resolution of PulseBlasterUSB.
+
+import math, threading, logging
+import socketserver
+import numpy as np
+import pb_program
+
+time_resolution = 10 # ns
+default_port = 6341
+strategies = ["Golden Section", "Bayesian"]
+
+# round a duration (ns) to the time resolution, within [lo, hi]
+def quantize(duration, lo, hi):
+    duration = min(max(duration, lo), hi)
+
+    return float(np.round(duration/time_resolution)*time_resolution)
+
+# golden-section search of the optimum of a unimodal function on [lo, hi] (ns)
+class goldenSection:
+    ratio = (math.sqrt(5)-1)/2
+
+    # max_points: the maximum number of points to measure; maximize: to find the maximum (True) or the minimum (False)
+    def __init__(self, lo, hi, max_points=30, maximize=True):
+        self.lo = lo
+        self.hi = hi
+        self.max_points = max_points
+        self.sign = -1 if maximize else 1
+        self.results = {} # duration: measured value
+        self.a = lo
+        self.b = hi
+        self.c = quantize(self.b-self.ratio*(self.b-self.a), lo, hi)
+        self.d = quantize(self.a+self.ratio*(self.b-self.a), lo, hi)
+
+    # the next duration to measure, or None if the search has converged
+    def propose(self):
+        while True:
+            if len(self.results) >= self.max_points:
+                return None
+            if (self.b-self.a <= time_resolution) or (self.c >= self.d):
+                return None
+            for x in (self.c, self.d):
+                if x not in self.results:
+                    return x
+
+            # both inner points are measured, shrink the bracket
+            if self.sign*self.results[self.c] < self.sign*self.results[self.d]:
+                self.b = self.d
+                self.d = self.c
+                self.c = quantize(self.b-self.ratio*(self.b-self.a), self.lo, self.hi)
+            else:
+                self.a = self.c
+                self.c = self.d
+                self.d = quantize(self.a+self.ratio*(self.b-self.a), self.lo, self.hi)
+
+    def tell(self, x, y):
+        self.results[x] = y
+
+    # the best measured (duration, value)
+    def best(self):
+        if not self.results:
+            return None
+
+        return min(self.results.items(), key=lambda item: self.sign*item[1])
+
+# Bayesian optimization with a Gaussian process (squared exponential kernel) and expected improvement
+class bayesianOptimizer:
+    # num_init: number of evenly spaced points to measure first; length_scale: kernel length scale as a fraction of [lo, hi]
+    # noise: measurement noise relative to the standard deviation of measured values
+    def __init__(self, lo, hi, max_points=30, maximize=True, num_init=4, length_scale=0.15, noise=0.1, num_candidates=2000):
+        self.lo = lo
+        self.hi = hi
+        self.max_points = max_points
+        self.sign = -1 if maximize else 1
+        self.length_scale = length_scale
+        self.noise = noise
+        self.results = {} # duration: mean measured value
+        self.num_measured = {} # duration: number of measurements
+        self.init_points = [quantize(x, lo, hi) for x in np.linspace(lo, hi, max(min(num_init, max_points), 1))]
+        num = min(num_candidates, int((hi-lo)/time_resolution)+1)
+        self.candidates = np.unique([quantize(x, lo, hi) for x in np.linspace(lo, hi, num)])
+
+    def kernel(self, x1, x2):
+        d = (x1[:, None]-x2[None, :])/self.length_scale
+
+        return np.exp(-0.5*d**2)
+
+    # posterior mean and standard deviation of the (sign adjusted, normalized) objective at x (normalized)
+    def posterior(self, x):
+        xs = np.array([(k-self.lo)/(self.hi-self.lo) for k in self.results])
+        ys = np.array([self.sign*v for v in self.results.values()])
+        y_mean = ys.mean()
+        y_std = ys.std() if ys.std() > 0 else 1.0
+        ys = (ys-y_mean)/y_std
+
+        K = self.kernel(xs, xs) + self.noise**2*np.eye(len(xs))
+        L = np.linalg.cholesky(K)
+        alpha = np.linalg.solve(L.T, np.linalg.solve(L, ys))
+        Ks = self.kernel(x, xs)
+        mu = Ks @ alpha
+        v = np.linalg.solve(L, Ks.T)
+        sigma = np.sqrt(np.clip(1-np.sum(v**2, axis=0), 1e-12, None))
+
+        return mu, sigma, ys.min()
+
+    def propose(self):
+        if sum(self.num_measured.values()) >= self.max_points:
+            return None
+        for x in self.init_points:
+            if x not in self.results:
+                return x
+
+        # maximize expected improvement (of the minimum of the sign adjusted objective)
+        x = (self.candidates-self.lo)/(self.hi-self.lo)
+        mu, sigma, y_best = self.posterior(x)
+        z = (y_best-mu)/sigma
+        cdf = 0.5*(1+np.vectorize(math.erf)(z/math.sqrt(2)))
+        pdf = np.exp(-0.5*z**2)/math.sqrt(2*math.pi)
+        ei = (y_best-mu)*cdf + sigma*pdf
+
+        return float(self.candidates[np.argmax(ei)])
+
+    def tell(self, x, y):
+        # repeated points are averaged
+        n = self.num_measured.get(x, 0)
+        self.results[x] = (self.results.get(x, 0)*n+y)/(n+1)
+        self.num_measured[x] = n+1
+
+    # the best (duration, value) by the posterior mean at measured points
+    def best(self):
+        if not self.results:
+            return None
+
+        xs = np.array(list(self.results))
+        mu, sigma, y_best = self.posterior((xs-self.lo)/(self.hi-self.lo))
+        x = float(xs[np.argmin(mu)])
+
+        return x, self.results[x]
+
+# create a strategy by its name in "strategies"
+def new_strategy(name, lo, hi, max_points, maximize=True):
+    if name == "Golden Section":
+        return goldenSection(lo, hi, max_points, maximize)
+    elif name == "Bayesian":
+        return bayesianOptimizer(lo, hi, max_points, maximize)
+    else:
+        raise ValueError(f"Unsupported adaptive scan strategy: {name}.")
+
+# scan sequences (see pb_program.generate_sequence) of given durations of the first scan instruction.
+# Other scan instructions move proportionally between their start and end durations.
+def scan_sequence(scan_instr_list, points):
+    points = np.array(points, dtype=float)
+    ranges = [(pb_program.duration_in_ns(s["start duration time"], s["start duration unit"]),
+               pb_program.duration_in_ns(s["end duration time"], s["end duration unit"])) for s in scan_instr_list]
+    start, end = ranges[0]
+    frac = (points-start)/(end-start) if end != start else np.zeros(len(points))
+
+    scan_sequence_list = []
+    for scan_instr, (start, end) in zip(scan_instr_list, ranges):
+        seq = np.round((start+frac*(end-start))/time_resolution)*time_resolution
+        scan_sequence_list.append({"instr no.": int(scan_instr["instr no."]), "sequence": seq})
+
+    return scan_sequence_list
+
+# a TCP server on localhost, callback(value) is called (in a server thread) for every number received
+class feedbackServer:
+    def __init__(self, callback, port=default_port):
+        class handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        value = float(line)
+                    except ValueError:
+                        logging.warning(f"Adaptive scan feedback ({line}) isn't a number.")
+                        continue
+                    callback(value)
+
+        class server(socketserver.ThreadingTCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        self.server = server(("127.0.0.1", port), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,227 @@
+# A single queue for all SpinAPI access. pb_select_board() is global state of the library, so two threads that program boards
+# at the same time (e.g. "Load Boards" in the GUI thread and the DAQ callback of a scan) would mix up their instructions.
+# Every SpinAPI call runs in one worker thread, one command at a time, in order of priority: scan reprogramming before
+# interactive actions, and first come, first served within a priority. Commands on several boards are split into one command
+# per board, so a scan upload waits at most for one board of an interactive command, and uploads never interleave.
+# An upload of a board replaces a pending (not yet started) upload of the same board, whatever its priority, and keeps the
+# more urgent priority, so an older upload never runs after a newer one. Time in the queue and time to run are recorded.
+# Every board gets its own program (pb_program.compile_board_program), and in a scan a board is skipped if it already has
+# the same program.
+
+import threading, time, heapq, itertools, logging
+import concurrent.futures
+import metrics
+import board_sync
+import pb_program
+
+# priorities, a lower value runs first
+SCAN = 0
+INTERACTIVE = 1
+priority_names = {SCAN: "scan", INTERACTIVE: "interactive"}
+
+board_programming_hist = metrics.new_histogram("pb_board_programming_seconds", "Time to program one board.")
+instr_written_counter = metrics.new_counter("pb_instructions_written_total", "Number of instructions written to boards.")
+queue_wait_hist = metrics.new_histogram("pb_queue_wait_seconds", "Time a SpinAPI command waits in the board queue.")
+queue_run_hist = metrics.new_histogram("pb_queue_run_seconds", "Time to run a SpinAPI command.")
+superseded_counter = metrics.new_counter("pb_queue_superseded_total", "Number of uploads replaced by a newer upload before they started.")
+skipped_counter = metrics.new_counter("pb_uploads_skipped_total", "Number of board uploads skipped because the board already has the program.")
+
+class boardQueue:
+    # api: the spinapi module, or an object with the same functions (e.g. pb_emulator.emulator)
+    def __init__(self, api):
+        self.api = api
+        self.heap = [] # entries [priority, sequence number, name, function, future, time submitted, coalescing key]
+        self.pending = {} # coalescing key: pending entry
+        self.order = itertools.count()
+        self.cond = threading.Condition()
+        self.stats = {} # (name, priority): [count, superseded, total wait, max wait, total run] in seconds
+        self.sync = None # settings of a synchronized start of multiple boards, see board_sync.py
+        self.uploaded = {} # board index: upload_key() of the last program written to it
+        self.writing = {} # board index: (token, upload_key()) of the newest write submitted but not finished
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True, name="SpinAPI queue")
+        self.thread.start()
+
+    # queue a function (without arguments) to run in the worker thread, return a concurrent.futures.Future of its result.
+    # key: commands with the same key coalesce, a pending one is replaced and its future gets None,
+    # the new one runs with the more urgent of both priorities
+    def submit(self, name, func, priority=INTERACTIVE, key=None):
+        future = concurrent.futures.Future()
+        # a command can't wait for another one in the worker thread
+        if threading.current_thread() is self.thread:
+            future.set_result(func())
+            return future
+
+        with self.cond:
+            if not self.running:
+                raise RuntimeError("The board queue is closed.")
+            if key is not None:
+                old = self.pending.pop(key, None)
+                if old is not None:
+                    old[3] = None # skipped when it's popped
+                    old[4].set_result(None)
+                    self.stats.setdefault((old[2], old[0]), [0, 0, 0.0, 0.0, 0.0])[1] += 1
+                    superseded_counter.inc(command=old[2])
+                    priority = min(priority, old[0])
+            entry = [priority, next(self.order), name, func, future, time.perf_counter(), key]
+            if key is not None:
+                self.pending[key] = entry
+            heapq.heappush(self.heap, entry)
+            self.cond.notify()
+
+        return future
+
+    # run a function in the worker thread and wait for its result
+    def call(self, name, func, priority=INTERACTIVE):
+        return self.submit(name, func, priority).result()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.running and not self.heap:
+                    self.cond.wait()
+                if not self.heap:
+                    return
+                entry = heapq.heappop(self.heap)
+                priority, _, name, func, future, t_submit, key = entry
+                if func is None:
+                    continue
+                if (key is not None) and (self.pending.get(key) is entry):
+                    del self.pending[key]
+
+            t0 = time.perf_counter()
+            try:
+                result = func()
+            except Exception as err:
+                future.set_exception(err)
+            else:
+                future.set_result(result)
+            t1 = time.perf_counter()
+
+            labels = {"command": name, "priority": priority_names[priority]}
+            queue_wait_hist.observe(t0-t_submit, **labels)
+            queue_run_hist.observe(t1-t0, **labels)
+            with self.cond:
+                s = self.stats.setdefault((name, priority), [0, 0, 0.0, 0.0, 0.0])
+                s[0] += 1
+                s[2] += t0-t_submit
+                s[3] = max(s[3], t0-t_submit)
+                s[4] += t1-t0
+
+    # write compiled instructions (in the format of instrTable.compile_instr()) to boards, one command per board.
+    # boards: indices of boards to write, None for all; wait: wait until every board is written, otherwise return the futures
+    # skip_unchanged: skip boards that already have their program, e.g. in a scan. The first upload of a scan shouldn't skip,
+    # a board that's power cycled since its last upload has lost its program.
+    def write(self, instr_list, boards=None, priority=INTERACTIVE, wait=True, skip_unchanged=False):
+        instr_list = [None if instrs is None else pb_program.compile_board_program(instrs) for instrs in instr_list]
+        if self.sync is not None:
+            instr_list = board_sync.sync_programs(instr_list, self.sync, boards)
+        futures = []
+        for j, instr_single_board in enumerate(instr_list):
+            if (boards is not None) and (j not in boards):
+                continue
+            key = upload_key(instr_single_board)
+            token = object()
+            with self.cond:
+                # the program the board will have, after the write that's pending or running
+                expected = self.writing[j][1] if j in self.writing else self.uploaded.get(j)
+                if skip_unchanged and (expected == key):
+                    skipped_counter.inc(board=j)
+                    continue
+                self.writing[j] = (token, key)
+            futures.append(self.submit("write", lambda j=j, instrs=instr_single_board, key=key, token=token: self.write_board(j, instrs, key, token),
+                                       priority, key=("write", j)))
+
+        if not wait:
+            for future in futures:
+                future.add_done_callback(log_exception)
+            return futures
+
+        for future in futures:
+            future.result()
+
+    # program one board, runs in the worker thread. key: upload_key() of the program, recorded once it's written;
+    # token: identifies the write in self.writing
+    def write_board(self, j, instr_single_board, key=None, token=None):
+        try:
+            with board_programming_hist.time(board=j):
+                self.api.pb_select_board(j)
+                self.api.pb_start_programming(0) # PULSE_PROGRAM
+                for instr in instr_single_board:
+                    self.api.pb_inst_pbonly(*instr[1:5])
+                self.api.pb_stop_programming()
+        except Exception:
+            # what the board has is unknown, the next upload can't be skipped
+            with self.cond:
+                self.uploaded.pop(j, None)
+                if (j in self.writing) and (self.writing[j][0] is token):
+                    del self.writing[j]
+            raise
+        with self.cond:
+            self.uploaded[j] = key
+            if (j in self.writing) and (self.writing[j][0] is token):
+                del self.writing[j]
+        instr_written_counter.inc(len(instr_single_board), board=j)
+
+    # stop, reset and restart boards, to make them ready to be triggered. boards: indices of boards, None for all
+    def restart(self, num_boards, priority=INTERACTIVE, boards=None):
+        def restart_board(i):
+            self.api.pb_select_board(i)
+            self.api.pb_stop()
+            self.api.pb_reset()
+            self.api.pb_start()
+
+        boards = range(num_boards) if boards is None else boards
+        futures = [self.submit("restart", lambda i=i: restart_board(i), priority) for i in boards]
+        for future in futures:
+            future.result()
+
+        # synchronized boards wait at the arming WAIT, a trigger of the master starts all of them
+        if (self.sync is not None) and (board_sync.master in boards):
+            self.software_trigger(num_boards, priority, boards)
+
+    # trigger boards once, multiple boards won't be trigger at the same time, unless they are synchronized,
+    # then only the master is triggered and it triggers the others
+    def software_trigger(self, num_boards, priority=INTERACTIVE, boards=None):
+        def start_board(i):
+            self.api.pb_select_board(i)
+            self.api.pb_start()
+
+        boards = range(num_boards) if boards is None else boards
+        if (self.sync is not None) and (board_sync.master in boards):
+            boards = [board_sync.master]
+        futures = [self.submit("software trigger", lambda i=i: start_board(i), priority) for i in boards]
+        for future in futures:
+            future.result()
+
+    # per command: count, superseded uploads, mean and max wait in the queue, mean run time (ms)
+    def summary(self):
+        with self.cond:
+            stats = {k: list(v) for k, v in self.stats.items()}
+
+        result = {}
+        for (name, priority), (count, superseded, total_wait, max_wait, total_run) in sorted(stats.items(), key=lambda x: (x[0][1], x[0][0])):
+            result[f"{name} ({priority_names[priority]})"] = (f"{count} run, {superseded} superseded, "
+                                                             f"wait {total_wait/max(count, 1)*1e3:.3f}/{max_wait*1e3:.3f} ms mean/max, "
+                                                             f"run {total_run/max(count, 1)*1e3:.3f} ms mean")
+
+        return result
+
+    # run the remaining commands, then pb_close(), and stop the worker thread
+    def close(self):
+        try:
+            self.call("close", self.api.pb_close)
+        finally:
+            with self.cond:
+                self.running = False
+                self.cond.notify_all()
+            self.thread.join()
+
+# the compiled program of a board, every pattern, op code, op data and duration. A board whose outputs never change still
+# times WAIT, BRANCH and LOOP with its durations, so only an identical program can be skipped.
+def upload_key(instr_list_single_board):
+    return tuple((instr[1], instr[2], instr[3], instr[4]) for instr in instr_list_single_board)
+
+def log_exception(future):
+    if (not future.cancelled()) and (future.exception() is not None):
+        logging.warning(future.exception())
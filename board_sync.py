@@ -0,0 +1,194 @@
+# Synchronized start of multiple boards. Without it every board waits for its own trigger, and "Software Trig" starts boards
+# one after another, so boards are apart by milliseconds of software jitter.
+# In "Master Trigger" mode board 0 (the master) gets the trigger, and one of its TTL channels (the sync channel) is wired to
+# the HW_TRIGGER input of every other board (slaves). Programs are changed when they are written to boards:
+#   - every board starts with an arming WAIT, so after a restart all boards wait, then one trigger of the master releases all
+#   - the master raises the sync channel whenever it leaves a WAIT, which releases the slaves from the same WAIT
+#   - a slave starts a fixed trigger latency after the master's sync edge, so the master waits that long after every WAIT,
+#     holding its outputs, before it runs the original instruction
+# Boards are then apart by the hardware's fixed latency error only. The latency (default 80 ns) should be measured
+# with an oscilloscope, from the sync edge to a slave output. check_sync runs both the original and the synchronized
+# programs in the emulator (pb_emulator.py) and compares every board's output edges.
+#
+# Example:
+#   python board_sync.py saved_configs/dcfluor_MOT.ini --channel 23 --latency 80
+
+import sys, argparse
+import pb_program
+import pb_emulator
+from pb_program import num_ch_per_board, duration_units
+
+sync_modes = ["Off", "Master Trigger"]
+master = 0 # the board that gets the trigger and drives the sync channel
+default_latency = 80 # ns, from the master's sync edge to the slaves' outputs
+min_duration = 50 # ns, the shortest acceptable instruction duration
+
+CONTINUE, STOP, LOOP, END_LOOP, JSR, RTS, BRANCH, LONG_DELAY, WAIT = range(9)
+
+class syncError(Exception):
+    pass
+
+# sync settings in the GUI and in saved configurations: {"mode", "channel", "latency"}, None if boards aren't synchronized
+def read_sync(config):
+    settings = config["General settings"]
+    if settings.get("board sync", "Off") == "Off":
+        return None
+
+    return {"mode": settings["board sync"],
+            "channel": int(settings.get("sync channel", str(num_ch_per_board-1))),
+            "latency": float(settings.get("trigger latency (ns)", str(default_latency)))}
+
+def new_instr(note, pattern, op_code, duration):
+    return [note, pattern, op_code, 0, float(duration), float(duration), duration_units.index("ns")]
+
+# TTL output patterns a board can have right before instruction i, i.e. of every instruction that can run before it
+def previous_patterns(instr_list_single_board, i):
+    patterns = set()
+    for k, instr in enumerate(instr_list_single_board):
+        op_code, op_data = instr[2], instr[3]
+        if (k == i-1) and (op_code in [CONTINUE, LOOP, END_LOOP, LONG_DELAY, WAIT]):
+            patterns.add(instr[1])
+        elif (op_code in [JSR, BRANCH]) and (op_data == i):
+            patterns.add(instr[1])
+        elif (op_code == RTS) and (i > 0) and (instr_list_single_board[i-1][2] == JSR):
+            patterns.add(instr[1])
+
+    return patterns
+
+# the program of one board, changed for a synchronized start (see the top of this file)
+def sync_program(instr_list_single_board, board, sync):
+    latency = round(sync["latency"]/10)*10
+    if latency < min_duration:
+        raise syncError(f"Error: Trigger latency ({sync['latency']:g} ns) is shorter than {min_duration} ns.")
+    is_master = (board == master)
+    sync_bit = 1 << sync["channel"]
+
+    # master's WAIT instructions are split in two, later addresses move
+    split = [is_master and (instr[2] == WAIT) for instr in instr_list_single_board]
+    address = []
+    a = 2 # after the arming instructions
+    for s in split:
+        address.append(a)
+        a += 2 if s else 1
+
+    program = [new_instr("sync arm", 0, CONTINUE, min_duration),
+               new_instr("sync arm", sync_bit if is_master else 0, WAIT, min_duration+latency if is_master else min_duration)]
+    for i, instr in enumerate(instr_list_single_board):
+        if is_master and (instr[1] & sync_bit):
+            raise syncError(f"Error (Instr {i}): Sync channel {sync['channel']} of board {master} is used by the program.")
+
+        instr = list(instr)
+        if instr[2] in [JSR, BRANCH, END_LOOP]:
+            if not (0 <= instr[3] < len(address)):
+                raise syncError(f"Error (Instr {i}): Op data {instr[3]} is not a valid instruction address.")
+            instr[3] = address[instr[3]]
+
+        if split[i]:
+            patterns = previous_patterns(instr_list_single_board, i) or {0}
+            if len(patterns) > 1:
+                raise syncError(f"Error (Instr {i}): Outputs before this WAIT depend on the path, board {master} can't hold them.")
+            program.append(new_instr(instr[0], patterns.pop() | sync_bit, WAIT, latency))
+            instr[2] = CONTINUE
+        program.append(instr)
+
+    return program
+
+# the programs of all boards (in the format of instrTable.compile_instr()), changed for a synchronized start
+def sync_programs(instr_list, sync, boards=None):
+    return [sync_program(instr_single_board, j, sync) if (boards is None) or (j in boards) else instr_single_board
+            for j, instr_single_board in enumerate(instr_list)]
+
+# output edges (absolute time, pattern) of emulated cycles, every cycle starts at the given time
+def output_edges(cycles, starts, mask):
+    edges = []
+    last = 0 # outputs are off after a reset
+    for start, cycle in zip(starts, cycles):
+        for t, pattern in cycle["timeline"]:
+            pattern &= mask
+            if pattern != last:
+                edges.append((start+t, pattern))
+            last = pattern
+
+    return edges
+
+# check in the emulator that synchronized programs give every board the same outputs as the original programs would,
+# if all boards were triggered at the same time. Return a list of error messages.
+# The master is triggered as soon as it waits, slaves a trigger latency after the master's sync edge.
+def check_sync(instr_list, sync, num_triggers=3):
+    errors = []
+    try:
+        programs = sync_programs(instr_list, sync)
+        master_cycles = pb_emulator.emulate_program(programs[master]).run(num_triggers+1)
+    except syncError as err:
+        return [str(err)]
+    except pb_emulator.emulatorError as err:
+        return [f"Error (Board {master}): {err}"]
+
+    latency = round(sync["latency"]/10)*10
+    # when the master leaves every WAIT
+    master_starts = [0]
+    for cycle in master_cycles[:-1]:
+        master_starts.append(master_starts[-1]+cycle["duration"])
+    # the original programs start after the arming WAIT
+    t_program = master_starts[1]+latency+min_duration
+
+    for j in range(len(instr_list)):
+        try:
+            reference = pb_emulator.emulate_program(instr_list[j]).run(num_triggers)
+            synced = master_cycles if j == master else pb_emulator.emulate_program(programs[j]).run(num_triggers+1)
+        except pb_emulator.emulatorError as err:
+            errors.append(f"Error (Board {j}): {err}")
+            continue
+
+        if j == master:
+            starts = master_starts
+        else:
+            starts = [0] + [t+latency for t in master_starts[1:]]
+            for k in range(1, len(synced)):
+                if starts[k-1]+synced[k-1]["duration"] > master_starts[k]:
+                    errors.append(f"Error (Board {j}): It isn't waiting when the sync edge of cycle {k} comes.")
+                    break
+
+        # the same cycle of every board should start at the same time, a trigger latency after the master's sync edge
+        mask = ~(1 << sync["channel"]) if j == master else -1
+        reference_starts = [t_program] + [t+latency for t in master_starts[2:]]
+        expected = output_edges(reference, reference_starts, mask)
+        actual = output_edges(synced, starts, mask)
+        actual = [(t, pattern) for t, pattern in actual if t >= t_program]
+        expected = [(t, pattern) for t, pattern in expected if t >= t_program]
+        for (t_a, p_a), (t_e, p_e) in zip(actual, expected):
+            if (t_a, p_a) != (t_e, p_e):
+                errors.append(f"Error (Board {j}): Output 0b{p_a & (2**num_ch_per_board-1):0{num_ch_per_board}b} at {t_a-t_program:g} ns, "
+                              f"expected 0b{p_e & (2**num_ch_per_board-1):0{num_ch_per_board}b} at {t_e-t_program:g} ns.")
+                break
+        else:
+            if len(actual) != len(expected):
+                errors.append(f"Error (Board {j}): {len(actual)} output edges, expected {len(expected)}.")
+
+    return errors
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check the synchronized start of multiple boards in the emulator.")
+    parser.add_argument("config", help="saved configuration")
+    parser.add_argument("--channel", type=int, default=None, help="sync channel of board 0, the saved one if not given")
+    parser.add_argument("--latency", type=float, default=None, help="trigger latency in ns, the saved one if not given")
+    parser.add_argument("--triggers", type=int, default=3, help="number of triggers to emulate")
+    args = parser.parse_args()
+
+    config = pb_program.read_config(args.config)
+    sync = read_sync(config) or {"mode": "Master Trigger", "channel": num_ch_per_board-1, "latency": default_latency}
+    if args.channel is not None:
+        sync["channel"] = args.channel
+    if args.latency is not None:
+        sync["latency"] = args.latency
+
+    instr_list = pb_program.compile_config(config)
+    errors = check_sync(instr_list, sync, args.triggers)
+    for error in errors:
+        print(error)
+    if errors:
+        sys.exit(1)
+
+    programs = sync_programs(instr_list, sync)
+    print(f"{len(instr_list)} board(s) synchronized by channel {sync['channel']} of board {master}, trigger latency {sync['latency']:g} ns: "
+          f"{', '.join(str(len(p)) for p in programs)} instructions.")
@@ -0,0 +1,224 @@
+# A content-addressed history of configurations, a deduplicated alternative to saving a full file for every version.
+# Every section of a configuration (e.g. "Instr 3") is stored once, by the sha1 hash of its content, and a version is a tree:
+# version -> groups (connections, instructions, scanner) -> sections. Versions that differ by one duration share every other
+# section and group, so a new version costs a few hashes. A diff descends only into groups and sections whose hashes differ,
+# and instructions are matched by content, so an inserted instruction doesn't show up as a change of every later one.
+# The history is a sqlite database, like config_index.py.
+#
+# Examples:
+#   python config_history.py --import saved_configs/*.ini
+#   python config_history.py --log
+#   python config_history.py --diff 12 15
+#   python config_history.py --checkout 12 --output saved_configs/restored.ini
+
+import sys, time, sqlite3, hashlib, difflib, configparser, argparse
+import pb_program
+
+history_filename = "config_history.sqlite"
+groups = ["connections", "instructions", "scanner", "other"]
+
+schema = """
+CREATE TABLE IF NOT EXISTS objects (hash TEXT PRIMARY KEY, data TEXT);
+CREATE TABLE IF NOT EXISTS versions (id INTEGER PRIMARY KEY AUTOINCREMENT, time REAL, name TEXT, root TEXT);
+"""
+
+# open (and create if needed) the history database
+def open_history(filename=history_filename):
+    db = sqlite3.connect(filename)
+    db.executescript(schema)
+
+    return db
+
+# the group a section belongs to
+def group_of(section):
+    if section == "General settings":
+        return "connections"
+    elif section.startswith("Instr "):
+        return "instructions"
+    elif (section == "Scanner settings") or section.startswith("Scan Instr "):
+        return "scanner"
+    else:
+        return "other"
+
+# canonical text of a section's content, without its name, so equal instructions at different positions share one object.
+# Keys without values (comments in saved files) are skipped.
+def section_text(items):
+    return "".join(f"{key} = {value}\n" for key, value in items if value is not None)
+
+def parse_section_text(text):
+    return dict(line.split(" = ", 1) for line in text.splitlines())
+
+# store an object, return its hash
+def put(db, text):
+    h = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    db.execute("INSERT OR IGNORE INTO objects VALUES (?, ?)", (h, text))
+
+    return h
+
+# objects never change, so they can be cached by hash
+object_cache = {}
+
+def get(db, h):
+    if h not in object_cache:
+        row = db.execute("SELECT data FROM objects WHERE hash = ?", (h,)).fetchone()
+        if row is None:
+            raise KeyError(f"Object {h} isn't in the history.")
+        object_cache[h] = row[0]
+
+    return object_cache[h]
+
+# a tree object lists "name hash" lines, in order
+def tree_text(entries):
+    return "".join(f"{name}\t{h}\n" for name, h in entries)
+
+def parse_tree(text):
+    return [tuple(line.split("\t")) for line in text.splitlines()]
+
+# store a configuration (a configparser object), return the hash of its root tree
+def store_config(db, config):
+    entries = {group: [] for group in groups}
+    for section in config.sections():
+        entries[group_of(section)].append((section, put(db, section_text(config.items(section, raw=True)))))
+
+    return put(db, tree_text([(group, put(db, tree_text(entries[group]))) for group in groups]))
+
+# add a version, return (version id, whether it's new). A configuration equal to the latest version isn't added again.
+def commit(db, config, name=""):
+    root = store_config(db, config)
+    latest = db.execute("SELECT id, root FROM versions ORDER BY id DESC LIMIT 1").fetchone()
+    if (latest is not None) and (latest[1] == root):
+        db.commit()
+        return latest[0], False
+
+    cursor = db.execute("INSERT INTO versions (time, name, root) VALUES (?, ?, ?)", (time.time(), name, root))
+    db.commit()
+
+    return cursor.lastrowid, True
+
+# list versions, newest first, as (id, time, name)
+def log(db, limit=None):
+    query = "SELECT id, time, name FROM versions ORDER BY id DESC"
+    if limit is not None:
+        query += f" LIMIT {int(limit)}"
+
+    return db.execute(query).fetchall()
+
+def root_of(db, version):
+    row = db.execute("SELECT root FROM versions WHERE id = ?", (version,)).fetchone()
+    if row is None:
+        raise KeyError(f"Version {version} isn't in the history.")
+
+    return row[0]
+
+# rebuild the configuration of a version, in the same form as pb_program.read_config returns
+def checkout(db, version):
+    config = configparser.ConfigParser()
+    config.optionxform = str
+    for group, group_hash in parse_tree(get(db, root_of(db, version))):
+        for section, h in parse_tree(get(db, group_hash)):
+            config[section] = parse_section_text(get(db, h))
+
+    return config
+
+# differences of two sections' contents, as (key, old value, new value), None for a missing key
+def diff_sections(text_a, text_b):
+    a = parse_section_text(text_a)
+    b = parse_section_text(text_b)
+
+    return [(key, a.get(key), b.get(key)) for key in list(a) + [k for k in b if k not in a] if a.get(key) != b.get(key)]
+
+# differences between two stored trees (root hashes), as (section, key, old value, new value).
+# A section that's only in one of them has key None, and the old or the new value None.
+def diff_roots(db, root_a, root_b):
+    changes = []
+    if root_a == root_b:
+        return changes
+
+    groups_a = dict(parse_tree(get(db, root_a)))
+    groups_b = dict(parse_tree(get(db, root_b)))
+    for group in groups:
+        if groups_a.get(group) == groups_b.get(group):
+            continue
+
+        entries_a = parse_tree(get(db, groups_a[group])) if group in groups_a else []
+        entries_b = parse_tree(get(db, groups_b[group])) if group in groups_b else []
+        # match sections by content, equal runs are skipped without reading their content
+        matcher = difflib.SequenceMatcher(None, [h for name, h in entries_a], [h for name, h in entries_b], autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                continue
+            num_pairs = min(i2-i1, j2-j1)
+            for k in range(num_pairs):
+                (name_a, h_a), (name_b, h_b) = entries_a[i1+k], entries_b[j1+k]
+                for key, old, new in diff_sections(get(db, h_a), get(db, h_b)):
+                    changes.append((name_b, key, old, new))
+            for name, h in entries_a[i1+num_pairs:i2]:
+                changes.append((name, None, "removed", None))
+            for name, h in entries_b[j1+num_pairs:j2]:
+                changes.append((name, None, None, "added"))
+
+    return changes
+
+# differences between two versions
+def diff(db, version_a, version_b):
+    return diff_roots(db, root_of(db, version_a), root_of(db, version_b))
+
+# differences between a version and a configuration that isn't committed
+def diff_config(db, version, config):
+    root = store_config(db, config)
+    db.commit()
+
+    return diff_roots(db, root_of(db, version), root)
+
+# one line per change
+def format_changes(changes):
+    lines = []
+    for section, key, old, new in changes:
+        if key is None:
+            lines.append(f"{section}: {old or new}")
+        else:
+            lines.append(f"{section}: {key}: {old} -> {new}")
+
+    return lines
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Content-addressed history of configurations.")
+    parser.add_argument("--history", default=history_filename, help="history database file name")
+    parser.add_argument("--import", dest="import_files", nargs="+", metavar="FILE", help="add configuration files as versions, in the given order")
+    parser.add_argument("--log", action="store_true", help="list versions")
+    parser.add_argument("--diff", nargs=2, type=int, metavar=("A", "B"), help="differences from version A to version B")
+    parser.add_argument("--checkout", type=int, metavar="VERSION", help="write a version as a configuration file")
+    parser.add_argument("--output", help="file name for --checkout, print to the console if not given")
+    args = parser.parse_args()
+
+    db = open_history(args.history)
+
+    if args.import_files:
+        for filename in args.import_files:
+            config = pb_program.read_config(filename)
+            if pb_program.is_sequence(config):
+                print(f"Skipped {filename}, it's a scan sequence.")
+                continue
+            version, new = commit(db, config, filename)
+            print(f"{filename}: version {version}{'' if new else ' (unchanged)'}")
+
+    if args.log:
+        for version, t, name in log(db):
+            print(f"{version:>6d}  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t))}  {name}")
+
+    if args.diff:
+        t0 = time.time()
+        lines = format_changes(diff(db, *args.diff))
+        for line in lines:
+            print(line)
+        print(f"{len(lines)} change(s) found in {time.time()-t0:.3f} s.")
+
+    if args.checkout is not None:
+        config = checkout(db, args.checkout)
+        if args.output:
+            with open(args.output, "w") as f:
+                config.write(f)
+        else:
+            config.write(sys.stdout)
+
+    db.close()
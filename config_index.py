@@ -0,0 +1,185 @@
+# An incrementally maintained index of saved configurations and scan sequences.
+# The index is a sqlite database. Only files whose size, modification time or content hash changed are parsed again.
+#
+# Examples:
+#   python config_index.py --update
+#   python config_index.py --channel repumper --state off --note imaging
+#   python config_index.py --min-duration 1ms --max-duration 5ms --op-code WAIT
+
+import os, sys, time, sqlite3, argparse
+import pb_program
+
+index_filename = "config_index.sqlite"
+indexed_dirs = ["saved_configs", "saved_sequences"]
+
+schema = """
+CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, kind TEXT, mtime REAL, size INTEGER, sha1 TEXT);
+CREATE TABLE IF NOT EXISTS channels (path TEXT, board INTEGER, ch INTEGER, name TEXT);
+CREATE TABLE IF NOT EXISTS instrs (path TEXT, board INTEGER, instr INTEGER, note TEXT, pattern INTEGER, op_code TEXT, op_data INTEGER, duration REAL);
+CREATE TABLE IF NOT EXISTS scans (path TEXT, instr INTEGER, num INTEGER, min_duration REAL, max_duration REAL);
+CREATE INDEX IF NOT EXISTS channels_path ON channels (path);
+CREATE INDEX IF NOT EXISTS instrs_path ON instrs (path);
+CREATE INDEX IF NOT EXISTS instrs_duration ON instrs (duration);
+CREATE INDEX IF NOT EXISTS scans_path ON scans (path);
+"""
+
+# open (and create if needed) the index database
+def open_index(filename=index_filename):
+    db = sqlite3.connect(filename)
+    db.executescript(schema)
+
+    return db
+
+# remove every entry of a file from the index
+def remove_file(db, path):
+    for table in ["files", "channels", "instrs", "scans"]:
+        db.execute(f"DELETE FROM {table} WHERE path = ?", (path,))
+
+# parse a file and add its content to the index
+def add_file(db, path, mtime, size, sha1):
+    config = pb_program.read_config(path)
+
+    if pb_program.is_sequence(config):
+        kind = "sequence"
+        sequence = pb_program.compile_sequence(config)
+        for instr_num, seq in sequence.items():
+            db.execute("INSERT INTO scans VALUES (?, ?, ?, ?, ?)", (path, instr_num, len(seq), min(seq), max(seq)))
+
+    else:
+        kind = "config"
+        for i, notes in enumerate(pb_program.compile_connections(config)):
+            db.executemany("INSERT INTO channels VALUES (?, ?, ?, ?)",
+                            [(path, i, j, name) for j, name in enumerate(notes) if name])
+
+        for i, instr_list_single_board in enumerate(pb_program.compile_config(config)):
+            db.executemany("INSERT INTO instrs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            [(path, i, j, instr[0], instr[1], pb_program.op_codes[instr[2]], instr[3], instr[4])
+                             for j, instr in enumerate(instr_list_single_board)])
+
+    db.execute("INSERT INTO files VALUES (?, ?, ?, ?, ?)", (path, kind, mtime, size, sha1))
+
+# bring the index up to date with files on disk, return the number of (re-)parsed files
+def update_index(db, dirs=indexed_dirs):
+    known = {row[0]: row[1:] for row in db.execute("SELECT path, mtime, size, sha1 FROM files")}
+    on_disk = set()
+    num_parsed = 0
+
+    for dir_name in dirs:
+        if not os.path.isdir(dir_name):
+            continue
+
+        for entry in os.scandir(dir_name):
+            if not entry.name.endswith(".ini"):
+                continue
+
+            path = entry.path.replace("\\", "/")
+            on_disk.add(path)
+            stat = entry.stat()
+
+            if path in known:
+                mtime, size, sha1 = known[path]
+                # file is untouched
+                if (mtime == stat.st_mtime) and (size == stat.st_size):
+                    continue
+
+                # file is touched but its content is the same
+                new_sha1 = pb_program.file_hash(path)
+                if new_sha1 == sha1:
+                    db.execute("UPDATE files SET mtime = ?, size = ? WHERE path = ?", (stat.st_mtime, stat.st_size, path))
+                    continue
+            else:
+                new_sha1 = pb_program.file_hash(path)
+
+            remove_file(db, path)
+            try:
+                add_file(db, path, stat.st_mtime, stat.st_size, new_sha1)
+            except Exception as err:
+                print(f"Can't index {path}: {err}")
+                # still record the file, so it won't be parsed again until it changes
+                remove_file(db, path)
+                db.execute("INSERT INTO files VALUES (?, ?, ?, ?, ?)", (path, "unreadable", stat.st_mtime, stat.st_size, new_sha1))
+            num_parsed += 1
+
+    # remove files that no longer exist
+    for path in set(known) - on_disk:
+        remove_file(db, path)
+
+    db.commit()
+
+    return num_parsed
+
+# search the index, return a list of (path, instr or None, description)
+# channel: text contained in a channel note; state: "on" or "off", to require the channel state in matched instructions
+# note: text contained in an instruction note; min_duration/max_duration: in ns; op_code: e.g. "WAIT"
+def search(db, channel=None, state=None, note=None, min_duration=None, max_duration=None, op_code=None):
+    # only a timing range is given, scan sequences can match too
+    results = []
+    if (channel is None) and (note is None) and (op_code is None) and ((min_duration is not None) or (max_duration is not None)):
+        lo = -1 if min_duration is None else min_duration
+        hi = float("inf") if max_duration is None else max_duration
+        for path, instr, num, smin, smax in db.execute("SELECT path, instr, num, min_duration, max_duration FROM scans "
+                                                        "WHERE max_duration >= ? AND min_duration <= ? ORDER BY path", (lo, hi)):
+            results.append((path, instr, f"scan of {num} points from {smin:.0f} ns to {smax:.0f} ns"))
+
+    query = "SELECT DISTINCT i.path, i.instr, i.note, i.op_code, i.duration FROM instrs i"
+    conditions = []
+    args = []
+    if channel is not None:
+        query += " JOIN channels c ON c.path = i.path AND c.board = i.board"
+        conditions.append("c.name LIKE ?")
+        args.append(f"%{channel}%")
+        if state == "on":
+            conditions.append("((i.pattern >> c.ch) & 1) = 1")
+        elif state == "off":
+            conditions.append("((i.pattern >> c.ch) & 1) = 0")
+    if note is not None:
+        conditions.append("i.note LIKE ?")
+        args.append(f"%{note}%")
+    if min_duration is not None:
+        conditions.append("i.duration >= ?")
+        args.append(min_duration)
+    if max_duration is not None:
+        conditions.append("i.duration <= ?")
+        args.append(max_duration)
+    if op_code is not None:
+        conditions.append("i.op_code = ?")
+        args.append(op_code.upper())
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY i.path, i.instr"
+
+    for path, instr, instr_note, instr_op_code, duration in db.execute(query, args):
+        results.append((path, instr, f"{instr_op_code}, {duration:.0f} ns, note: {instr_note}"))
+
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Index and search saved configurations and scan sequences.")
+    parser.add_argument("--index", default=index_filename, help="index database file name")
+    parser.add_argument("--update", action="store_true", help="only update the index")
+    parser.add_argument("--channel", help="text contained in a channel note")
+    parser.add_argument("--state", choices=["on", "off"], help="required state of the matched channel")
+    parser.add_argument("--note", help="text contained in an instruction note")
+    parser.add_argument("--min-duration", type=pb_program.parse_duration, help="e.g. 10ms, 2us, 500ns")
+    parser.add_argument("--max-duration", type=pb_program.parse_duration, help="e.g. 10ms, 2us, 500ns")
+    parser.add_argument("--op-code", choices=pb_program.op_codes)
+    args = parser.parse_args()
+
+    db = open_index(args.index)
+    t0 = time.time()
+    num_parsed = update_index(db)
+    print(f"Index updated in {time.time()-t0:.3f} s, {num_parsed} file(s) parsed.")
+    if args.update:
+        sys.exit()
+
+    t0 = time.time()
+    results = search(db, channel=args.channel, state=args.state, note=args.note,
+                     min_duration=args.min_duration, max_duration=args.max_duration, op_code=args.op_code)
+    last_path = None
+    for path, instr, description in results:
+        if path != last_path:
+            print(path)
+            last_path = path
+        if instr is not None:
+            print(f"    Instr {instr}: {description}")
+    print(f"{len(set(r[0] for r in results))} file(s) matched in {time.time()-t0:.3f} s.")
@@ -0,0 +1,145 @@
+# Cached discovery of DAQ channels. Enumerating every device (DeviceCollection) and then every DI line of every device
+# (DILinesCollection) takes seconds on racks with several chassis, so it's done once in a background thread and the
+# channel map is kept in sets: checking a channel before a scan is a set lookup. The list of device names (one call)
+# is polled every few seconds, and only devices that appear are enumerated, so hot-plugged devices show up and removed ones
+# disappear. refresh() enumerates every device again. A channel that isn't in the cache makes its device enumerated again
+# before it's reported missing, so a stale cache never fails a scan.
+# The GUI uses the cached names to complete channel names in the DAQ channel line edits.
+
+import threading, logging
+
+# kinds of channels: nidaqmx.system.Device attribute
+kinds = {"di lines": "di_lines", "counters": "ci_physical_chans", "terminals": "terminals"}
+poll_interval = 5.0 # seconds between polls of the device names
+
+class daqDiscovery:
+    # nidaqmx_module: the nidaqmx module, or a replacement with the same interface, None to import it in the background
+    def __init__(self, nidaqmx_module=None):
+        self.nidaqmx = nidaqmx_module
+        self.lock = threading.Lock()
+        self.devices = {} # device name: {kind: set of channel names}
+        self.channels = {kind: frozenset() for kind in kinds} # channels of all devices
+        self.ready = threading.Event() # set after the first enumeration, or if it failed
+        self.error = None
+        self.listeners = [] # functions called (in the discovery thread) when channels change
+        self.refresh_requested = threading.Event()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(target=self.run, daemon=True, name="DAQ discovery")
+            self.thread.start()
+
+        return self
+
+    def stop(self):
+        self.running = False
+        self.refresh_requested.set()
+
+    # enumerate every device again, in the background
+    def refresh(self):
+        self.refresh_requested.set()
+
+    def run(self):
+        full = True
+        while self.running:
+            try:
+                if self.nidaqmx is None:
+                    import nidaqmx
+                    self.nidaqmx = nidaqmx
+                self.update(full)
+                error = None
+            except Exception as err:
+                # e.g. nidaqmx or the NI-DAQmx driver isn't installed
+                error = str(err)
+            if error != self.error:
+                if error is not None:
+                    logging.warning(f"DAQ discovery: {error}")
+                self.error = error
+                self.notify()
+            self.ready.set()
+
+            full = self.refresh_requested.wait(poll_interval)
+            self.refresh_requested.clear()
+
+    # channels of one device, {kind: set of names}
+    def enumerate_device(self, name):
+        device = self.nidaqmx.system.Device(name)
+        result = {}
+        for kind, attribute in kinds.items():
+            try:
+                channels = getattr(device, attribute)
+                result[kind] = set(channels if kind == "terminals" else channels.channel_names)
+            except Exception as err:
+                # not every device has every kind of channel
+                logging.debug(f"DAQ discovery ({name}, {kind}): {err}")
+                result[kind] = set()
+
+        return result
+
+    def device_names(self):
+        return list(self.nidaqmx.system.System.local().devices.device_names)
+
+    # enumerate devices that appeared (every device if full), drop devices that are gone
+    def update(self, full=False):
+        with self.lock:
+            known = dict(self.devices)
+
+        devices = {}
+        for name in self.device_names():
+            devices[name] = known[name] if (name in known) and not full else self.enumerate_device(name)
+
+        if devices != known:
+            self.set_devices(devices)
+
+    def set_devices(self, devices):
+        with self.lock:
+            self.devices = devices
+            self.channels = {kind: frozenset(ch for channels in devices.values() for ch in channels[kind]) for kind in kinds}
+        self.notify()
+
+    def notify(self):
+        for listener in self.listeners:
+            try:
+                listener()
+            except Exception as err:
+                logging.warning(err)
+
+    # whether a channel (e.g. "Dev1/port0/line0") exists. Waits for the first enumeration.
+    # A channel that isn't cached is looked up on its device again.
+    def has(self, kind, name, timeout=60):
+        self.ready.wait(timeout)
+        if name in self.channels[kind]:
+            return True
+
+        if self.nidaqmx is None:
+            import nidaqmx
+            self.nidaqmx = nidaqmx
+        device = name.strip("/").split("/")[0]
+        if device not in self.device_names():
+            return False
+        channels = self.enumerate_device(device)
+        with self.lock:
+            devices = dict(self.devices)
+        devices[device] = channels
+        self.set_devices(devices)
+
+        return name in channels[kind]
+
+    # sorted channel names of a kind, e.g. for completion
+    def names(self, kind):
+        return sorted(self.channels[kind])
+
+# one discovery service per process, started on first use
+service = None
+
+def get_service(nidaqmx_module=None):
+    global service
+    if service is None:
+        service = daqDiscovery(nidaqmx_module).start()
+    elif (service.nidaqmx is None) and (nidaqmx_module is not None):
+        service.nidaqmx = nidaqmx_module
+
+    return service
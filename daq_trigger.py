@@ -0,0 +1,111 @@
+# Count PulseBlaster cycles in hardware, to detect missed or doubled DAQ callbacks during a scan.
+# A DAQ counter counts rising edges of the PulseBlaster "WAITING" signal. When a change detection callback arrives,
+# the hardware count tells how many cycles really happened, so the scan index can be resynchronized.
+
+import threading
+
+# a counter input task that counts rising edges
+class edgeCounter:
+    # counter_ch: e.g. "Dev1/ctr0"; edge_term: terminal of the WAITING signal, e.g. "/Dev1/PFI0", None to use the default terminal
+    # nidaqmx_module: the nidaqmx module, or a replacement with the same interface (e.g. fakeNidaqmx below)
+    def __init__(self, counter_ch, edge_term=None, nidaqmx_module=None):
+        if nidaqmx_module is None:
+            import nidaqmx as nidaqmx_module
+        self.nidaqmx = nidaqmx_module
+        self.counter_ch = counter_ch
+        self.edge_term = edge_term
+        self.task = None
+
+    def start(self):
+        const = self.nidaqmx.constants
+        self.task = self.nidaqmx.Task("Edge counter task")
+        ch = self.task.ci_channels.add_ci_count_edges_chan(self.counter_ch, edge=const.Edge.RISING,
+                                                            initial_count=0, count_direction=const.CountDirection.COUNT_UP)
+        if self.edge_term:
+            ch.ci_count_edges_term = self.edge_term
+        self.task.start()
+
+    # number of rising edges since start
+    def read(self):
+        return int(self.task.read())
+
+    def close(self):
+        if self.task is not None:
+            try:
+                self.task.stop()
+                self.task.close()
+            finally:
+                self.task = None
+
+# compare the scan index with the hardware cycle count
+class cycleAccounting:
+    # base: the first sequence element loaded by this scan (before any trigger)
+    def __init__(self, base=0):
+        self.base = base
+        self.missed = [] # sequence elements never loaded because their cycle was missed
+        self.doubled = 0 # number of callbacks without a new cycle
+        self.hardware_count = 0
+
+    # counter: the next sequence element to load; true_count: hardware cycle count; end: length of the sequence
+    # return the element that should be loaded now, or None if there's no new cycle
+    def resync(self, counter, true_count, end=None):
+        self.hardware_count = true_count
+        expected = self.base + true_count
+        if end is not None:
+            expected = min(expected, end)
+        if expected < counter:
+            self.doubled += 1
+            return None
+
+        if expected > counter:
+            self.missed += list(range(counter, expected))
+
+        return expected
+
+    # a short description for logs and saved sequences
+    def summary(self):
+        return {"hardware cycles": str(self.hardware_count),
+                "missed elements": ", ".join(str(i) for i in self.missed),
+                "doubled callbacks": str(self.doubled)}
+
+# a minimal replacement of nidaqmx for edgeCounter, edges are generated by calling fire()
+class fakeNidaqmx:
+    class constants:
+        class Edge:
+            RISING = "rising"
+        class CountDirection:
+            COUNT_UP = "up"
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+        fake = self
+
+        class channels:
+            def add_ci_count_edges_chan(self, counter, edge=None, initial_count=0, count_direction=None):
+                fake.count = initial_count
+                return self
+
+        class task:
+            def __init__(self, name=""):
+                self.ci_channels = channels()
+
+            def start(self):
+                pass
+
+            def read(self):
+                with fake.lock:
+                    return fake.count
+
+            def stop(self):
+                pass
+
+            def close(self):
+                pass
+
+        self.Task = task
+
+    # generate rising edges
+    def fire(self, num=1):
+        with self.lock:
+            self.count += num
@@ -0,0 +1,199 @@
+# Headless batch dry-run of saved configurations and scan sequences against the emulator (pb_emulator.py).
+# Every file is checked in a process pool. For a configuration, the same sanity checks as "Load Boards" and "Scan" are done,
+# then every scan point is run in the emulator to check loop nesting, memory fit and to find the cycle time.
+# Boards of a configuration with "board sync" on are checked for alignment (board_sync.check_sync).
+# The program every board gets (pb_program.compile_board_program) is checked to give the same outputs as the table.
+# A scan sequence is checked on its own, or applied to a configuration given by --config.
+#
+# Examples:
+#   python dry_run.py saved_configs/*.ini
+#   python dry_run.py --config saved_configs/dcfluor_MOT.ini saved_sequences/*.ini
+
+import sys, time, argparse, glob
+import concurrent.futures
+import pb_program
+import pb_emulator
+import pb_analysis
+import board_sync
+
+# format a duration in ns
+def format_duration(t):
+    if t >= 1e9:
+        return f"{t/1e9:.3f} s"
+    elif t >= 1e6:
+        return f"{t/1e6:.3f} ms"
+    elif t >= 1e3:
+        return f"{t/1e3:.3f} us"
+    else:
+        return f"{t:.0f} ns"
+
+# output pattern changes of every cycle, (cycle duration, [(time, pattern), ...]), to compare programs
+def cycle_outputs(cycles):
+    result = []
+    last = None
+    for cycle in cycles:
+        changes = []
+        for t, pattern in cycle["timeline"]:
+            if pattern != last:
+                changes.append((t, pattern))
+            last = pattern
+        result.append((cycle["duration"], changes))
+
+    return result
+
+# run one scan point in the emulator, return (time from start to the first WAIT, cycle time) in ns, and error messages
+def emulate_point(instr_list):
+    errors = []
+    preamble = None
+    cycle = None
+    for j, instr_list_single_board in enumerate(instr_list):
+        try:
+            cycles = pb_emulator.emulate_program(instr_list_single_board).run(num_triggers=1)
+            board_cycles = pb_emulator.emulate_program(pb_program.compile_board_program(instr_list_single_board)).run(num_triggers=1)
+        except pb_emulator.emulatorError as err:
+            errors.append(f"Error (board {j}): {err}")
+            continue
+
+        if cycle_outputs(board_cycles) != cycle_outputs(cycles):
+            errors.append(f"Error (board {j}): The program compiled for this board doesn't give the same outputs.")
+        if j == 0:
+            preamble = cycles[0]["duration"]
+            cycle = cycles[1]["duration"] if len(cycles) > 1 else None
+
+    return preamble, cycle, errors
+
+# check the scanned values, which are not checked by scan_instr_sanity_check between start and end
+def check_values(sequence, errors):
+    for instr_num, seq in sequence.items():
+        for val in seq:
+            if val < pb_emulator.min_duration:
+                errors.append(f"Error (instr no. {instr_num}): scanned duration {val} ns is shorter than 50 ns.")
+                break
+            if round(val) % pb_emulator.time_resolution != 0:
+                errors.append(f"Warning (instr no. {instr_num}): scanned duration {val} ns is not on the 10 ns grid.")
+                break
+
+# run every unique scan point of a program in the emulator
+def emulate_scan(instr_list, scan_sequence_list, result):
+    num_points = len(scan_sequence_list[0]["sequence"]) if scan_sequence_list else 0
+    cycle_times = {}
+    total = 0
+    preamble = 0
+    for i in range(max(num_points, 1)):
+        key = tuple(float(s["sequence"][i]) for s in scan_sequence_list) if num_points else ()
+        if key not in cycle_times:
+            point = pb_program.apply_scan_point(instr_list, scan_sequence_list, i) if num_points else instr_list
+            preamble, cycle, errors = emulate_point(point)
+            if errors:
+                result["errors"] += errors
+                return
+            cycle_times[key] = cycle
+
+        cycle = cycle_times[key]
+        if cycle is None:
+            if num_points:
+                result["errors"].append("Error: The program has no WAIT instruction, it can't be triggered by the scanner.")
+                return
+            total = preamble
+            break
+        total += cycle
+
+    cycles = [c for c in cycle_times.values() if c is not None]
+    result["points"] = num_points
+    result["cycle"] = (min(cycles), max(cycles)) if cycles else None
+    result["duration"] = preamble + total
+
+# check one file, return a dictionary of results
+def check_file(filename, base_config=None):
+    result = {"file": filename, "errors": [], "points": 0, "cycle": None, "duration": None}
+    try:
+        config = pb_program.read_config(filename)
+        if pb_program.is_sequence(config):
+            scan_sequence_list = pb_program.compile_sequence_list(config)
+            check_values(pb_program.compile_sequence(config), result["errors"])
+            if base_config is None:
+                result["points"] = len(scan_sequence_list[0]["sequence"]) if scan_sequence_list else 0
+                return result
+
+            config = pb_program.read_config(base_config)
+            instr_list = pb_program.compile_config(config)
+            for scan_sequence in scan_sequence_list:
+                if scan_sequence["instr no."] >= len(instr_list[0]):
+                    result["errors"].append(f"Error: Instr {scan_sequence['instr no.']} doesn't exist in {base_config}.")
+                    return result
+                if scan_sequence.get("board", 0) >= len(instr_list):
+                    result["errors"].append(f"Error: Board {scan_sequence['board']} doesn't exist in {base_config}.")
+                    return result
+
+        else:
+            instr_list = pb_program.compile_config(config)
+            for j, instr_list_single_board in enumerate(instr_list):
+                error = pb_program.instr_sanity_check(instr_list_single_board)
+                if error:
+                    result["errors"].append(f"{error[1]} (board {j})")
+                result["errors"] += pb_emulator.check_program(instr_list_single_board)
+                result["errors"] += pb_analysis.analyze(instr_list_single_board)["warnings"]
+            sync = board_sync.read_sync(config)
+            if sync is not None:
+                result["errors"] += board_sync.check_sync(instr_list, sync)
+
+            scan_sequence_list = []
+            if config.has_section("Scanner settings"):
+                scan_instr_list = pb_program.compile_scan_instr(config)
+                error = pb_program.scan_instr_sanity_check(scan_instr_list, len(instr_list[0]), len(instr_list))
+                if error:
+                    result["errors"].append(error[1])
+                else:
+                    samp_num = config.getint("Scanner settings", "sample number")
+                    rep_num = config.getint("Scanner settings", "repetition number")
+                    dwell_num = config.getint("Scanner settings", "dwell number", fallback=1)
+                    scan_sequence_list = pb_program.generate_sequence(scan_instr_list, samp_num, rep_num, randomize=False, dwell=dwell_num)
+                    check_values({s["instr no."]: s["sequence"][:samp_num*dwell_num:dwell_num] for s in scan_sequence_list if "target" not in s}, result["errors"])
+                    error = pb_program.scan_points_sanity_check(instr_list, scan_sequence_list)
+                    if error:
+                        result["errors"].append(error)
+
+            if [e for e in result["errors"] if e.startswith("Error")]:
+                return result
+
+        emulate_scan(instr_list, scan_sequence_list, result)
+
+    except Exception as err:
+        result["errors"].append(f"Error: {type(err).__name__}: {err}")
+
+    return result
+
+# print the result of one file
+def print_result(result):
+    failed = any(e.startswith("Error") for e in result["errors"])
+    line = f"{'FAIL' if failed else 'OK  '} {result['file']}: {result['points']} point(s)"
+    if result["cycle"] is not None:
+        line += f", cycle {format_duration(result['cycle'][0])}"
+        if result["cycle"][1] != result["cycle"][0]:
+            line += f" to {format_duration(result['cycle'][1])}"
+    if result["duration"] is not None:
+        line += f", expected duration at least {format_duration(result['duration'])}"
+    print(line)
+    for error in result["errors"]:
+        print(f"    {error}")
+
+    return not failed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check saved configurations and scan sequences without boards.")
+    parser.add_argument("files", nargs="*", help="files to check, default is every file in saved_configs/ and saved_sequences/")
+    parser.add_argument("--config", default=None, help="configuration to apply scan sequences to")
+    parser.add_argument("--jobs", type=int, default=None, help="number of worker processes")
+    args = parser.parse_args()
+
+    files = []
+    for pattern in (args.files or ["saved_configs/*.ini", "saved_sequences/*.ini"]):
+        files += sorted(glob.glob(pattern)) or [pattern]
+
+    t0 = time.time()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        results = list(executor.map(check_file, files, [args.config]*len(files), chunksize=4))
+
+    passed = [print_result(result) for result in results]
+    print(f"{sum(passed)}/{len(files)} file(s) passed in {time.time()-t0:.2f} s.")
+    sys.exit(0 if all(passed) else 1)
@@ -1,10 +1,23 @@
-import sys, os, time, configparser, traceback
+import sys, os, time, configparser, traceback, argparse, threading
+startup_t0 = time.perf_counter()
 import logging
 import numpy as np
 import re
 from spinapi import *
-import nidaqmx
-import nidaqmx.constants as const
+import spinapi
+import config_index
+import config_history
+import timeline
+import pb_program
+import metrics
+import daq_trigger
+import scan_engine
+import pb_daemon
+import adaptive_scan
+import trigger_sources
+import board_queue
+import board_sync
+import daq_discovery
 
 import PyQt5
 import PyQt5.QtGui as QtGui
@@ -15,7 +28,39 @@ num_ch_per_board = 24 # number of TTL output channels of SpinCore PulseBlasterUS
 duration_units = ["ms", "us", "ns"] # don't change this
 op_codes = ["CONTINUE", "STOP", "LOOP", "END_LOOP", "JSR", "RTS", "BRANCH", "LONG_DELAY", "WAIT"] # don't change this
 bkg_color = QtGui.QColor(67, 76, 86, 127)
-# daq_timeout = 10 # seconds
+
+# nidaqmx is only imported when it's needed for the first time, see load_nidaqmx()
+nidaqmx = None
+const = None
+
+# times of startup phases, printed if the program is started with --startup-trace
+startup_trace = []
+print_startup_trace = False
+
+# record the end of a startup phase
+def trace_startup(phase):
+    startup_trace.append((phase, time.perf_counter()))
+    if print_startup_trace:
+        print(f"Startup: {(time.perf_counter()-startup_t0)*1000:8.1f} ms  {phase}")
+
+# import nidaqmx on first use, it takes a while and isn't needed until a scan starts
+def load_nidaqmx():
+    global nidaqmx, const
+    if nidaqmx is None:
+        import nidaqmx as nidaqmx_module
+        import nidaqmx.constants
+        nidaqmx = nidaqmx_module
+        const = nidaqmx_module.constants
+        trace_startup("nidaqmx imported")
+
+# metrics, only recorded if the program is started with --metrics-port, see metrics.py
+load_board_counter = metrics.new_counter("pb_load_board_calls_total", "Number of load_board calls.")
+load_board_hist = metrics.new_histogram("pb_load_board_seconds", "Time to compile instructions and program all boards.")
+daq_callback_counter = metrics.new_counter("daq_callbacks_total", "Number of DAQ change detection callbacks received.")
+sanity_check_fail_counter = metrics.new_counter("sanity_check_failures_total", "Number of failed sanity checks.")
+adaptive_load_hist = metrics.new_histogram("adaptive_scan_load_seconds", "Time to compile and load a point proposed by an adaptive scan.")
+adaptive_overrun_counter = metrics.new_counter("adaptive_scan_load_overruns_total", "Number of adaptive scan loads that took longer than boards wait at the WAIT.")
+min_daq_timeout = 10 # seconds, a scan waits for triggers at least this long before it shows a warning
 
 # convert GUI widget size in unit pt to unit px using monitor dpi
 def pt_to_px(pt):
@@ -111,6 +156,26 @@ class newComboBox(qt.QComboBox):
         else:
             event.ignore()
 
+# a TTL output cell of the main table. Its radio button is built later (see instrTable.build_cells),
+# until then the cell keeps its state, so instructions can be compiled and loaded before the table is complete.
+class ttlCell:
+    def __init__(self):
+        self.checked = False
+        self.rb = None
+
+    def isChecked(self):
+        return self.checked if self.rb is None else self.rb.isChecked()
+
+    def setChecked(self, checked):
+        self.checked = bool(checked)
+        if self.rb is not None:
+            self.rb.setChecked(checked)
+
+    # use a radio button from now on
+    def attach(self, rb):
+        rb.setChecked(self.checked)
+        self.rb = rb
+
 # define the main table in GUI
 class instrTable(qt.QTableWidget):
     def __init__(self, num_boards, parent):
@@ -155,6 +220,12 @@ class instrTable(qt.QTableWidget):
         # a list of dictionaries which will save widgets from each instruction column
         self.instr_col_widget_list = []
 
+        # TTL output cells whose widgets aren't built yet, (row, column, ttlCell), top rows first
+        self.pending_cells = []
+        self.build_timer = PyQt5.QtCore.QTimer(self)
+        self.build_timer.setInterval(0)
+        self.build_timer.timeout.connect(self.build_cells)
+
         # add widgets (mostly qt.LineEdit()) to the note column, and save them to self.note_col_widget_list
         self.add_note_col_widgets()
 
@@ -165,6 +236,8 @@ class instrTable(qt.QTableWidget):
             # add the dictionary that saves all widgets in one instruction column to self.instr_col_widget_list
             self.instr_col_widget_list.append(instr_col)
 
+        self.cells_built = False
+
     # add widgets to the note column, and save them to self.note_col_widget_list
     def add_note_col_widgets(self):
         for i in range(len(self.vertical_headers_init)):
@@ -213,7 +286,7 @@ class instrTable(qt.QTableWidget):
         instr_col_widgets["op_code_cb"] = op_code_cb
 
         # op data SpinBox
-        op_data_sb = newSpinBox(range=(0, 1000))
+        op_data_sb = newSpinBox(range=(0, pb_program.max_op_data))
         op_data_sb.setStyleSheet("QSpinBox{font: 10pt; border: 0px; background:transparent}")
         self.setCellWidget(3, i, op_data_sb)
         instr_col_widgets["op_data_sb"] = op_data_sb
@@ -224,12 +297,30 @@ class instrTable(qt.QTableWidget):
         self.setCellWidget(4, i, note_le)
         instr_col_widgets["note_le"] = note_le
 
-        # a list which will save all radio buttons in one column
+        # a list which will save all TTL output cells in one column, their radio buttons are built later
         rb_list = []
 
         for j in range(self.num_boards*num_ch_per_board):
             row_index = j + len(self.vertical_headers_init)
-            
+
+            cell = ttlCell()
+            self.pending_cells.append((row_index, i, cell))
+            rb_list.append(cell)
+
+            if j%2 == 0:
+                self.setItem(row_index, i, qt.QTableWidgetItem())
+                self.item(row_index, i).setBackground(bkg_color)
+
+        instr_col_widgets["rb_list"] = rb_list
+
+        self.pending_cells.sort(key=lambda pending: pending[:2])
+        self.build_timer.start()
+
+        return instr_col_widgets
+
+    # build radio buttons of a few pending TTL output cells at a time, so the window responds while the table fills in
+    def build_cells(self, num=96):
+        for row_index, i, cell in self.pending_cells[:num]:
             rb = qt.QRadioButton()
             rb.setStyleSheet("QRadioButton{spacing:0 px}QRadioButton::indicator{width: 20px; height: 20px;}")
 
@@ -241,15 +332,14 @@ class instrTable(qt.QTableWidget):
             box.setStyleSheet("border:0px; background:transparent; margin-top:0%; margin-bottom:0%;")
 
             self.setCellWidget(row_index, i, box)
-            rb_list.append(rb)
-
-            if j%2 == 0:
-                self.setItem(row_index, i, qt.QTableWidgetItem())
-                self.item(row_index, i).setBackground(bkg_color)
-
-        instr_col_widgets["rb_list"] = rb_list
+            cell.attach(rb)
 
-        return instr_col_widgets
+        del self.pending_cells[:num]
+        if not self.pending_cells:
+            self.build_timer.stop()
+            if not self.cells_built:
+                self.cells_built = True
+                trace_startup("table cells built")
 
     # add an instruction column to the end of the table
     def add_instr_col(self):
@@ -273,6 +363,7 @@ class instrTable(qt.QTableWidget):
         self.horizontal_headers = self.horizontal_headers[0:-1]
         # print(self.horizontal_headers)
         self.instr_col_widget_list = self.instr_col_widget_list[0:-1]
+        self.pending_cells = [pending for pending in self.pending_cells if pending[1] < self.num_cols]
 
         # disable del_instr_col function if there's only one instruction column left in the table
         if self.num_cols - len(self.horizontal_headers_init) <= 1:
@@ -330,52 +421,16 @@ class instrTable(qt.QTableWidget):
 
         return instr_list
 
-    # instruction column sanity check
-    def instr_sanity_check(self, op_code_check, pulse_width_check):
-        # I haven't used all the functions of Spincore PulseblasterUSB. Sanity check here is limited to the ones I used.
-
-        # check op code
-        if op_code_check:
-            # the first instruction can't have op code WAIT
-            instr_widgets = self.instr_col_widget_list[0]
-            if instr_widgets["op_code_cb"].currentIndex() == 8: # 8 is WAIT
-                qt.QMessageBox.warning(self, 'Setting Error',
-                                    "Error: The first instruction can't have Op code WAIT.",
-                                    qt.QMessageBox.Ok, qt.QMessageBox.Ok)
-                return False
-
-            # the last instruction can't have op code CONTINUE, LOOP, END_LOOP, LONG_DELAY, WAIT
-            instr_widgets = self.instr_col_widget_list[-1]
-            if instr_widgets["op_code_cb"].currentIndex() in [0, 2, 3, 7, 8]:
-                qt.QMessageBox.warning(self, 'Setting Error',
-                                    "Error: The last instruction can't have Op code CONTINUE, LOOP, END_LOOP, LONG_DELAY, or WAIT.",
-                                    qt.QMessageBox.Ok, qt.QMessageBox.Ok)
-                return False
-
-        # check pulse width
-        if pulse_width_check:
-            # the shortest pulse width is 50 ns, and time resolution is 10 ns
-            num_instr = len(self.horizontal_headers) - len(self.horizontal_headers_init)
-            for i in range(num_instr):
-                instr_widgets = self.instr_col_widget_list[i]
-                
-                # time resolution is 10 ns
-                # also partially implemented in duration DoubleSpinBox settings for other units
-                if instr_widgets["du_unit_cb"].currentText() == "ns":
-                    du = int(instr_widgets["du_dsb"].value())
-                    if du%10 != 0:
-                        qt.QMessageBox.warning(self, 'Setting Error',
-                                    f"Error (Instr {i}): The Spincore PulseblasterUSB time resolution is 10 ns.",
-                                    qt.QMessageBox.Ok, qt.QMessageBox.Ok)
-                        return False
-
-                # the shortest acceptable pulse width is 50 ns
-                duration = instr_widgets["du_dsb"].value() * (1000**(2-instr_widgets["du_unit_cb"].currentIndex()))
-                if duration < 50:
-                    qt.QMessageBox.warning(self, 'Setting Error',
-                                    f"Error (Instr {i}): The shortest acceptable pulse width is 50 ns.",
-                                    qt.QMessageBox.Ok, qt.QMessageBox.Ok)
-                    return False
+    # instruction column sanity check, see pb_program.instr_sanity_check. instr_list: instructions to check instead of the table's
+    def instr_sanity_check(self, op_code_check, pulse_width_check, instr_list=None):
+        if instr_list is None:
+            instr_list = self.compile_instr()
+        error = pb_program.instr_sanity_check(instr_list[0], op_code_check, pulse_width_check) if instr_list else None
+        if error:
+            check, message = error
+            sanity_check_fail_counter.inc(check=check)
+            qt.QMessageBox.warning(self, 'Setting Error', message, qt.QMessageBox.Ok, qt.QMessageBox.Ok)
+            return False
 
         return True
 
@@ -459,13 +514,77 @@ class instrTable(qt.QTableWidget):
                     rb = instr_dict["rb_list"][j*num_ch_per_board+k]
                     rb.setChecked(bool(int(ttl[k])))
 
+    # the instructions the table would have after apply_config_diff(config), None if the number of instructions is different
+    def config_diff_instr(self, config):
+        num_instr = self.num_cols - len(self.horizontal_headers_init)
+        if int(config["General settings"]["number of instructions"]) != num_instr:
+            return None
+
+        num_boards = min(int(config["General settings"]["number of boards"]), self.num_boards)
+        instr_list = self.compile_instr()
+        instr_list[:num_boards] = pb_program.compile_config(config, num_boards)
+
+        return instr_list
+
+    # apply only the differences between a configuration and the table, return the boards whose instructions changed,
+    # or None if the number of instructions is different (then use load_config)
+    def apply_config_diff(self, config):
+        num_instr = self.num_cols - len(self.horizontal_headers_init)
+        if int(config["General settings"]["number of instructions"]) != num_instr:
+            return None
+
+        num_boards = min(int(config["General settings"]["number of boards"]), self.num_boards)
+        old = self.compile_instr()
+        new = pb_program.compile_config(config, num_boards)
+
+        # note column
+        notes = self.compile_note_col()
+        for i, connections in enumerate(pb_program.compile_connections(config)[:num_boards]):
+            for j, name in enumerate(connections):
+                widget = self.note_col_widget_list[i*num_ch_per_board+j]
+                if notes[i*num_ch_per_board+j] != name:
+                    widget.setText(name)
+                    widget.setCursorPosition(0)
+
+        # instruction columns, durations are compared in ns
+        changed_boards = set()
+        for i in range(num_instr):
+            instr_dict = self.instr_col_widget_list[i]
+            old_instr = old[0][i]
+            new_instr = new[0][i]
+            if old_instr[0] != new_instr[0]:
+                instr_dict["note_le"].setText(new_instr[0])
+                instr_dict["note_le"].setCursorPosition(0)
+            if (old_instr[4] != new_instr[4]) or (old_instr[6] != new_instr[6]):
+                instr_dict["du_unit_cb"].setCurrentIndex(new_instr[6])
+                instr_dict["du_dsb"].setValue(new_instr[5])
+                changed_boards.update(range(self.num_boards))
+            if old_instr[2] != new_instr[2]:
+                instr_dict["op_code_cb"].setCurrentIndex(new_instr[2])
+                changed_boards.update(range(self.num_boards))
+            if old_instr[3] != new_instr[3]:
+                instr_dict["op_data_sb"].setValue(new_instr[3])
+                changed_boards.update(range(self.num_boards))
+
+            for j in range(num_boards):
+                if old[j][i][1] == new[j][i][1]:
+                    continue
+                for k in range(num_ch_per_board):
+                    checked = bool((new[j][i][1] >> k) & 1)
+                    rb = instr_dict["rb_list"][j*num_ch_per_board+k]
+                    if rb.isChecked() != checked:
+                        rb.setChecked(checked)
+                changed_boards.add(j)
+
+        return sorted(changed_boards)
+
 # define the table in scanner
 class scannerTable(qt.QTableWidget):
     def __init__(self, parent):
         super().__init__()
         self.parent = parent
 
-        vertical_headers_init = ["Instr #", "Start Duration", "Start Unit", "End Duration", "End Unit"]
+        vertical_headers_init = ["Instr #", "Target", "Start Value", "Start Unit", "End Value", "End Unit", "TTL Board", "TTL Ch"]
 
         # number of rows
         self.num_rows = len(vertical_headers_init)
@@ -501,11 +620,19 @@ class scannerTable(qt.QTableWidget):
         self.setCellWidget(0, i, instr_num_sb)
         col_widgets["instr_num_sb"] = instr_num_sb
 
+        # scan target ComboBox, what's scanned: duration, op data (e.g. a LOOP count) or the state of a TTL channel
+        target_cb = newComboBox()
+        target_cb.setStyleSheet("QComboBox{font: 9pt; border: 0px; background:transparent}")
+        target_cb.addItems(pb_program.scan_targets)
+        target_cb.setToolTip("Op Data and TTL scan integer values, TTL values are channel states (0 or 1).")
+        self.setCellWidget(1, i, target_cb)
+        col_widgets["target_cb"] = target_cb
+
         # start duration DoubleSpinBox
         start_du_dsb = newDoubleSpinBox(range=(0.00005, 1000000), decimal=5)
         start_du_dsb.setValue(10)
         start_du_dsb.setStyleSheet("QDoubleSpinBox{font: 9pt; border: 0px; background:transparent}")
-        self.setCellWidget(1, i, start_du_dsb)
+        self.setCellWidget(2, i, start_du_dsb)
         col_widgets["start_du_dsb"] = start_du_dsb
 
         # start duration unit ComboBox
@@ -513,14 +640,14 @@ class scannerTable(qt.QTableWidget):
         start_du_unit_cb.setStyleSheet("QComboBox{font: 9pt; border: 0px; background:transparent}")
         start_du_unit_cb.addItems(duration_units)
         start_du_unit_cb.currentTextChanged[str].connect(lambda val, num=i, type="start": self.update_du_dsb(num, val, type)) # change the duration DoubleSpinBox properties when unit changes
-        self.setCellWidget(2, i, start_du_unit_cb)
+        self.setCellWidget(3, i, start_du_unit_cb)
         col_widgets["start_du_unit_cb"] = start_du_unit_cb
 
         # end suration DoubleSpinBox
         end_du_dsb = newDoubleSpinBox(range=(0.00005, 1000000), decimal=5)
         end_du_dsb.setValue(10)
         end_du_dsb.setStyleSheet("QDoubleSpinBox{font: 9pt; border: 0px; background:transparent}")
-        self.setCellWidget(3, i, end_du_dsb)
+        self.setCellWidget(4, i, end_du_dsb)
         col_widgets["end_du_dsb"] = end_du_dsb
 
         # end duration unit ComboBox
@@ -528,9 +655,24 @@ class scannerTable(qt.QTableWidget):
         end_du_unit_cb.setStyleSheet("QComboBox{font: 9pt; border: 0px; background:transparent}")
         end_du_unit_cb.addItems(duration_units)
         end_du_unit_cb.currentTextChanged[str].connect(lambda val, num=i, type="end": self.update_du_dsb(num, val, type)) # change the duration DoubleSpinBox properties when unit changes
-        self.setCellWidget(4, i, end_du_unit_cb)
+        self.setCellWidget(5, i, end_du_unit_cb)
         col_widgets["end_du_unit_cb"] = end_du_unit_cb
 
+        # board and channel of the TTL output to scan
+        ttl_board_sb = newSpinBox(range=(0, 100))
+        ttl_board_sb.setStyleSheet("QSpinBox{font: 9pt; border: 0px; background:transparent}")
+        self.setCellWidget(6, i, ttl_board_sb)
+        col_widgets["ttl_board_sb"] = ttl_board_sb
+
+        ttl_ch_sb = newSpinBox(range=(0, num_ch_per_board-1))
+        ttl_ch_sb.setStyleSheet("QSpinBox{font: 9pt; border: 0px; background:transparent}")
+        self.setCellWidget(7, i, ttl_ch_sb)
+        col_widgets["ttl_ch_sb"] = ttl_ch_sb
+
+        target_cb.currentTextChanged[str].connect(lambda val, num=i: self.update_target(num, val)) # change widget properties when the target changes
+        ttl_board_sb.setEnabled(False)
+        ttl_ch_sb.setEnabled(False)
+
         return col_widgets
 
     # add a column to the end of the table
@@ -559,6 +701,25 @@ class scannerTable(qt.QTableWidget):
         if self.num_cols <= 1:
             self.parent.del_scan_instr_pb.setEnabled(False)
 
+    # update widget properties when the scan target changes, op data and TTL states are integers without unit
+    def update_target(self, num, val):
+        col_widgets = self.col_widget_list[num]
+        for type in ["start", "end"]:
+            widget = col_widgets[f"{type}_du_dsb"]
+            unit_cb = col_widgets[f"{type}_du_unit_cb"]
+            unit_cb.setEnabled(val == "Duration")
+            if val == "Duration":
+                widget.setMaximum(1000000)
+                self.update_du_dsb(num, unit_cb.currentText(), type)
+            else:
+                widget.setDecimals(0)
+                widget.setMinimum(0)
+                widget.setMaximum(pb_program.max_op_data if val == "Op Data" else 1)
+                widget.setSingleStep(1)
+
+        col_widgets["ttl_board_sb"].setEnabled(val == "TTL")
+        col_widgets["ttl_ch_sb"].setEnabled(val == "TTL")
+
     # update duration DoubleSpinBox properties when duration unit changes 
     def update_du_dsb(self, num, val, type):
         if type == "start":
@@ -591,10 +752,13 @@ class scannerTable(qt.QTableWidget):
             scan_instr = {}
             col_widgets = self.col_widget_list[i]
             scan_instr["instr no."] = str(col_widgets["instr_num_sb"].value())
+            scan_instr["target"] = col_widgets["target_cb"].currentText()
             scan_instr["start duration time"] = str(col_widgets["start_du_dsb"].value())
             scan_instr["start duration unit"] = col_widgets["start_du_unit_cb"].currentText()
             scan_instr["end duration time"] = str(col_widgets["end_du_dsb"].value())
             scan_instr["end duration unit"] = col_widgets["end_du_unit_cb"].currentText()
+            scan_instr["ttl board"] = str(col_widgets["ttl_board_sb"].value())
+            scan_instr["ttl channel"] = str(col_widgets["ttl_ch_sb"].value())
 
             scan_instr_list.append(scan_instr)
 
@@ -615,91 +779,44 @@ class scannerTable(qt.QTableWidget):
         for i in range(new_num_cols):
             col_widgets = self.col_widget_list[i]
             col_widgets["instr_num_sb"].setValue(config.getint(f"Scan Instr {i}", "instr no."))
+            # the target is set first, it changes the range of values
+            col_widgets["target_cb"].setCurrentText(config.get(f"Scan Instr {i}", "target", fallback="Duration"))
             col_widgets["start_du_dsb"].setValue(config.getfloat(f"Scan Instr {i}", "start duration time"))
             col_widgets["start_du_unit_cb"].setCurrentText(config[f"Scan Instr {i}"]["start duration unit"])
             col_widgets["end_du_dsb"].setValue(config.getfloat(f"Scan Instr {i}", "end duration time"))
             col_widgets["end_du_unit_cb"].setCurrentText(config[f"Scan Instr {i}"]["end duration unit"])
+            col_widgets["ttl_board_sb"].setValue(config.getint(f"Scan Instr {i}", "ttl board", fallback=0))
+            col_widgets["ttl_ch_sb"].setValue(config.getint(f"Scan Instr {i}", "ttl channel", fallback=0))
 
-    # scanner table sanity check
+    # scanner table sanity check, see pb_program.scan_instr_sanity_check
     def scan_instr_sanity_check(self):
-        for i in range(self.num_cols):
-            col_widgets = self.col_widget_list[i]
-            instr_num = col_widgets["instr_num_sb"].value()
-            if instr_num > (self.parent.parent.table.num_cols - len(self.parent.parent.table.horizontal_headers_init)-1):
-                qt.QMessageBox.warning(self, 'Scanner Setting Error',
-                                f"Error (Scan Instr {i}): Instr # doesn't exist.",
-                                qt.QMessageBox.Ok, qt.QMessageBox.Ok)
-                return False
-
-            # the shortest pulse width is 50 ns
-            start_duration = col_widgets["start_du_dsb"].value() * (1000**(2-col_widgets["start_du_unit_cb"].currentIndex()))
-            if start_duration < 50:
-                qt.QMessageBox.warning(self, 'Scanner Setting Error',
-                                f"Error (Scan Instr {i}): The shortest acceptable pulse width is 50 ns.",
-                                qt.QMessageBox.Ok, qt.QMessageBox.Ok)
-                return False
-
-            # time resolution is 10 ns
-            # also partially implemented in duration DoubleSpinBox settings for other units
-            if col_widgets["start_du_unit_cb"].currentText() == "ns":
-                du = int(col_widgets["start_du_dsb"].value())
-                if du%10 != 0:
-                    qt.QMessageBox.warning(self, 'Scanner Setting Error',
-                                f"Error (Scan Instr {i}): The Spincore PulseblasterUSB time resolution is 10 ns.",
-                                qt.QMessageBox.Ok, qt.QMessageBox.Ok)
-                    return False
-
-            # the shortest pulse width is 50 ns
-            end_duration = col_widgets["end_du_dsb"].value() * (1000**(2-col_widgets["end_du_unit_cb"].currentIndex()))
-            if end_duration < 50:
-                qt.QMessageBox.warning(self, 'Scanner Setting Error',
-                                f"Error (Scan Instr {i}): The shortest acceptable pulse width is 50 ns.",
-                                qt.QMessageBox.Ok, qt.QMessageBox.Ok)
-                return False
-
-            # time resolution is 10 ns
-            # also partially implemented in duration DoubleSpinBox settings for other units
-            if col_widgets["end_du_unit_cb"].currentText() == "ns":
-                du = int(col_widgets["end_du_dsb"].value())
-                if du%10 != 0:
-                    qt.QMessageBox.warning(self, 'Scanner Setting Error',
-                                f"Error (Scan Instr {i}): The Spincore PulseblasterUSB time resolution is 10 ns.",
-                                qt.QMessageBox.Ok, qt.QMessageBox.Ok)
-                    return False
+        num_instr = self.parent.parent.table.num_cols - len(self.parent.parent.table.horizontal_headers_init)
+        error = pb_program.scan_instr_sanity_check(self.compile_scan_instr(), num_instr, self.parent.parent.num_boards)
+        if error:
+            check, message = error
+            sanity_check_fail_counter.inc(check=check)
+            qt.QMessageBox.warning(self, 'Scanner Setting Error', message, qt.QMessageBox.Ok, qt.QMessageBox.Ok)
+            return False
 
         return True
 
-    # generate scan sequence
-    def generate_sequence(self, randomize):
-        scan_sequence_list = []
-        samp_num = self.parent.samp_num_sb.value()
-        rep_num = self.parent.rep_num_sb.value()
-        for i in range(self.num_cols):
-            col_widgets = self.col_widget_list[i]
-            scan_sequence = {}
-            scan_sequence["instr no."] = col_widgets["instr_num_sb"].value()
-            scan_start = col_widgets["start_du_dsb"].value() * (1000**(2-col_widgets["start_du_unit_cb"].currentIndex())) # start duration time to scan 
-            scan_end = col_widgets["end_du_dsb"].value() * (1000**(2-col_widgets["end_du_unit_cb"].currentIndex())) # end suration time to scan
-            seq = np.linspace(scan_start, scan_end, samp_num) # linearly sample from start to end 
-            seq = np.tile(seq, rep_num) # use np.tile to get [1, 2, 3, 1, 2, 3], use np.repeat to get [1, 1, 2, 2, 3, 3]
-            scan_sequence["sequence"] = seq
-
-            scan_sequence_list.append(scan_sequence)
-
-        # if the sequence needs to be randomized
-        if randomize:
-            total_num = samp_num*rep_num
-            random_index = np.arange(total_num)
-            np.random.shuffle(random_index)
-            # print(random_index)
-
-            for i in range(self.num_cols):
-                scan_sequence_list[i]["sequence"] = scan_sequence_list[i]["sequence"][random_index]
-
-        return scan_sequence_list        
+    # generate scan sequence, see pb_program.generate_sequence
+    def generate_sequence(self, randomize, seed=None, order="Interleaved", dwell=1):
+        return pb_program.generate_sequence(self.compile_scan_instr(), self.parent.samp_num_sb.value(), self.parent.rep_num_sb.value(), randomize, seed, order, dwell)
 
 # a GroupBox to place scanner widgets
 class scannerBox(newBox):
+    # emitted from the DAQ callback thread, to update widgets in the main thread
+    job_started = PyQt5.QtCore.pyqtSignal(object)
+    restart_job = PyQt5.QtCore.pyqtSignal()
+    param_loaded = PyQt5.QtCore.pyqtSignal()
+    scan_finished = PyQt5.QtCore.pyqtSignal()
+    # emitted from the adaptive scan feedback thread
+    adaptive_point = PyQt5.QtCore.pyqtSignal(float)
+    adaptive_done = PyQt5.QtCore.pyqtSignal()
+    # emitted from the DAQ discovery thread
+    daq_channels_changed = PyQt5.QtCore.pyqtSignal()
+
     def __init__(self, parent):
         super().__init__(layout_type="grid")
         self.parent = parent
@@ -710,17 +827,53 @@ class scannerBox(newBox):
         self.frame.setColumnStretch(2, 5)
         self.frame.setColumnStretch(3, 5)
         self.frame.setColumnStretch(4, 5)
-        self.setMaximumHeight(290)
+        self.setMaximumHeight(460)
 
         self.random_seq = True # to randomize scan sequence or not
         self.scanning = False # is the program currently scanning
+        self.task = None # DAQ task that triggers loading in every cycle
+        self.checkpoint = pb_program.scanCheckpoint() # to resume an interrupted scan
+        # every scan session over a group of boards has its own checkpoint
+        session = self.parent.daemon.session if self.parent.daemon is not None else None
+        if session:
+            self.checkpoint = pb_program.scanCheckpoint(f"scan_checkpoint_{re.sub(r'[^0-9A-Za-z]+', '_', session)}.ini")
+        self.edge_counter = None # optional DAQ counter of WAITING signal edges
+        self.engine = scan_engine.scanEngine(lambda instr_list, skip_unchanged=False: self.parent.write_boards(instr_list, priority=board_queue.SCAN, skip_unchanged=skip_unchanged)) # loads scan elements into boards
+        self.job_queue = [] # precompiled jobs to run after the current scan
+        self.switching = False # whether the finished scan waits for the main thread to restart boards for the next job
+        self.interleave_filenames = [] # configurations of programs B, C, ... to interleave with the table (program A)
+        self.adaptive = None # strategy of the running adaptive scan, see adaptive_scan.py
+        self.adaptive_lock = PyQt5.QtCore.QMutex()
+        self.feedback_server = None
+        self.remaining_times = None # analyzed time (ns) from every scan element to the end, see pb_analysis.py
+
+        # shows a warning when no cycle finishes within the DAQ timeout
+        self.daq_watchdog = PyQt5.QtCore.QTimer(self)
+        self.daq_watchdog.setInterval(1000) # ms
+        self.daq_watchdog.timeout.connect(self.check_daq_timeout)
+
+        # in daemon mode, scan progress is polled from the hardware daemon
+        self.daemon_timer = PyQt5.QtCore.QTimer(self)
+        self.daemon_timer.setInterval(100) # ms
+        self.daemon_timer.timeout.connect(self.poll_daemon)
+
+        self.job_started.connect(self.finish_switch)
+        self.restart_job.connect(self.restart_with_next_job)
+        self.param_loaded.connect(self.show_loaded_param)
+        self.scan_finished.connect(lambda: self.stop_scan() if self.scanning else None)
+        self.loaded_index = None # the last element loaded by load_param, to show in widgets
+        self.show_pending = False
+        self.adaptive_point.connect(self.show_adaptive_point)
+        self.adaptive_done.connect(self.stop_scan)
+        self.daq_channels_changed.connect(self.update_daq_completers)
+        self.daq_discovery = None # cached DAQ channels, see daq_discovery.py
 
         # place all widgets except the table
         self.place_controls()
 
         # place the table
         self.table = scannerTable(self)
-        self.frame.addWidget(self.table, 4, 1, 1, 4)
+        self.frame.addWidget(self.table, 9, 1, 1, 4)
 
     # place widgets in the scanner GroupBox
     def place_controls(self):
@@ -736,7 +889,7 @@ class scannerBox(newBox):
 
         la = qt.QLabel(operating_procedure)
         la.setStyleSheet("QLabel{background: rgba(67, 76, 86, 127); font:9 pt}")
-        self.frame.addWidget(la, 1, 0, 4, 1)
+        self.frame.addWidget(la, 1, 0, 9, 1)
 
         # a pushbutton to add scan instruction
         self.add_scan_instr_pb = qt.QPushButton("Add Scan Instr")
@@ -779,12 +932,23 @@ class scannerBox(newBox):
         self.seq_name_le = qt.QLineEdit("Scan_sequence")
         self.frame.addWidget(self.seq_name_le, 2, 2)
 
-        self.frame.addWidget(qt.QLabel("DAQ DI Channel:"), 2, 3, alignment=PyQt5.QtCore.Qt.AlignRight)
+        # the label shows what the address of the trigger source means
+        self.daq_ch_la = qt.QLabel("DAQ DI Channel:")
+        self.frame.addWidget(self.daq_ch_la, 2, 3, alignment=PyQt5.QtCore.Qt.AlignRight)
 
-        # a LineEdit to indicate DAQ DI cahnnel
+        # a LineEdit to indicate DAQ DI cahnnel, or the address of another trigger source
         self.daq_ch_le = qt.QLineEdit("Dev_/port_/line_")
         self.frame.addWidget(self.daq_ch_le, 2, 4)
 
+        # DAQ channel names are completed from the cached channels, the button in the LineEdit enumerates devices again
+        self.daq_ch_completer = qt.QCompleter([], self)
+        self.daq_ch_completer.setCaseSensitivity(PyQt5.QtCore.Qt.CaseInsensitive)
+        self.daq_ch_completer.setFilterMode(PyQt5.QtCore.Qt.MatchContains)
+        self.daq_ch_le.setCompleter(self.daq_ch_completer)
+        refresh_action = self.daq_ch_le.addAction(self.style().standardIcon(qt.QStyle.SP_BrowserReload), qt.QLineEdit.TrailingPosition)
+        refresh_action.setToolTip("Find DAQ devices again")
+        refresh_action.triggered.connect(lambda: self.refresh_daq_channels())
+
         # a checkbox to indicate whether to append date/time to the filename when a sequence is saved
         self.auto_append_chb = qt.QCheckBox("Auto Append Date/Time")
         self.auto_append_chb.setChecked(True)
@@ -796,16 +960,155 @@ class scannerBox(newBox):
         self.random_chb.toggled[bool].connect(lambda val: self.update_random_chb(val))
         self.frame.addWidget(self.random_chb, 3, 4)
 
+        # a ComboBox to choose the order of scan points, see pb_program.sequence_order
+        self.order_cb = newComboBox()
+        self.order_cb.addItems(pb_program.scan_orders)
+        self.order_cb.setToolTip("Order of scan points:\n"
+                                    "Interleaved: every repetition scans all points, randomized over all elements.\n"
+                                    "Blocked: every point is repeated in a row, boards are reprogrammed only between points.\n"
+                                    "Fewest Changes: every repetition scans all points, points that share scanned values of a board are next to each other.")
+        self.frame.addWidget(self.order_cb, 3, 3)
+
+        # a pushbutton to resume an interrupted scan from its checkpoint
+        self.resume_scan_pb = qt.QPushButton("Resume Scan")
+        self.resume_scan_pb.clicked[bool].connect(lambda val:self.resume_scan())
+        self.resume_scan_pb.setToolTip("Continue the last scan from the point after the last loaded one.")
+        self.frame.addWidget(self.resume_scan_pb, 3, 1)
+
+        self.frame.addWidget(qt.QLabel("DAQ Edge Counter:"), 4, 3, alignment=PyQt5.QtCore.Qt.AlignRight)
+
+        # a LineEdit to indicate an optional DAQ counter that counts WAITING signal edges, to detect missed or doubled cycles
+        self.daq_ctr_le = qt.QLineEdit("")
+        self.daq_ctr_le.setPlaceholderText("Dev_/ctr_ (optional)")
+        self.daq_ctr_le.setToolTip("A counter that counts rising edges of the WAITING signal (on its default input terminal).\n"
+                                    "If given, the scan index is resynchronized to the hardware cycle count in every cycle.")
+        self.frame.addWidget(self.daq_ctr_le, 4, 4)
+
+        self.daq_ctr_completer = qt.QCompleter([], self)
+        self.daq_ctr_completer.setCaseSensitivity(PyQt5.QtCore.Qt.CaseInsensitive)
+        self.daq_ctr_completer.setFilterMode(PyQt5.QtCore.Qt.MatchContains)
+        self.daq_ctr_le.setCompleter(self.daq_ctr_completer)
+
+        # a pushbutton to queue configurations, they are scanned one after another when the current scan finishes
+        self.queue_pb = qt.QPushButton("Queue Configs (0)")
+        self.queue_pb.clicked[bool].connect(lambda val:self.queue_configs())
+        self.frame.addWidget(self.queue_pb, 4, 1)
+
+        # a pushbutton to clear the queue
+        self.clear_queue_pb = qt.QPushButton("Clear Queue")
+        self.clear_queue_pb.clicked[bool].connect(lambda val:self.clear_queue())
+        self.frame.addWidget(self.clear_queue_pb, 4, 2)
+
+        # a pushbutton to choose configurations (programs B, C, ...) to interleave with the table (program A) on successive triggers
+        self.interleave_pb = qt.QPushButton("Interleave Configs (0)")
+        self.interleave_pb.clicked[bool].connect(lambda val:self.choose_interleave_configs())
+        self.frame.addWidget(self.interleave_pb, 5, 1)
+
+        # a pushbutton to stop interleaving
+        self.clear_interleave_pb = qt.QPushButton("Clear Interleave")
+        self.clear_interleave_pb.clicked[bool].connect(lambda val:self.set_interleave_configs([]))
+        self.frame.addWidget(self.clear_interleave_pb, 5, 2)
+
+        self.frame.addWidget(qt.QLabel("Interleave Pattern:"), 5, 3, alignment=PyQt5.QtCore.Qt.AlignRight)
+
+        # a LineEdit to indicate the order of programs on successive triggers, e.g. ABAB or ABBA
+        self.interleave_le = qt.QLineEdit("AB")
+        self.interleave_le.setToolTip("Programs run on successive triggers, for every scan element.\n"
+                                        "A is the table, B, C, ... are the interleaved configs.")
+        self.frame.addWidget(self.interleave_le, 5, 4)
+
+        self.frame.addWidget(qt.QLabel("Scan Mode:"), 6, 1, alignment=PyQt5.QtCore.Qt.AlignRight)
+
+        # a ComboBox to choose between a fixed grid and adaptive scans of the first scan instruction
+        self.scan_mode_cb = newComboBox()
+        self.scan_mode_cb.addItems(["Grid"] + adaptive_scan.strategies)
+        self.scan_mode_cb.setToolTip("Adaptive modes propose the next duration of Scan Instr 0 from measurements sent to the feedback port.\n"
+                                        "Sample number is the maximum number of points, every point is measured repetition number times.")
+        self.frame.addWidget(self.scan_mode_cb, 6, 2)
+
+        self.frame.addWidget(qt.QLabel("Feedback Port:"), 6, 3, alignment=PyQt5.QtCore.Qt.AlignRight)
+
+        # a SpinBox to indicate the local TCP port that receives measurement results in adaptive scans
+        self.feedback_port_sb = newSpinBox(range=(1024, 65535))
+        self.feedback_port_sb.setValue(adaptive_scan.default_port)
+        self.frame.addWidget(self.feedback_port_sb, 6, 4)
+
+        self.frame.addWidget(qt.QLabel("Optimize For:"), 7, 1, alignment=PyQt5.QtCore.Qt.AlignRight)
+
+        # a ComboBox to indicate whether adaptive scans look for the maximum or the minimum of measurements
+        self.optimize_cb = newComboBox()
+        self.optimize_cb.addItems(["Maximum", "Minimum"])
+        self.frame.addWidget(self.optimize_cb, 7, 2)
+
+        self.frame.addWidget(qt.QLabel("Trigger Source:"), 7, 3, alignment=PyQt5.QtCore.Qt.AlignRight)
+
+        # a ComboBox to choose what triggers loading in every cycle, see trigger_sources.py
+        self.trigger_cb = newComboBox()
+        self.trigger_cb.addItems(trigger_sources.sources)
+        self.trigger_cb.setToolTip("Simulated: triggers at a given rate (Hz) and relative jitter, without DAQ, e.g. to test the scan loop.")
+        self.trigger_cb.currentTextChanged[str].connect(lambda val: self.update_trigger_source(val))
+        self.frame.addWidget(self.trigger_cb, 7, 4)
+
+        self.frame.addWidget(qt.QLabel("Dwell Number:"), 8, 1, alignment=PyQt5.QtCore.Qt.AlignRight)
+
+        # dwell number SpinBox, every sequence element is held for this number of consecutive cycles, see pb_program.generate_sequence
+        self.dwell_num_sb = newSpinBox(range=(1, 100000))
+        self.dwell_num_sb.setValue(1)
+        self.dwell_num_sb.setToolTip("Number of consecutive cycles every sequence element is held for.\n"
+                                        "Boards are only reprogrammed when the element changes, in every order.")
+        self.frame.addWidget(self.dwell_num_sb, 8, 2)
+
     # change the value of variable "self.random_seq"
     def update_random_chb(self, val):
         self.random_seq = val
 
+    # show what the address means for a trigger source
+    def update_trigger_source(self, val):
+        labels = {"DAQ Change Detection": "DAQ DI Channel:", "DAQ Counter": "DAQ Counter, Term:", "Socket": "Trigger Port:", "Simulated": "Rate (Hz), Jitter:"}
+        self.daq_ch_la.setText(labels[val])
+        self.daq_ch_le.setPlaceholderText(trigger_sources.placeholders[val])
+        self.update_daq_completers()
+
+    # find DAQ channels in the background, for completion and for daq_sanity_check, see daq_discovery.py
+    def start_daq_discovery(self):
+        self.daq_discovery = daq_discovery.get_service(nidaqmx)
+        self.daq_discovery.listeners.append(self.daq_channels_changed.emit)
+        self.update_daq_completers()
+
+    def refresh_daq_channels(self):
+        if self.daq_discovery is None:
+            self.start_daq_discovery()
+        else:
+            self.daq_discovery.refresh()
+
+    # complete DAQ DI lines or counters, depending on the trigger source
+    def update_daq_completers(self):
+        if self.daq_discovery is None:
+            return
+
+        kind = {"DAQ Change Detection": "di lines", "DAQ Counter": "counters"}.get(self.trigger_cb.currentText())
+        self.daq_ch_completer.model().setStringList(self.daq_discovery.names(kind) if kind else [])
+        self.daq_ctr_completer.model().setStringList(self.daq_discovery.names("counters"))
+        error = self.daq_discovery.error
+        tooltip = f"DAQ discovery: {error}" if error else f"{len(self.daq_discovery.channels['di lines'])} DAQ DI line(s) found."
+        self.daq_ch_le.setToolTip(tooltip)
+
     # laod parameters from a local configuration file
     def load_config(self, config):
         self.samp_num_sb.setValue(config.getint("Scanner settings", "sample number"))
         self.rep_num_sb.setValue(config.getint("Scanner settings", "repetition number"))
         self.random_chb.setChecked(config.getboolean("Scanner settings", "randomize sequence"))
+        self.order_cb.setCurrentText(config.get("Scanner settings", "scan order", fallback="Interleaved"))
+        self.dwell_num_sb.setValue(config.getint("Scanner settings", "dwell number", fallback=1))
+        self.trigger_cb.setCurrentText(config.get("Scanner settings", "trigger source", fallback="DAQ Change Detection"))
         self.daq_ch_le.setText(config.get("Scanner settings", "DAQ DI channel"))
+        self.daq_ctr_le.setText(config.get("Scanner settings", "DAQ edge counter", fallback=""))
+        self.interleave_le.setText(config.get("Scanner settings", "interleave pattern", fallback="AB"))
+        filenames = config.get("Scanner settings", "interleaved configs", fallback="")
+        self.set_interleave_configs([f.strip() for f in filenames.split(",") if f.strip()])
+        self.scan_mode_cb.setCurrentText(config.get("Scanner settings", "scan mode", fallback="Grid"))
+        self.feedback_port_sb.setValue(config.getint("Scanner settings", "feedback port", fallback=adaptive_scan.default_port))
+        self.optimize_cb.setCurrentText(config.get("Scanner settings", "optimize for", fallback="Maximum"))
 
         self.table.load_config(config)
 
@@ -818,69 +1121,738 @@ class scannerBox(newBox):
         if not self.parent.table.instr_sanity_check(op_code_check=True, pulse_width_check=True):
             return
 
+        if not self.parent.sync_sanity_check(self.parent.table.compile_instr()):
+            return
+
         if not self.daq_sanity_check():
             return
 
+        # points are proposed from measurement results, and loaded at the next trigger
+        if self.scan_mode_cb.currentText() != "Grid":
+            self.start_adaptive_scan()
+            return
+
+        # compile interleaved programs
+        instr_list = self.parent.table.compile_instr()
+        programs, error = self.compile_interleave_programs(instr_list, self.interleave_filenames, self.interleave_le.text().strip())
+        if error:
+            sanity_check_fail_counter.inc(check="interleave")
+            qt.QMessageBox.warning(self, 'Interleave Error', error, qt.QMessageBox.Ok, qt.QMessageBox.Ok)
+            return
+
+        # generate scan sequence, the seed is saved so the same order can be generated again
+        seed = int(np.random.SeedSequence().generate_state(1)[0])
+        scan_sequence_list = self.table.generate_sequence(self.random_seq, seed, self.order_cb.currentText(), self.dwell_num_sb.value())
+
+        # scanned op data is checked at every point, like the program in the table
+        for program in programs:
+            error = pb_program.scan_points_sanity_check(program, scan_sequence_list)
+            if error:
+                sanity_check_fail_counter.inc(check="scan points")
+                qt.QMessageBox.warning(self, 'Scanner Setting Error', error, qt.QMessageBox.Ok, qt.QMessageBox.Ok)
+                return
+            if (program is not instr_list) and not self.parent.sync_sanity_check(program):
+                return
+
         # disable or enable some widgets
         self.enable_widgets(False)
         self.stop_scan_pb.setEnabled(True)
         self.scanning = True
 
-        # generate scan sequence
-        self.scan_sequence_list = self.table.generate_sequence(self.random_seq)
-        # print(self.scan_sequence_list)
+        job = {"name": "table",
+               "config": None,
+               "instr list": instr_list,
+               "programs": programs,
+               "program names": ["table"] + self.interleave_filenames,
+               "interleave pattern": self.interleave_le.text().strip() if self.interleave_filenames else "",
+               "scan sequence list": scan_sequence_list,
+               "sample number": self.samp_num_sb.value(),
+               "repetition number": self.rep_num_sb.value(),
+               "dwell number": self.dwell_num_sb.value(),
+               "seed": seed,
+               "scan order": self.order_cb.currentText(),
+               "trigger source": self.trigger_cb.currentText(),
+               "DAQ DI channel": self.daq_ch_le.text().strip(),
+               "DAQ edge counter": self.daq_ctr_le.text().strip()}
+
+        # save scan sequence to a local file
+        if not self.start_job(job, ask_overwrite=True):
+            self.enable_widgets(True)
+            self.stop_scan_pb.setEnabled(False)
+            self.scanning = False
+            return
+
+        self.start_scan_loop()
+
+    # set up scan state from a (precompiled) job, save its sequence and start a checkpoint
+    def start_job(self, job, ask_overwrite=False):
+        self.setup_job(job)
+
+        if not self.save_sequence(ask_overwrite):
+            return False
+
+        self.start_checkpoint(-1)
+
+        return True
+
+    # set up scan state from a job, without widgets or files, so it can run in the DAQ callback
+    def setup_job(self, job):
+        self.job = job
+        self.instr_list = job["instr list"]
+        self.scan_sequence_list = job["scan sequence list"]
+        self.samp_num = job["sample number"]
+        self.rep_num = job["repetition number"]
+        self.dwell_num = job.get("dwell number", 1)
+        self.seed = job["seed"]
+        self.scan_order = job.get("scan order", "Interleaved")
+        self.trigger_source = job["trigger source"]
+        self.daq_ch = job["DAQ DI channel"]
+        self.daq_ctr = job["DAQ edge counter"]
+        self.programs = job["programs"]
+        self.program_names = job["program names"]
+        self.interleave_pattern = job["interleave pattern"]
+        self.program_index = None
+        if self.interleave_pattern:
+            self.scan_sequence_list, self.program_index = pb_program.interleave(self.scan_sequence_list, self.interleave_pattern, self.dwell_num)
         self.counter = 0
         self.scan_sequence_len = len(self.scan_sequence_list[0]["sequence"])
         self.scan_instr_num = len(self.scan_sequence_list)
 
-        # save scan sequence to a local file
-        saved = self.save_sequence()
-        if not saved:
+    # precompile a configuration and its scanner settings into a job, return (job, None) or (None, error message)
+    def compile_job(self, filename):
+        config = pb_program.read_config(filename)
+        try:
+            instr_list = pb_program.compile_config(config, self.parent.num_boards)
+            num_instr = int(config["General settings"]["number of instructions"])
+            for j, instr_list_single_board in enumerate(instr_list):
+                error = pb_program.instr_sanity_check(instr_list_single_board)
+                if error:
+                    return None, f"{error[1]} (board {j})"
+
+            scan_instr_list = pb_program.compile_scan_instr(config)
+            error = pb_program.scan_instr_sanity_check(scan_instr_list, num_instr, self.parent.num_boards)
+            if error:
+                return None, error[1]
+
+            pattern = config.get("Scanner settings", "interleave pattern", fallback="").strip()
+            interleave_filenames = config.get("Scanner settings", "interleaved configs", fallback="")
+            interleave_filenames = [f.strip() for f in interleave_filenames.split(",") if f.strip()]
+            programs, error = self.compile_interleave_programs(instr_list, interleave_filenames, pattern)
+            if error:
+                return None, error
+
+            samp_num = config.getint("Scanner settings", "sample number")
+            rep_num = config.getint("Scanner settings", "repetition number")
+            randomize = config.getboolean("Scanner settings", "randomize sequence")
+            order = config.get("Scanner settings", "scan order", fallback="Interleaved")
+            dwell_num = config.getint("Scanner settings", "dwell number", fallback=1)
+            seed = int(np.random.SeedSequence().generate_state(1)[0])
+            scan_sequence_list = pb_program.generate_sequence(scan_instr_list, samp_num, rep_num, randomize, seed, order, dwell_num)
+            for program in programs:
+                error = pb_program.scan_points_sanity_check(program, scan_sequence_list)
+                if error:
+                    return None, error
+            job = {"name": filename,
+                   "config": config,
+                   "instr list": instr_list,
+                   "programs": programs,
+                   "program names": [filename] + interleave_filenames,
+                   "interleave pattern": pattern if interleave_filenames else "",
+                   "scan sequence list": scan_sequence_list,
+                   "sample number": samp_num,
+                   "repetition number": rep_num,
+                   "dwell number": dwell_num,
+                   "seed": seed,
+                   "scan order": order,
+                   "trigger source": config.get("Scanner settings", "trigger source", fallback="DAQ Change Detection"),
+                   "DAQ DI channel": config.get("Scanner settings", "DAQ DI channel").strip(),
+                   "DAQ edge counter": config.get("Scanner settings", "DAQ edge counter", fallback="").strip()}
+        except Exception as err:
+            return None, f"Error: {err}"
+
+        return job, None
+
+    # add configurations to the queue of jobs, which run one after another when a scan finishes
+    def queue_configs(self):
+        filenames, _ = qt.QFileDialog.getOpenFileNames(self, "Queue configs", "saved_configs/", "All Files (*);;INI File (*.ini)")
+        for filename in filenames:
+            job, error = self.compile_job(filename)
+            if job is None:
+                qt.QMessageBox.warning(self, 'Queue Error', f"{os.path.basename(filename)}: {error}", qt.QMessageBox.Ok, qt.QMessageBox.Ok)
+                continue
+            self.job_queue.append(job)
+
+        self.update_queue_pb()
+
+    def clear_queue(self):
+        self.job_queue = []
+        self.update_queue_pb()
+
+    def update_queue_pb(self):
+        self.queue_pb.setText(f"Queue Configs ({len(self.job_queue)})")
+        self.queue_pb.setToolTip("\n".join(["Queued jobs, run after the current scan:"] + [job["name"] for job in self.job_queue]))
+
+    # choose configurations to interleave with the table
+    def choose_interleave_configs(self):
+        filenames, _ = qt.QFileDialog.getOpenFileNames(self, "Interleave configs", "saved_configs/", "All Files (*);;INI File (*.ini)")
+        if filenames:
+            self.set_interleave_configs([os.path.relpath(f).replace("\\", "/") for f in filenames])
+
+    def set_interleave_configs(self, filenames):
+        self.interleave_filenames = filenames
+        self.interleave_pb.setText(f"Interleave Configs ({len(filenames)})")
+        self.interleave_pb.setToolTip("\n".join(f"{pb_program.program_letters[i+1]}: {f}" for i, f in enumerate(filenames)))
+
+    # compile programs to interleave, program A is instr_list, return (list of programs, None) or (None, error message)
+    # interleaved programs must have the same structure as A, so boards can be reprogrammed while waiting at a WAIT
+    def compile_interleave_programs(self, instr_list, filenames, pattern):
+        programs = [instr_list]
+        if not filenames:
+            return programs, None
+
+        error = pb_program.interleave_sanity_check(pattern, len(filenames)+1)
+        if error:
+            return None, error
+
+        for i, filename in enumerate(filenames):
+            try:
+                program = pb_program.compile_config(pb_program.read_config(filename), self.parent.num_boards)
+            except Exception as err:
+                return None, f"Error ({filename}): {err}"
+
+            for j, instr_list_single_board in enumerate(program):
+                error = pb_program.instr_sanity_check(instr_list_single_board)
+                if error:
+                    return None, f"{error[1]} ({filename}, board {j})"
+
+            if not pb_program.same_structure(program, instr_list):
+                return None, f"Error ({filename}): Op codes and op data have to be the same as program A to interleave."
+
+            programs.append(program)
+
+        return programs, None
+
+    # whether a job can take over running boards without restarting them:
+    # every instruction (except durations and TTL patterns) and DAQ settings have to be the same, so boards keep waiting at the same WAIT
+    def seamless_switch(self, job):
+        if (job["trigger source"] != self.trigger_source) or (job["DAQ DI channel"] != self.daq_ch) or (job["DAQ edge counter"] != self.daq_ctr):
+            return False
+
+        return all(pb_program.same_structure(program, self.instr_list) for program in job["programs"])
+
+    # start the next job in the queue when a scan finishes. Called in the DAQ callback.
+    def next_job(self):
+        job = self.job_queue[0]
+
+        # boards are waiting at the same WAIT, load the new job's first element now, so no cycle is lost.
+        # Only the scan state changes here, the sequence file, checkpoint and widgets follow in the main thread (finish_switch).
+        if self.seamless_switch(job):
+            self.job_queue.pop(0)
+            self.setup_job(job)
+            self.checkpoint.close() # elements of the new job don't go into the checkpoint of the last one
+            self.remaining_times = None
+            hardware_count = self.engine.cycle_accounting.hardware_count
+            self.engine.start(self.instr_list, self.scan_sequence_list, self.programs, self.program_index, 0, self.edge_counter, hardware_count)
+            self.load_param()
+            self.job_started.emit(job)
+
+        # otherwise, stop and restart the scan in the main thread, once, later callbacks wait for it
+        else:
+            self.switching = True
+            self.restart_job.emit()
+
+    # save the sequence and start the checkpoint of a job that took over the boards in the DAQ callback, in the main thread
+    def finish_switch(self, job):
+        try:
+            self.save_sequence(ask_overwrite=False)
+            # the last loaded element hasn't run yet
+            self.start_checkpoint(self.engine.counter-2)
+        except Exception as err:
+            print(err)
+            logging.warning(err)
+        self.start_eta()
+        self.show_job(job)
+
+    # why the program of the running scan can't be replaced by instr_list, None if it can
+    def program_update_error(self, instr_list):
+        if self.parent.daemon is not None:
+            return "The program of a scan run by the hardware daemon can't be changed."
+
+        if not pb_program.same_structure(instr_list, self.instr_list):
+            return "Op codes or op data have changed, the program isn't changed during the scan."
+
+        return None
+
+    # replace the program of a running scan (program A if interleaved), e.g. after a watched configuration changes.
+    # It's used from the next scan element on, only durations, TTL patterns and notes can change.
+    def update_program(self, instr_list):
+        error = self.program_update_error(instr_list)
+        if error:
+            print(error)
+            return False
+
+        self.instr_list = instr_list
+        if self.programs:
+            self.programs[0] = instr_list
+        self.engine.replace_program(instr_list)
+
+        return True
+
+    # update widgets in the main thread after a job takes over the boards
+    def show_job(self, job):
+        self.update_queue_pb()
+        if job["config"] is not None:
+            self.parent.table.load_config(job["config"])
+            self.load_config(job["config"])
+
+    # stop the current scan and start the next job in the queue from the beginning
+    def restart_with_next_job(self):
+        self.stop_scan()
+        self.switching = False
+        if not self.job_queue:
+            return
+
+        job = self.job_queue.pop(0)
+        self.update_queue_pb()
+        self.show_job(job)
+
+        self.enable_widgets(False)
+        self.stop_scan_pb.setEnabled(True)
+        self.scanning = True
+        if not self.start_job(job):
             self.enable_widgets(True)
             self.stop_scan_pb.setEnabled(False)
             self.scanning = False
             return
 
-        # stop, reset and restart PulseBlaster
-        for i in range(self.parent.num_boards):
-            pb_select_board(i)
-            pb_stop()
-            pb_reset()
+        self.start_scan_loop()
+
+    # resume the last scan from its checkpoint, at the element after the last applied one
+    def resume_scan(self):
+        checkpoint = self.checkpoint.read()
+        if checkpoint is None:
+            qt.QMessageBox.warning(self, 'Resume Error', "Error: No scan checkpoint found.", qt.QMessageBox.Ok, qt.QMessageBox.Ok)
+            return
+
+        filename = checkpoint["sequence file"]
+        if (not os.path.exists(filename)) or (pb_program.file_hash(filename) != checkpoint["sequence sha1"]):
+            qt.QMessageBox.warning(self, 'Resume Error',
+                                f"Error: Sequence file ({filename}) doesn't exist or has been modified.",
+                                qt.QMessageBox.Ok, qt.QMessageBox.Ok)
+            return
+
+        next_element = checkpoint["last applied element"] + 1
+        if next_element >= checkpoint["element number"]:
+            qt.QMessageBox.warning(self, 'Resume Error', "Error: The last scan has finished.", qt.QMessageBox.Ok, qt.QMessageBox.Ok)
+            return
 
-            # start spincore and make it ready to be triggered
-            pb_start()
+        if not self.parent.table.instr_sanity_check(op_code_check=True, pulse_width_check=True):
+            return
+
+        if not self.daq_sanity_check():
+            return
+
+        # the saved sequence file has the full (randomized) order
+        scan_sequence_list = pb_program.compile_sequence_list(pb_program.read_config(filename))
+        scanned = [s["instr no."] for s in scan_sequence_list]
+        num_instr = self.parent.table.num_cols - len(self.parent.table.horizontal_headers_init)
+        if max(scanned) >= num_instr:
+            qt.QMessageBox.warning(self, 'Resume Error',
+                                "Error: Scanned instructions don't exist in the current table.",
+                                qt.QMessageBox.Ok, qt.QMessageBox.Ok)
+            return
+
+        # warn if the program in the table has changed since the scan started
+        config_hash = pb_program.program_hash(self.parent.table.compile_instr(), scanned)
+        if config_hash != checkpoint["config sha1"]:
+            ans = qt.QMessageBox.warning(self, 'Resume Warning',
+                                    "Warning: Instructions in the table have changed since the scan started. Continue to resume?",
+                                    qt.QMessageBox.Yes | qt.QMessageBox.No,
+                                    qt.QMessageBox.No)
+            if ans == qt.QMessageBox.No:
+                return
+
+        self.enable_widgets(False)
+        self.stop_scan_pb.setEnabled(True)
+        self.scanning = True
+
+        # interleaved programs are compiled again from their configurations
+        instr_list = self.parent.table.compile_instr()
+        config = pb_program.read_config(filename)
+        self.program_index = None
+        self.programs = [instr_list]
+        self.program_names = ["table"]
+        self.interleave_pattern = ""
+        program_letters = pb_program.compile_sequence_programs(config)
+        if program_letters is not None:
+            self.program_names += [f.strip() for f in config.get("Settings", "interleaved programs").split(",") if f.strip()]
+            self.interleave_pattern = config.get("Settings", "interleave pattern")
+            programs, error = self.compile_interleave_programs(instr_list, self.program_names[1:], self.interleave_pattern)
+            if error:
+                qt.QMessageBox.warning(self, 'Resume Error', error, qt.QMessageBox.Ok, qt.QMessageBox.Ok)
+                self.enable_widgets(True)
+                self.stop_scan_pb.setEnabled(False)
+                self.scanning = False
+                return
+            self.programs = programs
+            self.program_index = np.array([pb_program.program_letters.index(letter) for letter in program_letters])
+
+        self.job = None
+        self.instr_list = instr_list
+        self.scan_sequence_list = scan_sequence_list
+        self.counter = next_element
+        self.scan_sequence_len = checkpoint["element number"]
+        self.scan_instr_num = len(self.scan_sequence_list)
+        self.sequence_filename = filename
+        self.seed = checkpoint["random seed"]
+        self.scan_order = config.get("Settings", "scan order", fallback=None)
+        self.dwell_num = config.getint("Settings", "dwell number", fallback=1)
+        self.trigger_source = self.trigger_cb.currentText()
+        self.daq_ch = self.daq_ch_le.text().strip()
+        self.daq_ctr = self.daq_ctr_le.text().strip()
+
+        self.start_checkpoint(next_element-1)
+        self.start_scan_loop()
+
+    # write a new checkpoint for the current scan
+    def start_checkpoint(self, counter):
+        scanned = [s["instr no."] for s in self.scan_sequence_list]
+        config_hash = pb_program.program_hash(self.instr_list, scanned)
+        try:
+            self.checkpoint_args = (self.sequence_filename, pb_program.file_hash(self.sequence_filename),
+                                    self.seed, config_hash, self.scan_sequence_len, counter)
+            self.checkpoint.start(*self.checkpoint_args)
+        except Exception as err:
+            print(err)
+            logging.warning(err)
+
+    # start boards and DAQ task, parameters are loaded from self.counter on
+    def start_scan_loop(self):
+        self.switching = False
+        self.start_eta()
+        self.daq_watchdog.start()
+
+        # the hardware daemon runs the scan loop, see pb_daemon.py
+        if self.parent.daemon is not None:
+            self.start_daemon_scan()
+            return
+
+        # count cycles in hardware if an edge counter is given
+        self.edge_counter = None
+        if self.daq_ctr:
+            self.edge_counter = daq_trigger.edgeCounter(self.daq_ctr)
+        self.engine.start(self.instr_list, self.scan_sequence_list, self.programs, self.program_index, self.counter, self.edge_counter)
+
+        # Spincore "WAITING" signal triggers loading, usually read by a DAQ, see trigger_sources.py
+        if self.trigger_source.startswith("DAQ"):
+            load_nidaqmx()
+        self.task = trigger_sources.new_source(self.trigger_source, self.daq_ch, nidaqmx)
+
+        # stop, reset and restart PulseBlaster
+        self.parent.restart_boards()
 
         # load the first scan parameter to PulseBlaster
         self.load_param()
 
-        # a DAQ is used to read Spincore "WAITING" signal, a rising edge will be used to trigger loading
-        self.task = nidaqmx.Task("DI task")
-        ch = self.daq_ch_le.text()
-        self.task.di_channels.add_di_chan(ch)
-        self.task.timing.cfg_change_detection_timing(rising_edge_chan=ch,
-                                                    sample_mode=const.AcquisitionType.CONTINUOUS
-                                                    )
-        # see https://nidaqmx-python.readthedocs.io/en/latest/task.html for an example of the callback method
-        self.task.register_signal_event(const.Signal.CHANGE_DETECTION_EVENT, self.load_param)
+        # start counting after boards have reached their first WAIT
+        if self.edge_counter is not None:
+            self.edge_counter.start()
+
+        self.task.start(self.load_param)
+
+    # compute cycle times of all elements from the programs, for the ETA and the DAQ timeout
+    def start_eta(self):
+        try:
+            cycle_times = pb_program.scan_cycle_times(self.instr_list, self.scan_sequence_list, self.programs, self.program_index)
+        except Exception as err:
+            print(err)
+            logging.warning(err)
+            cycle_times = np.full(self.scan_sequence_len, np.nan)
+
+        # remaining_times[i]: time of elements i, i+1, ... to the end
+        self.remaining_times = np.append(np.cumsum(np.nan_to_num(cycle_times)[::-1])[::-1], 0)
+        longest = np.nanmax(cycle_times) if not np.all(np.isnan(cycle_times)) else 0
+        self.daq_timeout = max(min_daq_timeout, 2*longest/1e9)
+        self.eta_t0 = time.time()
+        self.eta_counter0 = self.counter
+        self.last_cycle_time = time.time()
+        self.daq_timeout_warned = False
+
+    # show a warning in the progress bar if no cycle finishes within the DAQ timeout, e.g. the trigger is off
+    def check_daq_timeout(self):
+        waited = time.time()-self.last_cycle_time
+        if waited < self.daq_timeout:
+            return
+
+        self.progress_bar.setFormat(f"%p%  no trigger for {waited:.0f} s")
+        if not self.daq_timeout_warned:
+            self.daq_timeout_warned = True
+            logging.warning(f"No PulseBlaster cycle finished within the DAQ timeout ({self.daq_timeout:.1f} s).")
+
+    # let the hardware daemon run the scan loop, from self.counter on. The daemon writes the checkpoint.
+    def start_daemon_scan(self):
+        self.checkpoint.close()
+        checkpoint_args = list(self.checkpoint_args)
+        checkpoint_args[-1] = self.counter-1
+        try:
+            self.parent.daemon.request("scan start",
+                                       **{"instr list": self.instr_list,
+                                          "scan sequence list": self.scan_sequence_list,
+                                          "programs": self.programs,
+                                          "program index": self.program_index,
+                                          "counter": self.counter,
+                                          "trigger source": self.trigger_source,
+                                          "DAQ DI channel": self.daq_ch,
+                                          "DAQ edge counter": self.daq_ctr,
+                                          "checkpoint": [self.checkpoint.filename] + checkpoint_args})
+        except Exception as err:
+            print(err)
+            logging.warning(err)
+            qt.QMessageBox.warning(self, 'Daemon Error', f"Error: Hardware daemon can't start the scan.\n{err}", qt.QMessageBox.Ok, qt.QMessageBox.Ok)
+            self.stop_scan()
+            return
+
+        self.daemon_timer.start()
+
+    # update the progress of a scan run by the hardware daemon
+    def poll_daemon(self):
+        try:
+            status = self.parent.daemon.request("status")
+        except Exception as err:
+            print(err)
+            logging.warning(err)
+            self.stop_scan()
+            return
+
+        self.counter = status["counter"]
+        if self.counter > 0:
+            self.show_param(min(self.counter, self.scan_sequence_len)-1)
+
+        if not status["scanning"]:
+            self.daemon_timer.stop()
+            print(f"Cycle accounting: {status['cycle accounting']}")
+            # boards are restarted for the next job, a seamless switch isn't possible across processes
+            if status["finished"] and self.job_queue:
+                self.restart_with_next_job()
+            else:
+                self.stop_scan()
+
+    # start an adaptive scan, durations of scan instructions are proposed one point at a time from measurement results
+    def start_adaptive_scan(self):
+        # proposed points are loaded at WAITING edges, the trigger source is owned by the daemon in daemon mode
+        if self.parent.daemon is not None:
+            qt.QMessageBox.warning(self, 'Adaptive Scan Error', "Error: Adaptive scans can't run with the hardware daemon.",
+                                qt.QMessageBox.Ok, qt.QMessageBox.Ok)
+            return
+
+        self.scan_instr_list = self.table.compile_scan_instr()
+        if [s for s in self.scan_instr_list if s["target"] != "Duration"]:
+            qt.QMessageBox.warning(self, 'Scanner Setting Error', "Error: Adaptive scans only scan durations.",
+                                qt.QMessageBox.Ok, qt.QMessageBox.Ok)
+            return
+
+        start = pb_program.duration_in_ns(self.scan_instr_list[0]["start duration time"], self.scan_instr_list[0]["start duration unit"])
+        end = pb_program.duration_in_ns(self.scan_instr_list[0]["end duration time"], self.scan_instr_list[0]["end duration unit"])
+        if start == end:
+            qt.QMessageBox.warning(self, 'Scanner Setting Error', "Error: Adaptive scans need different start and end durations of Scan Instr 0.",
+                                qt.QMessageBox.Ok, qt.QMessageBox.Ok)
+            return
+
+        try:
+            self.feedback_server = adaptive_scan.feedbackServer(self.adaptive_feedback, self.feedback_port_sb.value())
+        except OSError as err:
+            qt.QMessageBox.warning(self, 'Adaptive Scan Error', f"Error: Can't listen on feedback port {self.feedback_port_sb.value()}.\n{err}",
+                                qt.QMessageBox.Ok, qt.QMessageBox.Ok)
+            return
+
+        self.enable_widgets(False)
+        self.stop_scan_pb.setEnabled(True)
+        self.scanning = True
 
-        self.task.start()
+        self.instr_list = self.parent.table.compile_instr()
+        self.samp_num = self.samp_num_sb.value()
+        self.rep_num = self.rep_num_sb.value()
+        self.dwell_num = 1
+        self.adaptive_points = [] # measured durations of Scan Instr 0
+        self.adaptive_results = [] # mean measurement of every point
+        self.adaptive_values = [] # measurements of the current point
+        self.adaptive_next = None # proposed duration waiting for the next WAITING edge
+        self.adaptive_edge_time = None # time of the last WAITING edge
+        self.adaptive = adaptive_scan.new_strategy(self.scan_mode_cb.currentText(), min(start, end), max(start, end),
+                                                    self.samp_num, maximize=self.optimize_cb.currentText() == "Maximum")
+
+        self.trigger_source = self.trigger_cb.currentText()
+        self.daq_ch = self.daq_ch_le.text().strip()
+        if self.trigger_source.startswith("DAQ"):
+            load_nidaqmx()
+        self.task = trigger_sources.new_source(self.trigger_source, self.daq_ch, nidaqmx)
+
+        # the first point is loaded before boards start, the next ones at WAITING edges, like a grid scan
+        self.parent.restart_boards()
+        self.adaptive_load(self.adaptive.propose())
+        self.task.start(self.adaptive_trigger)
+
+    # compile and load a point, return the time it took (s)
+    def adaptive_load(self, duration):
+        t0 = time.perf_counter()
+        self.adaptive_x = duration
+        self.adaptive_values = []
+        scan_sequence_list = adaptive_scan.scan_sequence(self.scan_instr_list, [duration])
+        self.parent.write_boards(pb_program.apply_scan_point(self.instr_list, scan_sequence_list, 0), priority=board_queue.SCAN)
+        load_time = time.perf_counter()-t0
+        adaptive_load_hist.observe(load_time)
+        # time from a trigger to the next WAIT with this point, to know how long boards wait at the WAIT
+        self.adaptive_cycle_time = pb_program.scan_cycle_times(self.instr_list, scan_sequence_list)[0]/1e9
+        self.adaptive_point.emit(duration)
+
+        return load_time
+
+    # a WAITING edge, boards wait for the next trigger. Load the proposed point if there's one. Called in the DAQ callback.
+    def adaptive_trigger(self, task_handle=None, signal_type=None, callback_data=None):
+        time.sleep(self.task.debounce if self.task is not None else trigger_sources.daqChangeDetection.debounce)
+        t_edge = time.perf_counter()
+
+        self.adaptive_lock.lock()
+        try:
+            last_edge_time = self.adaptive_edge_time
+            self.adaptive_edge_time = t_edge
+            if (self.adaptive is None) or (self.adaptive_next is None):
+                return 0
+
+            # boards wait at the WAIT for the trigger period less the time they run, the load has to fit in it.
+            # Edges closer than the program runs (e.g. of a simulated trigger) don't tell how long boards wait.
+            cycle_time = self.adaptive_cycle_time
+            duration = self.adaptive_next
+            self.adaptive_next = None
+            load_time = self.adaptive_load(duration)
+            if (last_edge_time is not None) and not np.isnan(cycle_time):
+                wait_time = t_edge-last_edge_time-cycle_time
+                if 0 <= wait_time < load_time:
+                    adaptive_overrun_counter.inc()
+                    logging.warning(f"Loading adaptive scan point {duration:.0f} ns took {load_time*1e3:.2f} ms, "
+                                    f"longer than boards wait for the trigger ({wait_time*1e3:.2f} ms), a shot may run during the upload.")
+        finally:
+            self.adaptive_lock.unlock()
+
+        # return an int is necessary for DAQ callback function
+        return 0
+
+    # a measurement result of the loaded point arrives. Called in the feedback server thread.
+    def adaptive_feedback(self, value):
+        self.adaptive_lock.lock()
+        try:
+            # the scan is finishing, or the next point is measured after it's loaded
+            if (self.adaptive is None) or (self.adaptive_x is None) or (self.adaptive_next is not None):
+                return
+
+            self.adaptive_values.append(value)
+            if len(self.adaptive_values) < self.rep_num:
+                return
+
+            y = float(np.mean(self.adaptive_values))
+            self.adaptive.tell(self.adaptive_x, y)
+            self.adaptive_points.append(self.adaptive_x)
+            self.adaptive_results.append(y)
+            logging.info(f"Adaptive scan point {len(self.adaptive_points)}: {self.adaptive_x:.0f} ns, {y}")
+
+            duration = self.adaptive.propose()
+            if duration is None:
+                self.adaptive_x = None
+                self.adaptive_done.emit()
+            else:
+                self.adaptive_next = duration
+        finally:
+            self.adaptive_lock.unlock()
+
+    # show the loaded point of an adaptive scan in the table, and the progress
+    def show_adaptive_point(self, duration):
+        if self.adaptive is None:
+            return
+
+        self.scan_sequence_list = adaptive_scan.scan_sequence(self.scan_instr_list, [duration])
+        self.scan_instr_num = len(self.scan_sequence_list)
+        self.scan_sequence_len = self.samp_num
+        self.show_param(0)
+        self.progress_bar.setValue(int(len(self.adaptive_points)/self.samp_num*100.0))
+
+    # stop an adaptive scan, save measured points and load the best one
+    def stop_adaptive_scan(self):
+        self.adaptive_lock.lock()
+        strategy = self.adaptive
+        self.adaptive = None
+        self.adaptive_lock.unlock()
+
+        best = strategy.best()
+        if best is None:
+            self.feedback_server.close()
+            self.feedback_server = None
+            return
+
+        self.scan_sequence_list = adaptive_scan.scan_sequence(self.scan_instr_list, self.adaptive_points)
+        self.scan_sequence_len = len(self.adaptive_points)
+        self.scan_instr_num = len(self.scan_sequence_list)
+        self.samp_num = self.scan_sequence_len
+        self.seed = None
+        self.scan_order = None
+        self.program_index = None
+        self.adaptive_best = best
+        self.adaptive_strategy = self.scan_mode_cb.currentText()
+        self.save_sequence(ask_overwrite=False)
+        self.feedback_server.close()
+        self.feedback_server = None
+
+        logging.info(f"Adaptive scan best point: {best[0]:.0f} ns, {best[1]}")
+        self.scan_sequence_list = adaptive_scan.scan_sequence(self.scan_instr_list, [best[0]])
+        self.parent.write_boards(pb_program.apply_scan_point(self.instr_list, self.scan_sequence_list, 0))
+        self.show_param(0)
 
     # stop scanning
     def stop_scan(self):
+        if self.feedback_server is not None:
+            self.stop_adaptive_scan()
+
+        self.daq_watchdog.stop()
+        self.remaining_times = None
+
         # stop and close DAQ task
+        if self.parent.daemon is not None:
+            self.daemon_timer.stop()
+            try:
+                self.parent.daemon.request("scan stop")
+            except Exception as err:
+                print(err)
+                logging.warning(err)
+            self.task = None
+
         try:
-            self.task.stop()
-            self.task.close()
+            if self.task is not None:
+                self.task.stop()
+                self.task.close()
         except Exception as err:
             print(err)
             logging.warning(err)
 
+        if self.edge_counter is not None:
+            try:
+                self.edge_counter.close()
+            except Exception as err:
+                print(err)
+                logging.warning(err)
+            self.edge_counter = None
+            self.engine.edge_counter = None
+            print(f"Cycle accounting: {self.engine.cycle_accounting.summary()}")
+
+        self.checkpoint.close()
+        if self.parent.boards is not None:
+            logging.info(f"Board queue: {self.parent.boards.summary()}")
+
         self.enable_widgets(True)
         self.stop_scan_pb.setEnabled(False)
         self.scanning = False
 
         time.sleep(0.1) # for some reason we need this step here otherwise the next line will crash the program
         self.progress_bar.setValue(0)
+        self.progress_bar.setFormat("%p%")
 
     # enable or disable widgets
     def enable_widgets(self, en):
@@ -891,6 +1863,9 @@ class scannerBox(newBox):
         self.parent.load_board_pb.setEnabled(en)
         self.parent.save_config_pb.setEnabled(en)
         self.parent.load_config_pb.setEnabled(en)
+        self.parent.sync_cb.setEnabled(en)
+        self.parent.sync_ch_sb.setEnabled(en)
+        self.parent.sync_latency_sb.setEnabled(en)
 
         self.parent.table.setEnabled(en)
 
@@ -899,24 +1874,40 @@ class scannerBox(newBox):
         self.scan_pb.setEnabled(en)
         self.samp_num_sb.setEnabled(en)
         self.rep_num_sb.setEnabled(en)
+        self.dwell_num_sb.setEnabled(en)
         self.seq_name_le.setEnabled(en)
         self.daq_ch_le.setEnabled(en)
+        self.trigger_cb.setEnabled(en)
+        self.daq_ctr_le.setEnabled(en)
         self.auto_append_chb.setEnabled(en)
         self.random_chb.setEnabled(en)
+        self.order_cb.setEnabled(en)
+        self.resume_scan_pb.setEnabled(en)
+        self.queue_pb.setEnabled(en)
+        self.clear_queue_pb.setEnabled(en)
+        self.interleave_pb.setEnabled(en)
+        self.clear_interleave_pb.setEnabled(en)
+        self.interleave_le.setEnabled(en)
+        self.scan_mode_cb.setEnabled(en)
+        self.feedback_port_sb.setEnabled(en)
+        self.optimize_cb.setEnabled(en)
         self.table.setEnabled(en)
 
     # save sequence locally, it's necessary when the sequence is randomized
-    def save_sequence(self):
+    def save_sequence(self, ask_overwrite=True):
         # compile a file name to save
         filename = self.seq_name_le.text()
         if self.auto_append_chb.isChecked():
             filename += "_"
             filename += time.strftime("%Y%m%d_%H%M%S")
+        # a queued job may start within the same second as the last one
+        if (not ask_overwrite) and os.path.exists(r"saved_sequences/" + filename + ".ini"):
+            filename += "_" + str(sum(1 for f in os.listdir("saved_sequences") if f.startswith(filename)))
         filename += ".ini"
         filename = r"saved_sequences/" + filename
 
         # check if the file name exists and whether to overwrite
-        if os.path.exists(filename):
+        if ask_overwrite and os.path.exists(filename):
             overwrite = qt.QMessageBox.warning(self, 'Sequence file name exists',
                                             'Sequence file name already exists. Continue to overwrite it?',
                                             qt.QMessageBox.Yes | qt.QMessageBox.No,
@@ -934,23 +1925,43 @@ class scannerBox(newBox):
         config.optionxform = str
 
         config["Settings"] = {}
-        samp_num = self.samp_num_sb.value()
-        rep_num = self.rep_num_sb.value()
+        samp_num = self.samp_num
+        rep_num = self.rep_num
         config["Settings"]["sample number"] = str(samp_num)
         config["Settings"]["repetition number"] = str(rep_num)
-        config["Settings"]["element number"] = str(samp_num*rep_num)
+        config["Settings"]["dwell number"] = str(self.dwell_num)
+        config["Settings"]["element number"] = str(self.scan_sequence_len)
         config["Settings"]["scan device"] = "PulseBlasterUSB"
-        instr_num = self.scan_sequence_list[0]["instr no."]
-        config["Settings"]["scan param"] = f"instr no. {instr_num}"
+        config["Settings"]["scan param"] = pb_program.scan_param_name(self.scan_sequence_list[0]).replace(" (ns)", "")
+        if self.seed is not None:
+            config["Settings"]["random seed"] = str(self.seed)
+        if self.scan_order is not None:
+            config["Settings"]["scan order"] = self.scan_order
+            config["Settings"]["reprogrammed elements"] = str(pb_program.sequence_changes(self.scan_sequence_list, self.program_index))
+        # points of an adaptive scan are in the order they were measured
+        if self.feedback_server is not None:
+            config["Settings"]["adaptive strategy"] = self.adaptive_strategy
+            config["Settings"]["best duration (ns)"] = str(self.adaptive_best[0])
+        if self.program_index is not None:
+            config["Settings"]["interleave pattern"] = self.interleave_pattern
+            config["Settings"]["interleaved programs"] = ", ".join(self.program_names[1:])
         for i in range(self.scan_sequence_len):
             config[f"Sequence element {i}"] = {}
             for j in range(self.scan_instr_num):
-                instr_num = self.scan_sequence_list[j]["instr no."]
+                name = pb_program.scan_param_name(self.scan_sequence_list[j])
                 val = self.scan_sequence_list[j]["sequence"][i]
-                config[f"Sequence element {i}"][f"PulseBlasterUSB [instr no. {instr_num} (ns)]"] = str(val)
+                config[f"Sequence element {i}"][f"PulseBlasterUSB [{name}]"] = str(val)
+            # which program runs in this element
+            if self.program_index is not None:
+                config[f"Sequence element {i}"]["PulseBlasterUSB [program]"] = pb_program.program_letters[self.program_index[i]]
+            if self.feedback_server is not None:
+                config[f"Sequence element {i}"]["measurement"] = str(self.adaptive_results[i])
         configfile = open(filename, "w")
         config.write(configfile)
         configfile.close()
+        self.sequence_filename = filename
+
+        self.parent.update_config_index()
 
         # save scan sequence to camera folder, so the camera program can read it
 		# configfile = open(r"C:\Users\BufferLab\Desktop\Python-Lab-Control\pixelfly-python-control\scan_sequence\latest_sequence.ini", "w")
@@ -959,70 +1970,116 @@ class scannerBox(newBox):
 
         return True
 
-    # DAQ channel sanity check
+    # DAQ channel (or other trigger source) sanity check, see trigger_sources.py
     def daq_sanity_check(self):
-        daq_ch = self.daq_ch_le.text()
-        daq_ch = daq_ch.strip()
-
-        # check whether the channel name is legitimate
-        matched = re.match("Dev[0-9]{1,}/port[0-9]{1,}/line[0-9]{1,}", daq_ch)
-        is_matched = bool(matched)
-        if not is_matched:
-            qt.QMessageBox.warning(self, 'DAQ Channel Error',
-                                f"Error: DAQ channel name ({daq_ch}) can't be recognized.",
-                                qt.QMessageBox.Ok, qt.QMessageBox.Ok)
-            return False
-
-        # check whether the channel exists in this computer
-        di_channels = []
-        dev_collect = nidaqmx.system._collections.device_collection.DeviceCollection()
-        for i in dev_collect.device_names:
-            ch_collect = nidaqmx.system._collections.physical_channel_collection.DILinesCollection(i)
-            for j in ch_collect.channel_names:
-                di_channels.append(j)
-        if daq_ch not in di_channels:
-            qt.QMessageBox.warning(self, 'DAQ Channel Error',
-                                f"Error: Specified DAQ channel ({daq_ch}) doesn't exist in this computer.",
-                                qt.QMessageBox.Ok, qt.QMessageBox.Ok)
+        kind = self.trigger_cb.currentText()
+        if kind.startswith("DAQ"):
+            load_nidaqmx()
+        error = trigger_sources.new_source(kind, self.daq_ch_le.text(), nidaqmx).check()
+        if error:
+            sanity_check_fail_counter.inc(check="DAQ channel")
+            qt.QMessageBox.warning(self, 'DAQ Channel Error', error, qt.QMessageBox.Ok, qt.QMessageBox.Ok)
             return False
 
         return True
 
     # load parameters into PulseBlaster. Will be called in every cycle
     def load_param(self, task_handle=None, signal_type=None, callback_date=None):
-        time.sleep(0.02) # seconds, important in the case of trigger signal has oscillations at rising/falling edge
-
-        if self.counter < self.scan_sequence_len:
-            for i in range(self.scan_instr_num):
-                j = self.scan_sequence_list[i]["instr no."]
-                instr_col_widgets = self.parent.table.instr_col_widget_list[j] # find the instruction column desired to scan
-                unit = instr_col_widgets["du_unit_cb"].currentIndex()
-                du = self.scan_sequence_list[i]["sequence"][self.counter]
-                du = du/(1000**(2-unit))
-                # print(du)
-                instr_col_widgets["du_dsb"].setValue(du) # update duration DoubleSpinBox value
-
-            # copmile instructions and load to boards
-            self.parent.load_board(perform_sanity_check=False)
-
-            self.progress_bar.setValue(int(self.counter/self.scan_sequence_len*100.0))
-            self.counter += 1
-
-        # scanning finishes
-        elif self.counter == self.scan_sequence_len:
-            self.stop_scan()            
-        
+        if task_handle is not None:
+            daq_callback_counter.inc()
+
+        time.sleep(self.task.debounce if self.task is not None else trigger_sources.daqChangeDetection.debounce)
+
+        index = self.engine.step(from_trigger=task_handle is not None)
+        self.counter = self.engine.counter
+
+        if index is not None:
+            # element index runs at the next trigger, loading it means the element before it has run
+            self.checkpoint.update(index-1)
+            # widgets are updated in the main thread, elements loaded before the main thread gets to it are skipped
+            self.loaded_index = index
+            if not self.show_pending:
+                self.show_pending = True
+                self.param_loaded.emit()
+
+        # scanning finishes, continue with the next job in the queue if there's any
+        elif self.engine.finished:
+            # this trigger ran the last element
+            self.checkpoint.update(self.engine.length-1)
+            if self.switching:
+                pass
+            elif self.job_queue:
+                self.next_job()
+            else:
+                self.scan_finished.emit()
+
         # return an int is necessary for DAQ callback function
         return 0
-        
+
+    # show the last element loaded by load_param
+    def show_loaded_param(self):
+        self.show_pending = False
+        self.show_param(self.loaded_index)
+
+    # show scanned parameters of a sequence element in the table, and the progress
+    def show_param(self, index):
+        for i in range(self.scan_instr_num):
+            scan_sequence = self.scan_sequence_list[i]
+            j = scan_sequence["instr no."]
+            if j >= len(self.parent.table.instr_col_widget_list):
+                continue
+            instr_col_widgets = self.parent.table.instr_col_widget_list[j] # find the instruction column desired to scan
+            target = scan_sequence.get("target", "Duration")
+            if target == "Op Data":
+                instr_col_widgets["op_data_sb"].setValue(int(scan_sequence["sequence"][index]))
+                continue
+            elif target == "TTL":
+                k = scan_sequence["board"]*num_ch_per_board + scan_sequence["channel"]
+                instr_col_widgets["rb_list"][k].setChecked(bool(scan_sequence["sequence"][index]))
+                continue
+            unit = instr_col_widgets["du_unit_cb"].currentIndex()
+            du = self.scan_sequence_list[i]["sequence"][index]
+            du = du/(1000**(2-unit))
+            # print(du)
+            instr_col_widgets["du_dsb"].setValue(du) # update duration DoubleSpinBox value
+
+        self.progress_bar.setValue(int(index/self.scan_sequence_len*100.0))
+
+        # estimate the remaining time from analyzed cycle times, or from the measured rate if triggers come slower
+        if self.remaining_times is not None:
+            self.last_cycle_time = time.time()
+            self.daq_timeout_warned = False
+            num_done = index+1-self.eta_counter0
+            eta = self.remaining_times[min(index+1, len(self.remaining_times)-1)]/1e9
+            if num_done > 0:
+                eta = max(eta, (time.time()-self.eta_t0)/num_done*(self.scan_sequence_len-index-1))
+            eta = int(eta)
+            self.progress_bar.setFormat(f"%p%  ETA {eta//3600}:{eta%3600//60:02d}:{eta%60:02d}")
+
 # main window
 class mainWindow(qt.QMainWindow):
-    def __init__(self, app):
+    # emitted from the board initialization thread
+    boards_ready = PyQt5.QtCore.pyqtSignal(int)
+    boards_failed = PyQt5.QtCore.pyqtSignal(str)
+
+    # daemon: a pb_daemon.daemonClient if boards are owned by the hardware daemon, None to control boards directly
+    def __init__(self, app, daemon=None):
         super().__init__()
 
-        self.num_boards = self.init_spincore()
+        self.daemon = daemon
+        # all SpinAPI calls go through this queue, see board_queue.py. Boards controlled by the hardware daemon don't need it.
+        self.boards = board_queue.boardQueue(spinapi) if daemon is None else None
+        self.num_boards = 0 # known after boards are initialized
+        self.table = None
         # self.num_boards = 2
 
+        # the index of saved files is updated in a background thread, once after a burst of saves, see update_config_index
+        self.index_timer = PyQt5.QtCore.QTimer(self)
+        self.index_timer.setSingleShot(True)
+        self.index_timer.setInterval(2000) # ms
+        self.index_timer.timeout.connect(self.start_config_index_update)
+        self.index_thread = None
+
         self.box = newBox(layout_type="grid")
         self.box.setStyleSheet("QGroupBox{border-width: 0 px;}")
         
@@ -1035,14 +2092,52 @@ class mainWindow(qt.QMainWindow):
         self.box.frame.addWidget(self.scan_box, 1, 0)
         # self.scan_box.hide()
 
-        # main table
-        self.table = instrTable(self.num_boards, self)
-        self.box.frame.addWidget(self.table, 2, 0)
+        # main table, placed when the number of boards is known
+        self.table_placeholder = qt.QLabel("Initializing boards...")
+        self.table_placeholder.setAlignment(PyQt5.QtCore.Qt.AlignCenter)
+        self.box.frame.addWidget(self.table_placeholder, 2, 0)
+        self.box.setEnabled(False)
 
         self.setCentralWidget(self.box)
         self.resize(pt_to_px(700), pt_to_px(900))
         self.setWindowTitle("PulseBlasterUSB Timing Control")
+        if (daemon is not None) and daemon.session:
+            self.setWindowTitle(f"PulseBlasterUSB Timing Control ({daemon.session})")
         self.show()
+        trace_startup("main window shown")
+
+        # initialize boards in the background, so the window shows up immediately
+        self.boards_ready.connect(self.place_table)
+        self.boards_failed.connect(self.init_failed)
+        threading.Thread(target=self.init_boards, daemon=True).start()
+
+    # find and initialize boards, called in a background thread
+    def init_boards(self):
+        try:
+            num_boards = self.boards.call("init", self.init_spincore) if self.daemon is None else self.daemon.request("num boards")
+        except Exception as err:
+            self.boards_failed.emit(str(err))
+            return
+
+        trace_startup("boards initialized")
+        self.boards_ready.emit(num_boards)
+
+    # build the main table after boards are initialized
+    def place_table(self, num_boards):
+        self.num_boards = num_boards
+        self.table = instrTable(self.num_boards, self)
+        self.box.frame.removeWidget(self.table_placeholder)
+        self.table_placeholder.deleteLater()
+        self.box.frame.addWidget(self.table, 2, 0)
+        self.box.setEnabled(True)
+        # the hardware daemon keeps settings of an earlier client
+        self.update_sync()
+        self.scan_box.start_daq_discovery()
+        trace_startup("main table placed")
+
+    def init_failed(self, error):
+        qt.QMessageBox.warning(self, 'Board Error', error, qt.QMessageBox.Ok, qt.QMessageBox.Ok)
+        self.close()
 
     # initialize Spincore PulseBlaster boards
     def init_spincore(self):
@@ -1065,9 +2160,7 @@ class mainWindow(qt.QMainWindow):
 
             # pb_init() function has to be called before any programming/start/stop instructions
             if pb_init() != 0:
-                print("Error initializing board: %s" % pb_get_error())
-                input("Please press a key to continue.")
-                exit(-1)
+                raise RuntimeError("Error initializing board: %s" % pb_get_error())
 
             # Configure the core clock, in MHz
             pb_core_clock(100.0)
@@ -1078,7 +2171,7 @@ class mainWindow(qt.QMainWindow):
     def place_controls(self):
         ctrl_box = newBox("grid")
         ctrl_box.setTitle("General Control")
-        ctrl_box.setStyleSheet("QGroupBox{border-width: 1px; padding-top: 16px; font:13pt}QPushButton{font: 10pt}QLabel{font: 10pt}QLineEdit{font: 10pt}QCheckBox{font: 10pt}")
+        ctrl_box.setStyleSheet("QGroupBox{border-width: 1px; padding-top: 16px; font:13pt}QPushButton{font: 10pt}QLabel{font: 10pt}QLineEdit{font: 10pt}QCheckBox{font: 10pt}QComboBox{font: 10pt}")
         ctrl_box.frame.setColumnStretch(0, 1)
         ctrl_box.frame.setColumnStretch(1, 1)
         ctrl_box.frame.setColumnStretch(2, 1)
@@ -1103,7 +2196,7 @@ class mainWindow(qt.QMainWindow):
         # a pushbutton to trigger boards once
         self.soft_trig_pb = qt.QPushButton("Software Trig")
         self.soft_trig_pb.clicked[bool].connect(lambda val:self.software_trigger())
-        self.soft_trig_pb.setToolTip("Caveat: this doesn't sync multiple boards.")
+        self.soft_trig_pb.setToolTip("Caveat: this doesn't sync multiple boards, unless Board Sync is on.")
         ctrl_box.frame.addWidget(self.soft_trig_pb, 0, 3)
 
         # a pushbutton to load parameters into boards
@@ -1132,8 +2225,120 @@ class mainWindow(qt.QMainWindow):
         self.load_config_pb.clicked[bool].connect(lambda val:self.load_config())
         ctrl_box.frame.addWidget(self.load_config_pb, 1, 4)
 
+        ctrl_box.frame.addWidget(qt.QLabel("Watched Config:"), 2, 0, alignment=PyQt5.QtCore.Qt.AlignRight)
+
+        # a LineEdit to show the configuration file that's watched and reloaded when it changes
+        self.watched_le = qt.QLineEdit()
+        self.watched_le.setReadOnly(True)
+        ctrl_box.frame.addWidget(self.watched_le, 2, 1, 1, 2)
+
+        # a pushbutton to choose a configuration file to watch
+        self.watch_config_pb = qt.QPushButton("Watch Config")
+        self.watch_config_pb.clicked[bool].connect(lambda val:self.watch_config())
+        self.watch_config_pb.setToolTip("When the file changes, changed cells are applied to the table and changed boards are reprogrammed.")
+        ctrl_box.frame.addWidget(self.watch_config_pb, 2, 3)
+
+        # a pushbutton to stop watching
+        self.unwatch_config_pb = qt.QPushButton("Stop Watching")
+        self.unwatch_config_pb.clicked[bool].connect(lambda val:self.unwatch_config())
+        self.unwatch_config_pb.setEnabled(False)
+        ctrl_box.frame.addWidget(self.unwatch_config_pb, 2, 4)
+
+        # watch the file and its directory, scripts often replace a file instead of writing it
+        self.config_watcher = PyQt5.QtCore.QFileSystemWatcher(self)
+        self.config_watcher.fileChanged.connect(lambda path: self.reload_timer.start())
+        self.config_watcher.directoryChanged.connect(lambda path: self.reload_timer.start())
+        # reload once after a burst of changes
+        self.reload_timer = PyQt5.QtCore.QTimer(self)
+        self.reload_timer.setSingleShot(True)
+        self.reload_timer.setInterval(100) # ms
+        self.reload_timer.timeout.connect(self.reload_watched_config)
+        self.watched_filename = None
+        self.watched_mtime = None
+
+        ctrl_box.frame.addWidget(qt.QLabel("Config History:"), 3, 0, alignment=PyQt5.QtCore.Qt.AlignRight)
+
+        # a combobox of saved versions in the configuration history, see config_history.py
+        self.history_cb = qt.QComboBox()
+        self.history_cb.setToolTip("Every saved configuration is added to the history, unchanged ones only once.")
+        ctrl_box.frame.addWidget(self.history_cb, 3, 1, 1, 2)
+        self.update_history_cb()
+
+        # a pushbutton to show differences between a saved version and the current settings
+        self.diff_history_pb = qt.QPushButton("Diff")
+        self.diff_history_pb.clicked[bool].connect(lambda val:self.diff_history())
+        ctrl_box.frame.addWidget(self.diff_history_pb, 3, 3)
+
+        # a pushbutton to load a saved version
+        self.checkout_history_pb = qt.QPushButton("Check Out")
+        self.checkout_history_pb.clicked[bool].connect(lambda val:self.checkout_history())
+        ctrl_box.frame.addWidget(self.checkout_history_pb, 3, 4)
+
+        ctrl_box.frame.addWidget(qt.QLabel("Board Sync:"), 4, 0, alignment=PyQt5.QtCore.Qt.AlignRight)
+
+        # a combobox to choose how multiple boards start, see board_sync.py
+        self.sync_cb = newComboBox()
+        self.sync_cb.addItems(board_sync.sync_modes)
+        self.sync_cb.setToolTip(f"Master Trigger: board {board_sync.master} gets the trigger, its sync channel is wired to the trigger input of other boards.")
+        self.sync_cb.currentTextChanged[str].connect(lambda val:self.update_sync())
+        ctrl_box.frame.addWidget(self.sync_cb, 4, 1)
+
+        # a spinbox to choose the sync channel of the master board
+        self.sync_ch_sb = newSpinBox(range=(0, num_ch_per_board-1), stepsize=1)
+        self.sync_ch_sb.setPrefix("Sync Ch ")
+        self.sync_ch_sb.setValue(num_ch_per_board-1)
+        self.sync_ch_sb.valueChanged[int].connect(lambda val:self.update_sync())
+        ctrl_box.frame.addWidget(self.sync_ch_sb, 4, 2)
+
+        # a spinbox to set the trigger latency of other boards, from the sync edge to their outputs
+        self.sync_latency_sb = newSpinBox(range=(board_sync.min_duration, 100000), stepsize=10, suffix=" ns")
+        self.sync_latency_sb.setValue(board_sync.default_latency)
+        self.sync_latency_sb.setToolTip("Trigger latency of other boards, measure it from the sync edge to an output of another board.")
+        self.sync_latency_sb.valueChanged[int].connect(lambda val:self.update_sync())
+        ctrl_box.frame.addWidget(self.sync_latency_sb, 4, 3)
+
         return ctrl_box
 
+    # settings of a synchronized start of multiple boards, None if it's off
+    def sync_settings(self):
+        if self.sync_cb.currentText() == "Off":
+            return None
+
+        return {"mode": self.sync_cb.currentText(), "channel": self.sync_ch_sb.value(), "latency": self.sync_latency_sb.value()}
+
+    # programs are changed for a synchronized start when they are written to boards
+    def update_sync(self):
+        sync = self.sync_settings()
+        if self.daemon is not None:
+            try:
+                self.daemon.request("sync", sync=sync)
+            except Exception as err:
+                print(err)
+                logging.warning(err)
+        else:
+            self.boards.sync = sync
+
+    # check in the emulator that synchronized programs keep boards aligned, see board_sync.check_sync
+    def sync_sanity_check(self, instr_list):
+        sync = self.sync_settings()
+        if sync is None:
+            return True
+
+        errors = board_sync.check_sync(instr_list, sync)
+        if errors:
+            sanity_check_fail_counter.inc(check="board sync")
+            qt.QMessageBox.warning(self, 'Board Sync Error', "\n".join(errors), qt.QMessageBox.Ok, qt.QMessageBox.Ok)
+            return False
+
+        return True
+
+    def load_sync_config(self, config):
+        sync = board_sync.read_sync(config)
+        self.sync_cb.setCurrentText("Off" if sync is None else sync["mode"])
+        if sync is not None:
+            self.sync_ch_sb.setValue(sync["channel"])
+            self.sync_latency_sb.setValue(int(sync["latency"]))
+
     # load parameters to PulseBlaster boards
     def load_board(self, perform_sanity_check):
         # perform sanity check
@@ -1144,14 +2349,27 @@ class mainWindow(qt.QMainWindow):
         # compie instructions from the main table
         instr_list = self.table.compile_instr()
 
-        # write instructions to boards
-        for j, instr_single_board in enumerate(instr_list):
-            pb_select_board(j)
-            pb_start_programming(PULSE_PROGRAM)
-            for i in range(len(instr_single_board)):
-                instr = instr_single_board[i]
-                pb_inst_pbonly(*instr[1:5])
-            pb_stop_programming()
+        if perform_sanity_check and not self.sync_sanity_check(instr_list):
+            return
+
+        self.write_boards(instr_list, wait=False)
+
+    # write compiled instructions to PulseBlaster boards, boards: indices of boards to write, None for all
+    # priority: board_queue.SCAN in the scan path, so it runs before interactive commands
+    # wait: wait until boards are written, otherwise return at once, then a newer upload replaces this one if it hasn't started
+    # skip_unchanged: skip boards that already have their program, see board_queue.boardQueue.write
+    def write_boards(self, instr_list, boards=None, priority=board_queue.INTERACTIVE, wait=True, skip_unchanged=False):
+        load_board_counter.inc()
+        t0 = time.perf_counter()
+
+        if self.daemon is not None:
+            self.daemon.request("write", **{"instr list": instr_list, "boards": boards, "skip unchanged": skip_unchanged})
+            load_board_hist.observe(time.perf_counter()-t0)
+            return
+
+        self.boards.write(instr_list, boards, priority, wait, skip_unchanged)
+        if wait:
+            load_board_hist.observe(time.perf_counter()-t0)
 
         # for j, instr_single_board in enumerate(instr_list):
         #     for i in range(len(instr_single_board)):
@@ -1164,12 +2382,22 @@ class mainWindow(qt.QMainWindow):
         else:
             self.scan_box.show()
 
+    # stop, reset and restart boards, to make them ready to be triggered
+    def restart_boards(self):
+        if self.daemon is not None:
+            self.daemon.request("restart boards")
+            return
+
+        self.boards.restart(self.num_boards)
+
     # trigger PulseBlaster boards
     def software_trigger(self):
+        if self.daemon is not None:
+            self.daemon.request("software trigger")
+            return
+
         # multiple boards won't be trigger at the same time
-        for i in range(self.num_boards):
-            pb_select_board(i)
-            pb_start()
+        self.boards.software_trigger(self.num_boards)
 
     # save configurations to a local file
     def save_config(self):
@@ -1195,7 +2423,16 @@ class mainWindow(qt.QMainWindow):
         if not os.path.exists(dir_name):
             os.mkdir(dir_name)
 
-        # create config
+        config = self.compile_config()
+        configfile = open(filename, "w")
+        config.write(configfile)
+        configfile.close()
+
+        self.update_config_index()
+        self.commit_history(config, filename)
+
+    # compile the settings in the GUI into a configparser object, in the format of saved configuration files
+    def compile_config(self):
         config = configparser.ConfigParser(allow_no_value=True)
         config.optionxform = str
 
@@ -1205,6 +2442,9 @@ class mainWindow(qt.QMainWindow):
         config["General settings"][f"# from channel {num_ch_per_board-1} to channel 0"] = None
         for i in range(self.num_boards):
             config["General settings"][f"board {i} connections"] = ", ".join(self.table.compile_note_col()[i*num_ch_per_board:(i+1)*num_ch_per_board][::-1])
+        config["General settings"]["board sync"] = self.sync_cb.currentText()
+        config["General settings"]["sync channel"] = str(self.sync_ch_sb.value())
+        config["General settings"]["trigger latency (ns)"] = str(self.sync_latency_sb.value())
 
         instr_list = self.table.compile_instr()
         for j, instr in enumerate(instr_list[0]):
@@ -1223,15 +2463,208 @@ class mainWindow(qt.QMainWindow):
         config["Scanner settings"]["repetition number"] = str(self.scan_box.rep_num_sb.value())
         config["Scanner settings"]["number of scan instr"] = str(self.scan_box.table.num_cols)
         config["Scanner settings"]["randomize sequence"] = str(self.scan_box.random_chb.isChecked())
+        config["Scanner settings"]["scan order"] = self.scan_box.order_cb.currentText()
+        config["Scanner settings"]["dwell number"] = str(self.scan_box.dwell_num_sb.value())
+        config["Scanner settings"]["trigger source"] = self.scan_box.trigger_cb.currentText()
         config["Scanner settings"]["DAQ DI channel"] = self.scan_box.daq_ch_le.text()
+        config["Scanner settings"]["DAQ edge counter"] = self.scan_box.daq_ctr_le.text()
+        config["Scanner settings"]["interleave pattern"] = self.scan_box.interleave_le.text()
+        config["Scanner settings"]["interleaved configs"] = ", ".join(self.scan_box.interleave_filenames)
+        config["Scanner settings"]["scan mode"] = self.scan_box.scan_mode_cb.currentText()
+        config["Scanner settings"]["feedback port"] = str(self.scan_box.feedback_port_sb.value())
+        config["Scanner settings"]["optimize for"] = self.scan_box.optimize_cb.currentText()
 
         scan_instr_list = self.scan_box.table.compile_scan_instr()
         for i, scan_instr in enumerate(scan_instr_list):
             config[f"Scan Instr {i}"] = scan_instr
 
-        configfile = open(filename, "w")
-        config.write(configfile)
-        configfile.close()
+        return config
+
+    # incrementally update the index of saved configurations and sequences, see config_index.py.
+    # It walks and hashes both directories, so it's deferred and runs in a background thread, e.g. not when a scan starts.
+    def update_config_index(self):
+        self.index_timer.start()
+
+    def start_config_index_update(self):
+        # one update at a time, a save during an update is indexed by the next one
+        if (self.index_thread is not None) and self.index_thread.is_alive():
+            self.index_timer.start()
+            return
+
+        self.index_thread = threading.Thread(target=self.run_config_index_update, daemon=True, name="config index")
+        self.index_thread.start()
+
+    # called in a background thread
+    def run_config_index_update(self):
+        try:
+            db = config_index.open_index()
+            config_index.update_index(db)
+            db.close()
+        except Exception as err:
+            logging.warning(err)
+
+    # add a version to the configuration history, see config_history.py. An unchanged configuration isn't added again.
+    def commit_history(self, config, name):
+        try:
+            db = config_history.open_history()
+            version, new = config_history.commit(db, config, name)
+            db.close()
+        except Exception as err:
+            print(err)
+            logging.warning(err)
+            return
+
+        if new:
+            self.history_cb.insertItem(0, self.history_item_text(version, time.time(), name), version)
+        self.history_cb.setCurrentIndex(self.history_cb.findData(version))
+
+    def history_item_text(self, version, t, name):
+        return f"{version}: {time.strftime('%m/%d %H:%M:%S', time.localtime(t))} {os.path.basename(name)}"
+
+    # fill the combobox of history versions, newest first
+    def update_history_cb(self):
+        self.history_cb.clear()
+        try:
+            db = config_history.open_history()
+            versions = config_history.log(db, limit=500)
+            db.close()
+        except Exception as err:
+            print(err)
+            logging.warning(err)
+            return
+
+        for version, t, name in versions:
+            self.history_cb.addItem(self.history_item_text(version, t, name), version)
+
+    # show differences between the selected history version and the settings in the GUI
+    def diff_history(self):
+        version = self.history_cb.currentData()
+        if (version is None) or (self.table is None):
+            return
+
+        try:
+            db = config_history.open_history()
+            lines = config_history.format_changes(config_history.diff_config(db, version, self.compile_config()))
+            db.close()
+        except Exception as err:
+            print(err)
+            logging.warning(err)
+            return
+
+        msg = qt.QMessageBox(self)
+        msg.setWindowTitle("Config history")
+        if lines:
+            msg.setText(f"{len(lines)} change(s) from version {version} to the current settings.")
+            msg.setDetailedText("\n".join(lines))
+        else:
+            msg.setText(f"The current settings are the same as version {version}.")
+        msg.exec_()
+
+    # load the selected history version into the GUI. If the number of instructions is the same, only changed cells are updated.
+    def checkout_history(self):
+        version = self.history_cb.currentData()
+        if (version is None) or (self.table is None):
+            return
+
+        if self.scan_box.scanning:
+            qt.QMessageBox.warning(self, 'Config history', "Error: Can't check out a configuration during a scan.",
+                                    qt.QMessageBox.Ok, qt.QMessageBox.Ok)
+            return
+
+        try:
+            db = config_history.open_history()
+            config = config_history.checkout(db, version)
+            db.close()
+        except Exception as err:
+            print(err)
+            logging.warning(err)
+            return
+
+        if self.table.apply_config_diff(config) is None:
+            self.table.load_config(config)
+        self.load_sync_config(config)
+        self.scan_box.load_config(config)
+
+    # choose a configuration file to watch, it's loaded now and whenever it changes
+    def watch_config(self):
+        filename, _ = qt.QFileDialog.getOpenFileName(self, "Watch configs", "saved_configs/", "All Files (*);;INI File (*.ini)")
+        if not filename:
+            return
+
+        self.unwatch_config()
+        self.watched_filename = os.path.abspath(filename)
+        self.watched_mtime = None
+        self.config_watcher.addPath(self.watched_filename)
+        self.config_watcher.addPath(os.path.dirname(self.watched_filename))
+        self.watched_le.setText(filename)
+        self.watched_le.setCursorPosition(0)
+        self.unwatch_config_pb.setEnabled(True)
+
+        self.reload_watched_config()
+
+    def unwatch_config(self):
+        paths = self.config_watcher.files() + self.config_watcher.directories()
+        if paths:
+            self.config_watcher.removePaths(paths)
+        self.watched_filename = None
+        self.watched_le.setText("")
+        self.unwatch_config_pb.setEnabled(False)
+
+    # apply changes of the watched configuration to the table, and reprogram boards whose instructions changed
+    def reload_watched_config(self):
+        filename = self.watched_filename
+        if (filename is None) or (not os.path.exists(filename)) or (self.table is None):
+            return
+
+        # a replaced file has to be watched again
+        if filename not in self.config_watcher.files():
+            self.config_watcher.addPath(filename)
+
+        # the directory changes for other files too
+        mtime = os.stat(filename).st_mtime
+        if mtime == self.watched_mtime:
+            return
+        self.watched_mtime = mtime
+
+        try:
+            config = pb_program.read_config(filename)
+            if timeline.is_timeline(config):
+                config = timeline.timeline_config(config)
+            # during a scan, the table only shows the new config if the running scan can take it
+            if self.scan_box.scanning:
+                instr_list = self.table.config_diff_instr(config)
+                if instr_list is None:
+                    print(f"Watched config ({filename}) has a different number of instructions, it's not applied during a scan.")
+                    return
+                error = self.scan_box.program_update_error(instr_list)
+                if error:
+                    print(f"Watched config ({filename}) isn't applied: {error}")
+                    return
+                if not self.table.instr_sanity_check(op_code_check=True, pulse_width_check=True, instr_list=instr_list):
+                    return
+            changed_boards = self.table.apply_config_diff(config)
+            if changed_boards is None:
+                self.table.load_config(config)
+                changed_boards = list(range(self.num_boards))
+        except Exception as err:
+            print(f"Can't apply watched config ({filename}): {err}")
+            logging.warning(err)
+            return
+
+        if not changed_boards:
+            return
+
+        if not self.table.instr_sanity_check(op_code_check=True, pulse_width_check=True):
+            return
+
+        instr_list = self.table.compile_instr()
+        # during a scan, the new program is loaded with the next scan element, at the next WAIT
+        if self.scan_box.scanning:
+            if self.scan_box.update_program(instr_list):
+                print(f"Watched config reloaded, board(s) {changed_boards} are reprogrammed with the next scan element.")
+        else:
+            self.write_boards(instr_list, changed_boards, wait=False)
+            print(f"Watched config reloaded, board(s) {changed_boards} reprogrammed.")
 
     # load parameters from a local configuration file
     def load_config(self):
@@ -1243,7 +2676,18 @@ class mainWindow(qt.QMainWindow):
         config.optionxform = str
         config.read(filename)
 
+        # a timeline file (see timeline.py) is compiled into instructions, scanner settings are unchanged
+        if timeline.is_timeline(config):
+            try:
+                config = timeline.timeline_config(config)
+            except (timeline.timelineError, ValueError, KeyError) as err:
+                qt.QMessageBox.warning(self, 'Timeline error', str(err), qt.QMessageBox.Ok, qt.QMessageBox.Ok)
+                return
+            self.table.load_config(config)
+            return
+
         self.table.load_config(config)
+        self.load_sync_config(config)
         self.scan_box.load_config(config)
 
     # Re-difine closeEvent. Ask before closing if the program is scanning
@@ -1264,16 +2708,48 @@ class mainWindow(qt.QMainWindow):
 
 
 if __name__ == '__main__':
-    app = qt.QApplication(sys.argv)
+    # optional command line arguments, other arguments are passed to Qt
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--metrics-port", type=int, default=None, help="serve metrics on http://127.0.0.1:<port>/metrics")
+    arg_parser.add_argument("--startup-trace", action="store_true", help="print how long each startup phase takes")
+    arg_parser.add_argument("--daemon", type=int, nargs="?", const=pb_daemon.default_port, default=None, metavar="PORT",
+                            help="control boards through the hardware daemon (pb_daemon.py)")
+    arg_parser.add_argument("--boards", default=None, help="with --daemon: control only these boards, comma separated, e.g. 0,1")
+    arg_parser.add_argument("--session", default=None, help="with --boards: name of the scan session, e.g. the sub-experiment")
+    args, qt_args = arg_parser.parse_known_args()
+    print_startup_trace = args.startup_trace
+    trace_startup("modules imported")
+    if args.metrics_port is not None:
+        metrics.enable(args.metrics_port)
+
+    daemon = None
+    if args.daemon is not None:
+        daemon = pb_daemon.daemonClient(args.daemon)
+        # several windows can scan disjoint groups of boards at the same time
+        if args.boards:
+            try:
+                daemon.claim([int(x) for x in args.boards.split(",") if x.strip()], args.session)
+            except (RuntimeError, ValueError) as err:
+                print(f"Can't control boards {args.boards}: {err}")
+                sys.exit(1)
+    elif args.boards:
+        arg_parser.error("--boards needs --daemon")
+
+    app = qt.QApplication(sys.argv[:1] + qt_args)
     # screen = app.screens()
     # monitor_dpi = screen[0].physicalDotsPerInch()
     monitor_dpi = 96
     app.setStyleSheet(qdarkstyle.load_stylesheet_pyqt5())
+    trace_startup("style sheet loaded")
     
-    prog = mainWindow(app)
+    prog = mainWindow(app, daemon)
     app.exec_()
 
-    # pb_close function has to be called at the end of any programming/start/stop instructions
-    pb_close()
+    # boards owned by the hardware daemon keep running
+    if daemon is not None:
+        daemon.close()
+    else:
+        # pb_close function has to be called at the end of any programming/start/stop instructions
+        prog.boards.close()
 
     sys.exit()
\ No newline at end of file
@@ -0,0 +1,152 @@
+# An opt-in metrics registry, served in Prometheus text format from a local HTTP port.
+# Metrics are only recorded after enable() is called, otherwise counters and histograms do nothing.
+#
+# Usage:
+#   import metrics
+#   load_counter = metrics.new_counter("pb_load_board_calls_total", "Number of load_board calls.")
+#   load_counter.inc()
+#   metrics.enable(port=9108) # serve http://127.0.0.1:9108/metrics
+
+import threading, time, bisect
+import http.server
+
+enabled = False
+registry = {} # metric name: metric object
+lock = threading.Lock()
+
+# default histogram buckets in seconds, from 100 us to 10 s
+default_buckets = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+# format labels as {board="0",check="pulse width"}
+def format_labels(labels, extra=None):
+    items = list(labels)
+    if extra:
+        items.append(extra)
+    if not items:
+        return ""
+
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+# a monotonically increasing counter
+class counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {} # sorted tuple of labels: value
+
+    def inc(self, amount=1, **labels):
+        if not enabled:
+            return
+
+        key = tuple(sorted(labels.items()))
+        with lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, val in sorted(self.values.items()):
+            lines.append(f"{self.name}{format_labels(key)} {val}")
+
+        return lines
+
+# a histogram with fixed buckets, e.g. for latencies in seconds
+class histogram:
+    def __init__(self, name, help, buckets=default_buckets):
+        self.name = name
+        self.help = help
+        self.buckets = sorted(buckets)
+        self.values = {} # sorted tuple of labels: [bucket counts, sum, count]
+
+    def observe(self, value, **labels):
+        if not enabled:
+            return
+
+        key = tuple(sorted(labels.items()))
+        with lock:
+            if key not in self.values:
+                self.values[key] = [[0]*(len(self.buckets)+1), 0.0, 0]
+            data = self.values[key]
+            data[0][bisect.bisect_left(self.buckets, value)] += 1
+            data[1] += value
+            data[2] += 1
+
+    # a context manager to time a block of code, e.g. "with hist.time(board=0):"
+    def time(self, **labels):
+        return timer(self, labels)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (bucket_counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for upper, num in zip(self.buckets, bucket_counts):
+                cumulative += num
+                lines.append(f"{self.name}_bucket{format_labels(key, ('le', upper))} {cumulative}")
+            lines.append(f"{self.name}_bucket{format_labels(key, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{format_labels(key)} {count}")
+
+        return lines
+
+class timer:
+    def __init__(self, hist, labels):
+        self.hist = hist
+        self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter()-self.t0, **self.labels)
+        return False
+
+# register a metric, or return the existing one of the same name
+def register(metric):
+    with lock:
+        return registry.setdefault(metric.name, metric)
+
+def new_counter(name, help):
+    return register(counter(name, help))
+
+def new_histogram(name, help, buckets=default_buckets):
+    return register(histogram(name, help, buckets))
+
+# all metrics in Prometheus text exposition format
+def expose():
+    lines = []
+    with lock:
+        for metric in registry.values():
+            lines += metric.expose()
+
+    return "\n".join(lines) + "\n"
+
+class metricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ["/", "/metrics"]:
+            self.send_error(404)
+            return
+
+        body = expose().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # don't print every request to the console
+    def log_message(self, format, *args):
+        pass
+
+# start recording metrics, and serve them on localhost if a port is given
+def enable(port=None):
+    global enabled
+    enabled = True
+
+    if port is None:
+        return None
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), metricsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    return server
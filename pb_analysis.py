@@ -0,0 +1,189 @@
+# Static control-flow analysis of a compiled program (in the format of instrTable.compile_instr()), without running it.
+# It checks LOOP/END_LOOP pairing and nesting, BRANCH and JSR targets, RTS reachability and WAIT placement,
+# and computes the time between WAITs in one pass over the main path: every instruction counts its duration
+# times the loop counts of the loops around it. pb_emulator.py runs a program instead, and should agree with the results here.
+
+import numpy as np
+from pb_emulator import STOP, LOOP, END_LOOP, JSR, RTS, BRANCH, LONG_DELAY, WAIT, max_loop_depth, max_subroutine_depth
+
+class analysisError(Exception):
+    pass
+
+# analyze a program of one board, return a dictionary:
+#   "errors", "warnings": lists of messages
+#   "preamble": time (ns) from program start to the first WAIT, None if there's no WAIT
+#   "segments": times (ns) from every WAIT (when triggered) to the next WAIT, or to STOP
+#   "cycle time": time (ns) of one repetition of the program (from the BRANCH target to the BRANCH), None if it doesn't repeat
+#   "waits per cycle": number of WAITs in one repetition, i.e. triggers needed per repetition
+#   "exact": False if loops or subroutines around WAIT or BRANCH prevent computing the times above
+def analyze(instr_list_single_board):
+    program = [(int(instr[2]), int(instr[3]), float(instr[4])) for instr in instr_list_single_board]
+    result = {"errors": [], "warnings": [], "preamble": None, "segments": [], "cycle time": None, "waits per cycle": 0, "exact": True}
+    errors = result["errors"]
+    warnings = result["warnings"]
+    num_instr = len(program)
+    if num_instr == 0:
+        errors.append("Error: The program has no instructions.")
+        return result
+
+    # LOOP/END_LOOP pairing and nesting, op data of other op codes, in address order
+    loop_of = {} # address of END_LOOP: address of its LOOP
+    stack = []
+    for addr, (op_code, op_data, duration) in enumerate(program):
+        if op_code == LOOP:
+            if op_data < 1:
+                errors.append(f"Error (Instr {addr}): LOOP needs op data (loop count) of at least 1.")
+            stack.append(addr)
+            if len(stack) > max_loop_depth:
+                errors.append(f"Error (Instr {addr}): More than {max_loop_depth} nested loops.")
+        elif op_code == END_LOOP:
+            if not stack:
+                errors.append(f"Error (Instr {addr}): END_LOOP without LOOP.")
+            elif op_data != stack[-1]:
+                errors.append(f"Error (Instr {addr}): END_LOOP op data ({op_data}) should be the address of its LOOP ({stack[-1]}).")
+                stack.pop()
+            else:
+                loop_of[addr] = stack.pop()
+        elif op_code in [BRANCH, JSR]:
+            if not (0 <= op_data < num_instr):
+                errors.append(f"Error (Instr {addr}): {'BRANCH' if op_code == BRANCH else 'JSR'} op data {op_data} is not a valid instruction address.")
+        elif op_code == LONG_DELAY:
+            if op_data < 2:
+                errors.append(f"Error (Instr {addr}): LONG_DELAY needs op data of at least 2.")
+
+    for addr in stack:
+        errors.append(f"Error (Instr {addr}): LOOP isn't closed by an END_LOOP.")
+
+    if errors:
+        return result
+
+    # loop depth of every instruction, to find BRANCH and WAIT inside loops
+    depth = np.zeros(num_instr, dtype=int)
+    for end, start in loop_of.items():
+        depth[start:end+1] += 1
+
+    reached = set()
+    sub_times = {} # address of subroutine: its time in ns
+
+    # time of a subroutine from its first instruction to RTS
+    def subroutine(start, level):
+        if start in sub_times:
+            return sub_times[start]
+        if level > max_subroutine_depth:
+            raise analysisError(f"Error (Instr {start}): More than {max_subroutine_depth} nested subroutines.")
+
+        t = 0
+        mult = [1]
+        addr = start
+        while True:
+            if addr >= num_instr:
+                raise analysisError(f"Error (Instr {start}): Subroutine runs past the last instruction without RTS.")
+            reached.add(addr)
+            op_code, op_data, duration = program[addr]
+
+            if op_code == LOOP:
+                mult.append(mult[-1]*op_data)
+            if op_code == LONG_DELAY:
+                t += duration*op_data*mult[-1]
+            else:
+                t += duration*mult[-1]
+            if op_code == END_LOOP:
+                mult.pop()
+
+            if op_code == RTS:
+                break
+            elif op_code in [STOP, BRANCH]:
+                raise analysisError(f"Error (Instr {addr}): Subroutine starting at Instr {start} doesn't return, it reaches {'STOP' if op_code == STOP else 'BRANCH'}.")
+            elif op_code == WAIT:
+                warnings.append(f"Warning (Instr {addr}): WAIT inside a subroutine, time between WAITs isn't computed.")
+                result["exact"] = False
+            elif op_code == JSR:
+                t += subroutine(op_data, level+1)*mult[-1]
+            addr += 1
+
+        sub_times[start] = t
+        return t
+
+    # walk the main path once, from address 0
+    first_visit = {} # address: time of its first execution
+    waits = [] # times of WAITs
+    t = 0
+    mult = [1]
+    addr = 0
+    cycle_start = None
+    try:
+        while True:
+            if addr >= num_instr:
+                raise analysisError("Error: The program runs past the last instruction.")
+            reached.add(addr)
+            first_visit.setdefault(addr, t)
+            op_code, op_data, duration = program[addr]
+
+            if op_code == WAIT:
+                if addr == 0:
+                    raise analysisError("Error: The first instruction can't have Op code WAIT.")
+                if depth[addr] > 0:
+                    warnings.append(f"Warning (Instr {addr}): WAIT inside a loop, time between WAITs isn't computed.")
+                    result["exact"] = False
+                # the board stops before this instruction until a trigger
+                waits.append(t)
+
+            if op_code == LOOP:
+                mult.append(mult[-1]*op_data)
+            if op_code == LONG_DELAY:
+                t += duration*op_data*mult[-1]
+            else:
+                t += duration*mult[-1]
+            if op_code == END_LOOP:
+                mult.pop()
+
+            if op_code == STOP:
+                break
+            elif op_code == RTS:
+                raise analysisError(f"Error (Instr {addr}): RTS is reached without JSR.")
+            elif op_code == JSR:
+                t += subroutine(op_data, 1)*mult[-1]
+                addr += 1
+            elif op_code == BRANCH:
+                if depth[addr] > 0:
+                    warnings.append(f"Warning (Instr {addr}): BRANCH inside a loop, time between WAITs isn't computed.")
+                    result["exact"] = False
+                # the program repeats from here on
+                if op_data in first_visit:
+                    cycle_start = op_data
+                    break
+                addr = op_data
+            else:
+                addr += 1
+
+    except analysisError as err:
+        errors.append(str(err))
+        return result
+
+    for addr, (op_code, op_data, duration) in enumerate(program):
+        if (op_code == RTS) and (addr not in reached):
+            warnings.append(f"Warning (Instr {addr}): RTS is never reached from a JSR.")
+
+    if not waits:
+        warnings.append("Warning: The program has no WAIT instruction on its main path, it can't be triggered by the scanner.")
+    if not result["exact"]:
+        return result
+
+    # time between WAITs, the last WAIT is followed by the first WAIT after the BRANCH target
+    if waits:
+        result["preamble"] = waits[0]
+        result["segments"] = [b-a for a, b in zip(waits[:-1], waits[1:])]
+        if cycle_start is None:
+            result["segments"].append(t-waits[-1])
+        else:
+            repeated = [w for w in waits if w >= first_visit[cycle_start]]
+            result["waits per cycle"] = len(repeated)
+            if repeated:
+                result["segments"].append(t-waits[-1]+repeated[0]-first_visit[cycle_start])
+            else:
+                warnings.append(f"Warning: The program repeats from Instr {cycle_start} without WAIT.")
+
+    if cycle_start is not None:
+        result["cycle time"] = t-first_visit[cycle_start]
+
+    return result
@@ -0,0 +1,417 @@
+# A hardware-control daemon: a separate process that owns PulseBlaster boards and the DAQ trigger task.
+# It runs at elevated scheduling priority, so board reprogramming in every cycle isn't stalled by GUI activity.
+# The GUI (main.py --daemon) is a client over a local connection. The GUI can be closed and restarted without resetting boards.
+# Several clients can be connected, each can claim a group of boards and run its own scan session on them (scanSession).
+#
+# Usage:
+#   python pb_daemon.py                  # control real boards
+#   python pb_daemon.py --emulator 2     # control 2 emulated boards (pb_emulator.py), e.g. for testing
+#   python pb_daemon.py --trace scan.pbt # record every SpinAPI call, see pb_trace.py
+#   python main.py --daemon
+#   python main.py --daemon --boards 0 --session A   # two independent scanners, each over its own group of boards
+#   python main.py --daemon --boards 1 --session B
+
+import os, sys, time, threading, logging, argparse, ctypes, secrets
+from multiprocessing.connection import Listener, Client
+import pb_program
+import scan_engine
+import daq_trigger
+import trigger_sources
+import board_queue
+
+default_port = 6340
+
+# Connections are authenticated by a key, because requests are unpickled by a process at raised priority.
+# The daemon uses the key in environment variable PB_DAEMON_AUTHKEY if it's set, otherwise it generates a random key at start
+# and writes it to a file in the home directory that only the user can read. Clients read the key from the same place.
+def authkey_file(port):
+    return os.path.join(os.path.expanduser("~"), f".pb_daemon_{port}.key")
+
+# the key of a daemon, and whether it's generated (then it's saved with save_authkey once the daemon listens)
+def daemon_authkey():
+    if os.environ.get("PB_DAEMON_AUTHKEY"):
+        return os.environ["PB_DAEMON_AUTHKEY"].encode("utf-8"), False
+
+    return secrets.token_hex(32).encode("utf-8"), True
+
+def save_authkey(port, key):
+    filename = authkey_file(port)
+    if os.path.exists(filename):
+        os.remove(filename) # a new file gets the permissions below, an existing one keeps its own
+    fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(key.decode("utf-8"))
+
+def client_authkey(port):
+    if os.environ.get("PB_DAEMON_AUTHKEY"):
+        return os.environ["PB_DAEMON_AUTHKEY"].encode("utf-8")
+
+    try:
+        with open(authkey_file(port)) as f:
+            return f.read().strip().encode("utf-8")
+    except OSError as err:
+        raise RuntimeError(f"Can't read the key of the hardware daemon on port {port} ({err}), is the daemon running?")
+
+# raise the scheduling priority of this process, as far as allowed
+def raise_priority():
+    try:
+        if sys.platform == "win32":
+            HIGH_PRIORITY_CLASS = 0x00000080
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), HIGH_PRIORITY_CLASS)
+            return "high priority class"
+
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(10))
+            return "SCHED_FIFO"
+        except (AttributeError, PermissionError, OSError):
+            os.nice(-10)
+            return "nice -10"
+
+    except Exception as err:
+        logging.warning(f"Can't raise process priority: {err}")
+        return "normal"
+
+# a scan over a group of boards, with its own trigger source, sequence, checkpoint and progress.
+# Sessions over disjoint groups run at the same time, their uploads go through the board queue one board at a time.
+class scanSession:
+    # boards: physical boards of the group, in the order of the session's instruction lists, None for all boards
+    def __init__(self, daemon, name, boards=None):
+        self.daemon = daemon
+        self.name = name
+        self.boards = boards
+        self.engine = scan_engine.scanEngine(lambda instr_list, skip_unchanged=False:
+                                                  daemon.write_boards(instr_list, priority=board_queue.SCAN, group=self.boards, skip_unchanged=skip_unchanged))
+        self.task = None
+        self.edge_counter = None
+        self.checkpoint = None
+        self.scanning = False
+
+    # start to scan, see scannerBox.start_scan_loop in main.py
+    # checkpoint: arguments of pb_program.scanCheckpoint.start, preceded by the checkpoint file name, or None
+    # trigger_source: a source in trigger_sources.sources, daq_ch is its address
+    def start(self, instr_list, scan_sequence_list, programs, program_index, counter, daq_ch, daq_ctr, checkpoint=None,
+              trigger_source="DAQ Change Detection"):
+        self.stop()
+
+        self.task = trigger_sources.new_source(trigger_source, daq_ch)
+        self.edge_counter = daq_trigger.edgeCounter(daq_ctr) if daq_ctr else None
+        self.engine.start(instr_list, scan_sequence_list, programs, program_index, counter, self.edge_counter)
+        if checkpoint is not None:
+            self.checkpoint = pb_program.scanCheckpoint(checkpoint[0])
+            self.checkpoint.start(*checkpoint[1:])
+
+        self.daemon.restart_boards(self.boards)
+
+        # load the first scan parameter
+        self.on_trigger()
+
+        if self.edge_counter is not None:
+            self.edge_counter.start()
+
+        # a rising edge of the "WAITING" signal triggers loading
+        self.scanning = True
+        self.task.start(self.on_trigger)
+
+    # load parameters into boards, called in every cycle
+    def on_trigger(self, task_handle=None, signal_type=None, callback_data=None):
+        task = self.task
+        time.sleep(task.debounce if task is not None else 0) # seconds, important in the case of trigger signal has oscillations at rising/falling edge
+
+        index = self.engine.step(from_trigger=task_handle is not None)
+        # element index runs at the next trigger, loading it means the element before it has run
+        if index is not None:
+            if self.checkpoint is not None:
+                self.checkpoint.update(index-1)
+        elif self.engine.finished:
+            if self.checkpoint is not None:
+                self.checkpoint.update(self.engine.length-1)
+            self.stop()
+
+        # return an int is necessary for DAQ callback function
+        return 0
+
+    def stop(self):
+        for task in [self.task, self.edge_counter]:
+            if task is None:
+                continue
+            try:
+                if task is self.task:
+                    task.stop()
+                    task.close()
+                else:
+                    task.close()
+            except Exception as err:
+                logging.warning(err)
+
+        self.task = None
+        self.edge_counter = None
+        self.engine.edge_counter = None
+        if self.checkpoint is not None:
+            self.checkpoint.close()
+            self.checkpoint = None
+        self.scanning = False
+
+    def status(self):
+        return {"scanning": self.scanning,
+                "counter": self.engine.counter,
+                "length": self.engine.length,
+                "finished": self.engine.finished,
+                "cycle accounting": self.engine.cycle_accounting.summary(),
+                "boards": self.boards}
+
+class hardwareDaemon:
+    # api: the spinapi module, or an object with the same functions (e.g. pb_emulator.emulator)
+    def __init__(self, api):
+        self.api = api
+        self.queue = board_queue.boardQueue(api) # serializes board access between trigger callbacks and client requests
+        self.num_boards = 0
+        self.lock = threading.Lock()
+        self.sessions = {} # name: scanSession
+        self.clients = [] # one dictionary per connected client: {"boards": claimed boards or None, "session": name}
+
+    # initialize PulseBlaster boards, the same way as mainWindow.init_spincore
+    def init_boards(self):
+        return self.queue.call("init", self.init_spincore)
+
+    def init_spincore(self):
+        self.api.pb_set_debug(1)
+        self.num_boards = self.api.pb_count_boards()
+
+        print(f"Using SpinAPI Library version {self.api.pb_get_version()}")
+        print(f"Found {self.num_boards} board(s) in the system.")
+
+        for i in range(self.num_boards):
+            self.api.pb_select_board(i)
+
+            # pb_init() function has to be called before any programming/start/stop instructions
+            if self.api.pb_init() != 0:
+                raise RuntimeError(f"Error initializing board: {self.api.pb_get_error()}")
+
+            # Configure the core clock, in MHz
+            self.api.pb_core_clock(100.0)
+
+        return self.num_boards
+
+    # write compiled instructions to boards. boards: indices (in instr_list) of boards to write, None for all
+    # group: physical boards of the items in instr_list, None if item j is board j
+    # skip_unchanged: skip boards that already have their program, see board_queue.boardQueue.write
+    def write_boards(self, instr_list, boards=None, priority=board_queue.INTERACTIVE, group=None, skip_unchanged=False):
+        if group is not None:
+            boards = [group[k] for k in (range(min(len(instr_list), len(group))) if boards is None else boards)]
+            physical = [None] * self.num_boards
+            for k, j in enumerate(group[:len(instr_list)]):
+                physical[j] = instr_list[k]
+            instr_list = physical
+        self.queue.write(instr_list, boards, priority, skip_unchanged=skip_unchanged)
+
+    # stop, reset and restart boards (of a group, None for all), to make them ready to be triggered
+    def restart_boards(self, group=None):
+        self.queue.restart(self.num_boards, boards=group)
+
+    # trigger boards once, multiple boards won't be trigger at the same time, unless they are synchronized (see board_sync.py)
+    def software_trigger(self, group=None):
+        self.queue.software_trigger(self.num_boards, boards=group)
+
+    # claim a group of boards for a client, groups of connected clients can't overlap. Return the number of boards in the group.
+    def claim(self, client, boards, session=None):
+        boards = sorted(set(int(j) for j in boards))
+        if not boards or not all(0 <= j < self.num_boards for j in boards):
+            raise ValueError(f"Boards {boards} don't exist, there are {self.num_boards} board(s).")
+
+        session = session or f"boards {', '.join(str(j) for j in boards)}"
+        with self.lock:
+            # clients that haven't claimed boards don't hold any, a running session holds its boards until it stops
+            for other in self.clients + [{"boards": s.boards, "session": s.name} for s in self.sessions.values() if s.scanning]:
+                if (other is client) or (other["session"] == session) or ((other["boards"] is None) and (other in self.clients)):
+                    continue
+                used = set(range(self.num_boards) if other["boards"] is None else other["boards"])
+                if used & set(boards):
+                    raise ValueError(f"Board(s) {sorted(used & set(boards))} are used by session {other['session']}.")
+            client["boards"] = boards
+            client["session"] = session
+
+        return len(boards)
+
+    # raise an error if a client's command would touch boards (physical indices, None for all) that a running session
+    # of another client scans, e.g. a client that hasn't claimed boards writes every board
+    def check_boards(self, client, boards):
+        boards = set(range(self.num_boards) if boards is None else boards)
+        with self.lock:
+            for other in self.sessions.values():
+                used = set(range(self.num_boards) if other.boards is None else other.boards)
+                if other.scanning and (other.name != client["session"]) and (used & boards):
+                    raise ValueError(f"Board(s) {sorted(used & boards)} are scanned by session {other.name}.")
+
+    # start a scan session over a group of boards, None for all. Groups of running sessions can't overlap.
+    def start_scan(self, instr_list, scan_sequence_list, programs, program_index, counter, daq_ch, daq_ctr, checkpoint=None,
+                   trigger_source="DAQ Change Detection", session="default", group=None):
+        with self.lock:
+            if session in self.sessions:
+                self.sessions[session].stop()
+            boards = set(range(self.num_boards) if group is None else group)
+            for other in self.sessions.values():
+                used = set(range(self.num_boards) if other.boards is None else other.boards)
+                if other.scanning and (other.name != session) and (used & boards):
+                    raise ValueError(f"Board(s) {sorted(used & boards)} are scanned by session {other.name}.")
+            self.sessions[session] = scanSession(self, session, group)
+
+        self.sessions[session].start(instr_list, scan_sequence_list, programs, program_index, counter, daq_ch, daq_ctr,
+                                     checkpoint, trigger_source)
+
+    # stop a scan session, None for all
+    def stop_scan(self, session=None):
+        for name, s in list(self.sessions.items()):
+            if (session is None) or (name == session):
+                s.stop()
+
+    # status of a session, and a summary of every session
+    def status(self, session="default"):
+        s = self.sessions.get(session)
+        result = s.status() if s is not None else {"scanning": False, "counter": 0, "length": 0, "finished": False,
+                                                   "cycle accounting": {}, "boards": None}
+        result["board queue"] = self.queue.summary()
+        result["sessions"] = {name: {"boards": s.boards, "scanning": s.scanning, "counter": s.engine.counter, "length": s.engine.length}
+                              for name, s in list(self.sessions.items())}
+
+        return result
+
+    # handle a request from a client, return its result
+    # client: the client's claimed boards and session name, instruction lists and board indices of its requests are within its group
+    def handle(self, request, client=None):
+        client = client or {"boards": None, "session": "default"}
+        group = client["boards"]
+        cmd = request["cmd"]
+        if cmd == "num boards":
+            return self.num_boards if group is None else len(group)
+        elif cmd == "claim":
+            return self.claim(client, request["boards"], request.get("session"))
+        elif cmd == "write":
+            boards = request.get("boards")
+            if group is not None:
+                self.check_boards(client, [group[k] for k in (range(min(len(request["instr list"]), len(group))) if boards is None else boards)])
+            else:
+                self.check_boards(client, range(len(request["instr list"])) if boards is None else boards)
+            return self.write_boards(request["instr list"], boards, group=group, skip_unchanged=request.get("skip unchanged", False))
+        elif cmd == "restart boards":
+            self.check_boards(client, group)
+            return self.restart_boards(group)
+        elif cmd == "software trigger":
+            self.check_boards(client, group)
+            return self.software_trigger(group)
+        elif cmd == "sync":
+            # a synchronized start (see board_sync.py) involves every board
+            if (request["sync"] is not None) and (group is not None) and (len(group) < self.num_boards):
+                raise ValueError("Board sync needs every board, it can't be set by a client with a group of boards.")
+            if (request["sync"] is not None) or (group is None):
+                self.check_boards(client, None)
+                self.queue.sync = request["sync"]
+            return None
+        elif cmd == "scan start":
+            return self.start_scan(request["instr list"], request["scan sequence list"], request["programs"], request["program index"],
+                                   request["counter"], request["DAQ DI channel"], request["DAQ edge counter"], request.get("checkpoint"),
+                                   request.get("trigger source", "DAQ Change Detection"), client["session"], group)
+        elif cmd == "scan stop":
+            return self.stop_scan(client["session"])
+        elif cmd == "status":
+            return self.status(client["session"])
+        else:
+            raise ValueError(f"Unsupported command: {cmd}.")
+
+    # serve clients on localhost, every client in its own thread. Boards keep their state when a client disconnects.
+    def serve(self, port=default_port):
+        key, generated = daemon_authkey()
+        with Listener(("127.0.0.1", port), authkey=key) as listener:
+            if generated:
+                save_authkey(port, key)
+            print(f"Listening on 127.0.0.1:{port}.")
+            try:
+                while True:
+                    try:
+                        conn = listener.accept()
+                    except Exception as err:
+                        # e.g. a client with a wrong authkey
+                        logging.warning(err)
+                        continue
+                    print(f"Client connected: {listener.last_accepted}")
+                    threading.Thread(target=self.serve_client, args=(conn,), daemon=True).start()
+            finally:
+                if generated and os.path.exists(authkey_file(port)):
+                    os.remove(authkey_file(port))
+
+    def serve_client(self, conn):
+        client = {"boards": None, "session": "default"}
+        with self.lock:
+            self.clients.append(client)
+        try:
+            with conn:
+                while True:
+                    try:
+                        request = conn.recv()
+                    except (EOFError, ConnectionResetError):
+                        print(f"Client disconnected ({client['session']}).")
+                        break
+
+                    try:
+                        conn.send({"result": self.handle(request, client)})
+                    except Exception as err:
+                        logging.warning(err)
+                        conn.send({"error": f"{type(err).__name__}: {err}"})
+        finally:
+            # the client's scan session keeps running
+            with self.lock:
+                self.clients.remove(client)
+
+# a client of hardwareDaemon, used by the GUI
+class daemonClient:
+    def __init__(self, port=default_port):
+        self.conn = Client(("127.0.0.1", port), authkey=client_authkey(port))
+        self.lock = threading.Lock()
+        self.session = None # name of the scan session, if a group of boards is claimed
+
+    # control only a group of boards, with a scan session of its own, return the number of boards in the group
+    def claim(self, boards, session=None):
+        self.session = session or f"boards {', '.join(str(j) for j in sorted(set(boards)))}"
+
+        return self.request("claim", boards=boards, session=self.session)
+
+    # send a request and wait for its result
+    def request(self, cmd, **kwargs):
+        kwargs["cmd"] = cmd
+        with self.lock:
+            self.conn.send(kwargs)
+            reply = self.conn.recv()
+
+        if "error" in reply:
+            raise RuntimeError(reply["error"])
+
+        return reply["result"]
+
+    def close(self):
+        self.conn.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="PulseBlaster hardware-control daemon.")
+    parser.add_argument("--port", type=int, default=default_port)
+    parser.add_argument("--emulator", type=int, default=None, metavar="NUM_BOARDS", help="use emulated boards instead of SpinAPI")
+    parser.add_argument("--trace", default=None, metavar="FILE", help="record every SpinAPI call into a trace file, see pb_trace.py")
+    args = parser.parse_args()
+
+    if args.emulator is not None:
+        import pb_emulator
+        api = pb_emulator.emulator(args.emulator)
+    else:
+        import spinapi as api
+    if args.trace:
+        import pb_trace
+        api = pb_trace.tracedApi(api, args.trace)
+
+    print(f"Process priority: {raise_priority()}")
+    daemon = hardwareDaemon(api)
+    daemon.init_boards()
+    try:
+        daemon.serve(args.port)
+    finally:
+        daemon.stop_scan()
+        # pb_close function has to be called at the end of any programming/start/stop instructions
+        daemon.queue.close()
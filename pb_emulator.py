@@ -0,0 +1,209 @@
+# A software emulator of SpinCore PulseBlasterUSB boards.
+# It provides the same pb_* functions as spinapi.py, so it can stand in for real boards,
+# and it can run the programmed instructions to find the output timeline and cycle time of a program.
+
+PULSE_PROGRAM = 0
+FREQ_REGS = 1
+
+ns = 1.0
+us = 1000.0
+ms = 1000000.0
+
+max_num_instr = 4096 # instruction memory of PulseBlasterUSB
+max_loop_depth = 8 # maximum number of nested loops
+max_subroutine_depth = 8 # maximum number of nested subroutines
+min_duration = 50 # ns, the shortest acceptable pulse width
+time_resolution = 10 # ns
+
+CONTINUE, STOP, LOOP, END_LOOP, JSR, RTS, BRANCH, LONG_DELAY, WAIT = range(9)
+
+class emulatorError(Exception):
+    pass
+
+# an emulated board
+class emulatedBoard:
+    def __init__(self):
+        self.initialized = False
+        self.clock = 100.0 # MHz
+        self.program = [] # list of (TTL output pattern, op code, op data, duration in ns)
+        self.programming = None # instructions received since pb_start_programming
+        self.running = False
+        self.num_programmed = 0 # number of times the board is programmed
+
+    # run the program, return a list of cycles
+    # every cycle is a dictionary {"duration": time in ns, "timeline": [(start time in ns, output pattern), ...]}
+    # the first cycle starts with the program start and ends at the first WAIT, every following cycle starts at a trigger.
+    # Stop after num_triggers triggers, or when the program reaches STOP.
+    def run(self, num_triggers=1, max_steps=10000000):
+        program = self.program
+        if not program:
+            raise emulatorError("Board is not programmed.")
+
+        cycles = []
+        timeline = []
+        t = 0
+        addr = 0
+        loop_stack = [] # [address of LOOP, remaining loop count]
+        sub_stack = [] # return addresses
+        triggers = 0
+        steps = 0
+
+        while True:
+            if addr < 0 or addr >= len(program):
+                raise emulatorError(f"Program counter out of range at address {addr}.")
+
+            steps += 1
+            if steps > max_steps:
+                raise emulatorError(f"Program doesn't reach WAIT or STOP within {max_steps} instructions.")
+
+            pattern, op_code, op_data, duration = program[addr]
+
+            if op_code == WAIT:
+                # the board stops here until a trigger, then outputs this instruction
+                cycles.append({"duration": t, "timeline": timeline})
+                if triggers >= num_triggers:
+                    return cycles
+                triggers += 1
+                t = 0
+                timeline = []
+
+            if op_code == STOP:
+                cycles.append({"duration": t, "timeline": timeline})
+                return cycles
+
+            if op_code == LONG_DELAY:
+                if op_data < 2:
+                    raise emulatorError(f"Instr {addr}: LONG_DELAY needs op data of at least 2.")
+                timeline.append((t, pattern))
+                t += duration * op_data
+            else:
+                timeline.append((t, pattern))
+                t += duration
+
+            if op_code == LOOP:
+                if op_data < 1:
+                    raise emulatorError(f"Instr {addr}: LOOP needs op data of at least 1.")
+                if (not loop_stack) or (loop_stack[-1][0] != addr):
+                    if len(loop_stack) >= max_loop_depth:
+                        raise emulatorError(f"Instr {addr}: more than {max_loop_depth} nested loops.")
+                    loop_stack.append([addr, op_data])
+                addr += 1
+
+            elif op_code == END_LOOP:
+                if (not loop_stack) or (loop_stack[-1][0] != op_data):
+                    raise emulatorError(f"Instr {addr}: END_LOOP doesn't match a LOOP at address {op_data}.")
+                loop_stack[-1][1] -= 1
+                if loop_stack[-1][1] > 0:
+                    addr = op_data
+                else:
+                    loop_stack.pop()
+                    addr += 1
+
+            elif op_code == JSR:
+                if len(sub_stack) >= max_subroutine_depth:
+                    raise emulatorError(f"Instr {addr}: more than {max_subroutine_depth} nested subroutines.")
+                sub_stack.append(addr+1)
+                addr = op_data
+
+            elif op_code == RTS:
+                if not sub_stack:
+                    raise emulatorError(f"Instr {addr}: RTS without JSR.")
+                addr = sub_stack.pop()
+
+            elif op_code == BRANCH:
+                addr = op_data
+
+            else:
+                addr += 1
+
+# an emulator of all boards in the system, with the same functions as spinapi.py
+class emulator:
+    def __init__(self, num_boards=1):
+        self.boards = [emulatedBoard() for i in range(num_boards)]
+        self.current = 0
+        self.error = ""
+
+    def pb_get_version(self):
+        return "emulator"
+
+    def pb_get_error(self):
+        return self.error
+
+    def pb_count_boards(self):
+        return len(self.boards)
+
+    def pb_set_debug(self, debug):
+        return 0
+
+    def pb_select_board(self, board_number):
+        if board_number < 0 or board_number >= len(self.boards):
+            self.error = f"Board {board_number} doesn't exist."
+            return -1
+        self.current = board_number
+        return 0
+
+    def pb_init(self):
+        self.boards[self.current].initialized = True
+        return 0
+
+    def pb_set_defaults(self):
+        return 0
+
+    def pb_core_clock(self, clock):
+        self.boards[self.current].clock = clock
+        return 0
+
+    def pb_start_programming(self, target):
+        self.boards[self.current].programming = []
+        return 0
+
+    def pb_inst_pbonly(self, flags, inst, inst_data, length):
+        board = self.boards[self.current]
+        if board.programming is None:
+            self.error = "pb_start_programming is not called."
+            return -1
+        if len(board.programming) >= max_num_instr:
+            self.error = f"More than {max_num_instr} instructions."
+            return -1
+        board.programming.append((int(flags), int(inst), int(inst_data), float(length)))
+        return len(board.programming)-1 # address of this instruction
+
+    def pb_stop_programming(self):
+        board = self.boards[self.current]
+        board.program = board.programming or []
+        board.programming = None
+        board.num_programmed += 1
+        return 0
+
+    def pb_start(self):
+        self.boards[self.current].running = True
+        return 0
+
+    def pb_stop(self):
+        self.boards[self.current].running = False
+        return 0
+
+    def pb_reset(self):
+        return 0
+
+    def pb_close(self):
+        return 0
+
+# check whether a program in the format of instrTable.compile_instr() fits in a board and runs, return a list of error messages
+def check_program(instr_list_single_board):
+    errors = []
+    if len(instr_list_single_board) > max_num_instr:
+        errors.append(f"Error: {len(instr_list_single_board)} instructions don't fit in the board memory ({max_num_instr}).")
+
+    for i, instr in enumerate(instr_list_single_board):
+        if instr[2] in [JSR, BRANCH] and not (0 <= instr[3] < len(instr_list_single_board)):
+            errors.append(f"Error (Instr {i}): Op data {instr[3]} is not a valid instruction address.")
+
+    return errors
+
+# load a program in the format of instrTable.compile_instr() into a new emulated board
+def emulate_program(instr_list_single_board):
+    board = emulatedBoard()
+    board.program = [(int(instr[1]), int(instr[2]), int(instr[3]), float(instr[4])) for instr in instr_list_single_board]
+
+    return board
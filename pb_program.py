@@ -0,0 +1,507 @@
+# Helpers to read saved configurations and scan sequences without the GUI.
+# Instructions are kept in the same list format as instrTable.compile_instr() in main.py, i.e.
+# for every board a list of [instr note, TTL output pattern, op code, op data, duration in ns, duration value, duration unit index]
+
+import os, re, configparser, hashlib, threading
+import numpy as np
+import pb_analysis
+
+num_ch_per_board = 24 # number of TTL output channels of SpinCore PulseBlasterUSB
+duration_units = ["ms", "us", "ns"] # don't change this
+op_codes = ["CONTINUE", "STOP", "LOOP", "END_LOOP", "JSR", "RTS", "BRANCH", "LONG_DELAY", "WAIT"] # don't change this
+# what a scan instruction scans: the duration, the op data (e.g. a LOOP count), or the state (0 or 1) of one TTL output channel
+scan_targets = ["Duration", "Op Data", "TTL"]
+# orders of scan points, see sequence_order
+scan_orders = ["Interleaved", "Blocked", "Fewest Changes"]
+max_op_data = 2**20-1 # op data has 20 bits
+max_merged_duration = 40e9 # ns, instructions are only merged up to this duration, one instruction counts 32 bits of 10 ns clock cycles
+
+# convert a duration in unit "ms", "us" or "ns" to unit ns
+def duration_in_ns(value, unit):
+    return float(value) * (1000**(2-duration_units.index(unit)))
+
+# convert a string like "10 ms", "2.5us" or "500" (ns) to unit ns
+def parse_duration(text):
+    matched = re.fullmatch(r"\s*([0-9.eE+-]+)\s*(ms|us|ns)?\s*", text)
+    if not matched:
+        raise ValueError(f"Duration ({text}) can't be recognized.")
+
+    return duration_in_ns(matched.group(1), matched.group(2) or "ns")
+
+# read a configuration or sequence file, the same way as mainWindow.load_config does
+def read_config(filename):
+    config = configparser.ConfigParser()
+    config.optionxform = str
+    config.read(filename)
+
+    return config
+
+# a saved sequence has a "Settings" section, a saved configuration has a "General settings" section
+def is_sequence(config):
+    return config.has_section("Settings") and not config.has_section("General settings")
+
+# return channel notes of every board, from channel 0 to channel 23
+def compile_connections(config):
+    num_boards = int(config["General settings"]["number of boards"])
+    connections = []
+    for i in range(num_boards):
+        # in the file, notes are saved from channel 23 to channel 0
+        notes = [x.strip() for x in config["General settings"][f"board {i} connections"].split(",")][::-1]
+        notes += [""] * (num_ch_per_board-len(notes))
+        connections.append(notes[:num_ch_per_board])
+
+    return connections
+
+# compile instructions from a configuration, in the format of instrTable.compile_instr()
+def compile_config(config, num_boards=None):
+    if num_boards is None:
+        num_boards = int(config["General settings"]["number of boards"])
+    num_instr = int(config["General settings"]["number of instructions"])
+
+    instr_list = []
+    for j in range(num_boards):
+        instr_list_single_board = []
+        for i in range(num_instr):
+            section = config[f"Instr {i}"]
+            unit = section["duration unit"]
+            instr = [0, 0, 0, 0, 0, 0, 0]
+            instr[0] = section["instr note"]
+            instr[1] = int(section.get(f"board {j} ttl output pattern", "0b0"), 2)
+            instr[2] = op_codes.index(section["op code"])
+            instr[3] = int(section["op data"])
+            instr[4] = duration_in_ns(section["duration time"], unit)
+            instr[5] = float(section["duration time"])
+            instr[6] = duration_units.index(unit)
+            instr_list_single_board.append(instr)
+
+        instr_list.append(instr_list_single_board)
+
+    return instr_list
+
+# name of a scanned parameter in a saved sequence, e.g. "instr no. 2 (ns)", "instr no. 2 op data" or "instr no. 2 board 0 ch 5"
+def scan_param_name(scan_sequence):
+    target = scan_sequence.get("target", "Duration")
+    if target == "Op Data":
+        return f"instr no. {scan_sequence['instr no.']} op data"
+    elif target == "TTL":
+        return f"instr no. {scan_sequence['instr no.']} board {scan_sequence['board']} ch {scan_sequence['channel']}"
+    else:
+        return f"instr no. {scan_sequence['instr no.']} (ns)"
+
+# read scan parameters from a saved sequence, in the format of generate_sequence()
+def compile_sequence_list(config):
+    element_num = config.getint("Settings", "element number")
+    scan_sequence_list = []
+    index = {} # key in the file: its position in scan_sequence_list
+    for i in range(element_num):
+        for key, val in config[f"Sequence element {i}"].items():
+            # key is in the format of "PulseBlasterUSB [instr no. 2 (ns)]"
+            if "instr no." not in key:
+                continue
+            if key not in index:
+                words = key.split("instr no.")[1].strip(" ]").split()
+                scan_sequence = {"instr no.": int(words[0]), "sequence": []}
+                if words[1:3] == ["op", "data"]:
+                    scan_sequence["target"] = "Op Data"
+                elif words[1] == "board":
+                    scan_sequence.update({"target": "TTL", "board": int(words[2]), "channel": int(words[4])})
+                index[key] = len(scan_sequence_list)
+                scan_sequence_list.append(scan_sequence)
+            scan_sequence_list[index[key]]["sequence"].append(float(val))
+
+    for scan_sequence in scan_sequence_list:
+        scan_sequence["sequence"] = np.array(scan_sequence["sequence"])
+
+    return scan_sequence_list
+
+# read scanned durations from a saved sequence, return a dictionary {instr no.: [values in ns]}
+def compile_sequence(config):
+    sequence = {}
+    for scan_sequence in compile_sequence_list(config):
+        if scan_sequence.get("target", "Duration") == "Duration":
+            sequence[scan_sequence["instr no."]] = list(scan_sequence["sequence"])
+
+    return sequence
+
+# read which interleaved program runs in every element of a saved sequence, return None if the sequence isn't interleaved
+def compile_sequence_programs(config):
+    if not config.has_option("Settings", "interleave pattern"):
+        return None
+
+    element_num = config.getint("Settings", "element number")
+
+    return [config[f"Sequence element {i}"]["PulseBlasterUSB [program]"] for i in range(element_num)]
+
+# read scanner settings from a configuration, in the format of scannerTable.compile_scan_instr()
+def compile_scan_instr(config):
+    scan_instr_list = []
+    for i in range(config.getint("Scanner settings", "number of scan instr")):
+        scan_instr_list.append(dict(config[f"Scan Instr {i}"]))
+
+    return scan_instr_list
+
+# instruction sanity check, return None if passed, otherwise (check name, error message)
+# I haven't used all the functions of Spincore PulseblasterUSB. Sanity check here is limited to the ones I used.
+def instr_sanity_check(instr_list_single_board, op_code_check=True, pulse_width_check=True):
+    # check op code
+    if op_code_check:
+        # the first instruction can't have op code WAIT
+        if instr_list_single_board[0][2] == 8: # 8 is WAIT
+            return ("op code", "Error: The first instruction can't have Op code WAIT.")
+
+        # the last instruction can't have op code CONTINUE, LOOP, END_LOOP, LONG_DELAY, WAIT
+        if instr_list_single_board[-1][2] in [0, 2, 3, 7, 8]:
+            return ("op code", "Error: The last instruction can't have Op code CONTINUE, LOOP, END_LOOP, LONG_DELAY, or WAIT.")
+
+        # loops, subroutines and branch targets, see pb_analysis.py
+        errors = pb_analysis.analyze(instr_list_single_board)["errors"]
+        if errors:
+            return ("control flow", errors[0])
+
+    # check pulse width
+    if pulse_width_check:
+        # the shortest pulse width is 50 ns, and time resolution is 10 ns
+        for i, instr in enumerate(instr_list_single_board):
+            # time resolution is 10 ns
+            # also partially implemented in duration DoubleSpinBox settings for other units
+            if duration_units[instr[6]] == "ns":
+                if int(instr[5])%10 != 0:
+                    return ("time resolution", f"Error (Instr {i}): The Spincore PulseblasterUSB time resolution is 10 ns.")
+
+            # the shortest acceptable pulse width is 50 ns
+            if instr[4] < 50:
+                return ("pulse width", f"Error (Instr {i}): The shortest acceptable pulse width is 50 ns.")
+
+    return None
+
+# scanner settings sanity check, return None if passed, otherwise (check name, error message)
+def scan_instr_sanity_check(scan_instr_list, num_instr, num_boards=None):
+    for i, scan_instr in enumerate(scan_instr_list):
+        if int(scan_instr["instr no."]) > num_instr-1:
+            return ("scan instr no.", f"Error (Scan Instr {i}): Instr # doesn't exist.")
+
+        target = scan_instr.get("target", "Duration")
+        if target not in scan_targets:
+            return ("scan target", f"Error (Scan Instr {i}): Unsupported scan target: {target}.")
+
+        # op data and TTL states are integers, units don't apply
+        if target != "Duration":
+            lo, hi = (0, max_op_data) if target == "Op Data" else (0, 1)
+            for pos in ["start", "end"]:
+                val = float(scan_instr[f"{pos} duration time"])
+                if (val != int(val)) or not (lo <= val <= hi):
+                    return (f"scan {target.lower()}", f"Error (Scan Instr {i}): {target} values should be integers from {lo} to {hi}.")
+            if target == "TTL":
+                if (num_boards is not None) and (int(scan_instr["ttl board"]) > num_boards-1):
+                    return ("scan ttl", f"Error (Scan Instr {i}): TTL Board doesn't exist.")
+                if int(scan_instr["ttl channel"]) > num_ch_per_board-1:
+                    return ("scan ttl", f"Error (Scan Instr {i}): TTL Ch should be from 0 to {num_ch_per_board-1}.")
+            continue
+
+        for pos in ["start", "end"]:
+            # the shortest pulse width is 50 ns
+            duration = duration_in_ns(scan_instr[f"{pos} duration time"], scan_instr[f"{pos} duration unit"])
+            if duration < 50:
+                return ("scan pulse width", f"Error (Scan Instr {i}): The shortest acceptable pulse width is 50 ns.")
+
+            # time resolution is 10 ns
+            if scan_instr[f"{pos} duration unit"] == "ns":
+                if int(float(scan_instr[f"{pos} duration time"]))%10 != 0:
+                    return ("scan time resolution", f"Error (Scan Instr {i}): The Spincore PulseblasterUSB time resolution is 10 ns.")
+
+    return None
+
+# one pass over all points (rows of "values", a column per scan instruction) that reprograms boards the fewest times:
+# points are sorted by durations and op data first (a change reprograms every board), then by the TTL states of every board
+# (a change reprograms only that board), so points that share these values are next to each other. Sorting is O(n log n).
+# global_columns: columns of durations and op data; ttl_board_columns: a list of column indices for every board with scanned TTL states
+# rng: if given, the values of every column are sorted in a random order, otherwise in increasing order
+def order_fewest_changes(values, global_columns, ttl_board_columns, rng=None):
+    columns = list(global_columns) + [c for board_columns in ttl_board_columns for c in board_columns]
+    keys = []
+    for c in columns:
+        distinct, rank = np.unique(values[:, c], return_inverse=True)
+        if rng is not None:
+            rank = rng.permutation(len(distinct))[rank]
+        keys.append(rank)
+    tie_break = rng.permutation(len(values)) if rng is not None else np.arange(len(values))
+
+    # np.lexsort sorts by the last key first
+    return np.lexsort([tie_break] + keys[::-1])
+
+# indices of scan points (0 to samp_num-1) of every sequence element, in one of scan_orders:
+#   "Interleaved": every repetition is a pass over all points, randomized over all elements
+#   "Blocked": every point is repeated rep_num times in a row, the order of points is randomized, boards change the fewest times
+#   "Fewest Changes": every repetition is a pass over all points, points that share durations, op data and TTL states of a board are
+#       next to each other (see order_fewest_changes). Every other repetition runs backwards, so it starts at the point the last one ended with.
+def sequence_order(values, global_columns, ttl_board_columns, samp_num, rep_num, randomize, seed=None, order="Interleaved"):
+    rng = np.random.default_rng(seed)
+    if order == "Blocked":
+        points = rng.permutation(samp_num) if randomize else np.arange(samp_num)
+        return np.repeat(points, rep_num)
+
+    elif order == "Fewest Changes":
+        passed = order_fewest_changes(values, global_columns, ttl_board_columns, rng if randomize else None)
+        # every other repetition runs backwards, so it starts with the point the last one ended with
+        return np.concatenate([passed if i%2 == 0 else passed[::-1] for i in range(rep_num)])
+
+    elif order != "Interleaved":
+        raise ValueError(f"Unsupported scan order: {order}.")
+
+    index = np.tile(np.arange(samp_num), rep_num) # [0, 1, 2, 0, 1, 2], the same as np.tile of values
+    if randomize:
+        index = index[rng.permutation(samp_num*rep_num)]
+
+    return index
+
+# generate scan sequence, in the format of scannerTable.generate_sequence()
+# the random order is determined by "seed", so the same sequence can be generated again, e.g. to resume a scan
+# order: one of scan_orders, see sequence_order
+# dwell: every element is held for this number of consecutive cycles, boards aren't reprogrammed within a dwell (see scan_engine.py)
+def generate_sequence(scan_instr_list, samp_num, rep_num, randomize, seed=None, order="Interleaved", dwell=1):
+    scan_sequence_list = []
+    for scan_instr in scan_instr_list:
+        scan_sequence = {}
+        scan_sequence["instr no."] = int(scan_instr["instr no."])
+        target = scan_instr.get("target", "Duration")
+        if target == "Duration":
+            scan_start = duration_in_ns(scan_instr["start duration time"], scan_instr["start duration unit"]) # start duration time to scan
+            scan_end = duration_in_ns(scan_instr["end duration time"], scan_instr["end duration unit"]) # end duration time to scan
+            seq = np.linspace(scan_start, scan_end, samp_num) # linearly sample from start to end
+        else:
+            # op data and TTL states are rounded to integers
+            scan_sequence["target"] = target
+            if target == "TTL":
+                scan_sequence["board"] = int(scan_instr["ttl board"])
+                scan_sequence["channel"] = int(scan_instr["ttl channel"])
+            seq = np.round(np.linspace(float(scan_instr["start duration time"]), float(scan_instr["end duration time"]), samp_num))
+        scan_sequence["sequence"] = seq
+
+        scan_sequence_list.append(scan_sequence)
+
+    # which boards every scan instruction reprograms, for orders with the fewest changes
+    values = np.array([s["sequence"] for s in scan_sequence_list]).T.reshape(samp_num, len(scan_sequence_list))
+    global_columns = [i for i, s in enumerate(scan_sequence_list) if s.get("target", "Duration") != "TTL"]
+    ttl_boards = sorted({s["board"] for s in scan_sequence_list if s.get("target") == "TTL"})
+    ttl_board_columns = [[i for i, s in enumerate(scan_sequence_list) if (s.get("target") == "TTL") and (s["board"] == b)] for b in ttl_boards]
+
+    index = np.repeat(sequence_order(values, global_columns, ttl_board_columns, samp_num, rep_num, randomize, seed, order), dwell)
+    for scan_sequence in scan_sequence_list:
+        scan_sequence["sequence"] = scan_sequence["sequence"][index]
+
+    return scan_sequence_list
+
+# number of sequence elements after the first one that change any scanned value or the program, i.e. that reprogram boards
+def sequence_changes(scan_sequence_list, program_index=None):
+    if not scan_sequence_list:
+        return 0
+    values = np.array([s["sequence"] for s in scan_sequence_list])
+    if program_index is not None:
+        values = np.vstack([values, program_index])
+
+    return int(np.any(values[:, 1:] != values[:, :-1], axis=0).sum())
+
+# return a copy of instructions with scanned durations, op data or TTL states replaced by values of the scan sequence at "index"
+def apply_scan_point(instr_list, scan_sequence_list, index):
+    new_instr_list = [[list(instr) for instr in instr_list_single_board] for instr_list_single_board in instr_list]
+    for scan_sequence in scan_sequence_list:
+        j = scan_sequence["instr no."]
+        val = float(scan_sequence["sequence"][index])
+        target = scan_sequence.get("target", "Duration")
+        if target == "TTL":
+            instr = new_instr_list[scan_sequence["board"]][j]
+            bit = 1 << scan_sequence["channel"]
+            instr[1] = (instr[1] | bit) if val else (instr[1] & ~bit)
+            continue
+
+        for instr_list_single_board in new_instr_list:
+            instr = instr_list_single_board[j]
+            if target == "Op Data":
+                instr[3] = int(val)
+            else:
+                instr[4] = val
+                instr[5] = val/(1000**(2-instr[6]))
+
+    return new_instr_list
+
+# the program one board needs, from its own instructions: every instruction that doesn't change the outputs of this board is
+# merged into the one before it, so a mostly idle board gets a few instructions instead of the whole table.
+# A CONTINUE is merged into a CONTINUE or WAIT before it with the same TTL output pattern, unless something jumps to it
+# (JSR, BRANCH, END_LOOP) or the merged duration would be too long for one instruction. Addresses are changed to match,
+# times of every output edge and WAIT stay the same.
+def compile_board_program(instr_list_single_board):
+    targets = {instr[3] for instr in instr_list_single_board if instr[2] in [4, 6, 3]} # JSR, BRANCH, END_LOOP
+    program = []
+    address = [] # new address of every instruction
+    for i, instr in enumerate(instr_list_single_board):
+        last = program[-1] if program else None
+        if ((last is not None) and (instr[2] == 0) and (last[2] in [0, 8]) and (instr[1] == last[1]) and (i not in targets)
+            and (last[4]+instr[4] <= max_merged_duration)):
+            last[4] += instr[4]
+            last[5] = last[4]/(1000**(2-last[6]))
+        else:
+            program.append(list(instr))
+        address.append(len(program)-1)
+
+    for instr in program:
+        if (instr[2] in [4, 6, 3]) and (0 <= instr[3] < len(address)):
+            instr[3] = address[instr[3]]
+
+    return program
+
+# check every distinct scan point of a program whose op data or TTL states are scanned, return None if passed, otherwise an error message.
+# Scanned op data can break loops and branches, and only some op codes use op data.
+def scan_points_sanity_check(instr_list, scan_sequence_list):
+    checked = [s for s in scan_sequence_list if s.get("target", "Duration") == "Op Data"]
+    for scan_sequence in checked:
+        j = scan_sequence["instr no."]
+        op_code = op_codes[instr_list[0][j][2]]
+        if op_code not in ["LOOP", "JSR", "BRANCH", "LONG_DELAY"]:
+            return f"Error (instr no. {j}): Op code {op_code} doesn't use op data, it can't be scanned."
+
+    if not checked:
+        return None
+
+    num = len(scan_sequence_list[0]["sequence"])
+    points = {}
+    for i in range(num):
+        points.setdefault(tuple(float(s["sequence"][i]) for s in checked), i)
+
+    for key, i in points.items():
+        for b, instr_list_single_board in enumerate(apply_scan_point(instr_list, scan_sequence_list, i)):
+            error = instr_sanity_check(instr_list_single_board, op_code_check=True, pulse_width_check=False)
+            if error:
+                return f"{error[1]} (board {b}, sequence element {i})"
+
+    return None
+
+# time (ns) from a trigger to the next WAIT for every element of a scan sequence (NaN if it can't be computed), see pb_analysis.py
+# programs and program_index are the interleaved programs and the program of every element, see interleave()
+def scan_cycle_times(instr_list, scan_sequence_list, programs=None, program_index=None):
+    num = len(scan_sequence_list[0]["sequence"])
+    cycle_times = np.full(num, np.nan)
+    cache = {}
+    for i in range(num):
+        p = 0 if program_index is None else int(program_index[i])
+        key = (p,) + tuple(float(s["sequence"][i]) for s in scan_sequence_list)
+        if key not in cache:
+            program = instr_list if program_index is None else programs[p]
+            result = pb_analysis.analyze(apply_scan_point(program, scan_sequence_list, i)[0])
+            if result["errors"] or (result["cycle time"] is None) or (result["waits per cycle"] == 0):
+                cache[key] = np.nan
+            else:
+                cache[key] = result["cycle time"]/result["waits per cycle"]
+        cycle_times[i] = cache[key]
+
+    return cycle_times
+
+# sha1 hash of a program, durations of scanned instructions are excluded because they change during a scan
+def program_hash(instr_list, scanned_instr_nums=()):
+    h = hashlib.sha1()
+    for instr_list_single_board in instr_list:
+        for i, instr in enumerate(instr_list_single_board):
+            duration = None if i in scanned_instr_nums else instr[4]
+            h.update(repr((instr[1], instr[2], instr[3], duration)).encode("utf-8"))
+
+    return h.hexdigest()
+
+# sha1 hash of a file's content
+def file_hash(filename):
+    with open(filename, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+# a checkpoint of a running scan, so an interrupted scan can be resumed at the next point.
+# The file is written once when a scan starts, then only the last applied element is overwritten in place in every cycle.
+# An element is applied once its shot has run: loading element k at a WAITING edge means element k-1 has run.
+class scanCheckpoint:
+    def __init__(self, filename="scan_checkpoint.ini"):
+        self.filename = filename
+        self.file = None
+        self.counter_offset = 0
+        self.lock = threading.Lock() # updates come from the DAQ callback, a new checkpoint can start in the main thread
+
+    # write a new checkpoint, "counter" is the last applied (run) element of the sequence, -1 if none is applied yet
+    def start(self, sequence_filename, sequence_hash, seed, config_hash, element_num, counter=-1):
+        self.close()
+        header = "[Checkpoint]\n"
+        header += f"sequence file = {sequence_filename}\n"
+        header += f"sequence sha1 = {sequence_hash}\n"
+        header += f"random seed = {seed}\n"
+        header += f"config sha1 = {config_hash}\n"
+        header += f"element number = {element_num}\n"
+        header += "last applied element = "
+        header = header.encode("utf-8")
+
+        with self.lock:
+            self.file = open(self.filename, "wb")
+            self.file.write(header)
+            self.counter_offset = len(header)
+        self.update(counter)
+
+    # overwrite the last applied element, the field has a fixed width so the rest of the file doesn't move
+    def update(self, counter):
+        with self.lock:
+            if self.file is None:
+                return
+
+            self.file.seek(self.counter_offset)
+            self.file.write(f"{counter:>12d}\n".encode("utf-8"))
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    # read a checkpoint, return None if it doesn't exist or can't be read
+    def read(self):
+        if not os.path.exists(self.filename):
+            return None
+
+        try:
+            config = read_config(self.filename)
+            checkpoint = dict(config["Checkpoint"])
+            checkpoint["element number"] = int(checkpoint["element number"])
+            checkpoint["last applied element"] = int(checkpoint["last applied element"])
+            return checkpoint
+        except Exception:
+            return None
+
+# whether two programs have the same instructions except durations and TTL patterns,
+# so one can be loaded into boards in place of the other while boards are waiting at a WAIT
+def same_structure(instr_list_a, instr_list_b):
+    if len(instr_list_a) != len(instr_list_b):
+        return False
+
+    for a, b in zip(instr_list_a, instr_list_b):
+        if [instr[2:4] for instr in a] != [instr[2:4] for instr in b]:
+            return False
+
+    return True
+
+# program letters used in an interleave pattern, "A" is the first program
+program_letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+# check an interleave pattern like "ABAB" or "ABBA" for num_programs programs, return None if passed, otherwise an error message
+def interleave_sanity_check(pattern, num_programs):
+    if not pattern:
+        return "Error: Interleave pattern is empty."
+
+    for letter in pattern:
+        if letter not in program_letters[:num_programs]:
+            return f"Error: Interleave pattern ({pattern}) uses program {letter}, but only {num_programs} program(s) are given."
+
+    return None
+
+# interleave programs: every element of the scan sequence is repeated once for every letter of the pattern,
+# return the expanded scan sequence list, and the index of the program to run in every element.
+# dwell: elements come in runs of this length (see generate_sequence), a run is repeated for every letter, so every program dwells too
+def interleave(scan_sequence_list, pattern, dwell=1):
+    num_letters = len(pattern)
+    num_runs = len(scan_sequence_list[0]["sequence"])//dwell
+    index = np.tile(np.arange(num_runs*dwell).reshape(num_runs, dwell), num_letters).ravel()
+    new_scan_sequence_list = [dict(s, sequence=s["sequence"][index]) for s in scan_sequence_list]
+    program_index = np.tile(np.repeat([program_letters.index(letter) for letter in pattern], dwell), num_runs)
+
+    return new_scan_sequence_list, program_index
@@ -0,0 +1,255 @@
+# Record and replay SpinAPI calls.
+# A tracer logs every pb_* call with its arguments, return value and a monotonic timestamp (time.perf_counter()) into a compact
+# binary trace file. A trace can be replayed into the emulator (pb_emulator.py) or a stub, at the original or the maximum speed,
+# to reproduce and profile a problem offline. Replaying into the emulator compares every return value with the recorded one,
+# so a trace of a known good run is a regression fixture.
+#
+# Record: set SPINAPI_TRACE to a file name before spinapi.py is imported, e.g. "SPINAPI_TRACE=scan.pbt python main.py",
+#         or start the daemon with "python pb_daemon.py --trace scan.pbt"
+#
+# Examples:
+#   python pb_trace.py show scan.pbt
+#   python pb_trace.py replay scan.pbt --speed original
+#   python pb_trace.py replay scan.pbt --backend stub
+#
+# File format: the magic bytes b"PBTRACE1", then one record per call, all little endian:
+#   function index (uint8, in "functions"), time in s since the trace started (float64), number of arguments (uint8),
+#   tagged arguments, tagged return value. A tagged value is a type byte ("i": int64, "d": float64, "s": uint16 length and
+#   UTF-8 bytes, "n": None, "e": an exception message as "s") followed by the value.
+
+import sys, time, struct, threading, atexit, argparse, numbers
+
+magic = b"PBTRACE1"
+functions = ["pb_get_version", "pb_get_error", "pb_count_boards", "pb_init", "pb_set_debug", "pb_select_board", "pb_set_defaults",
+             "pb_core_clock", "pb_write_register", "pb_start_programming", "pb_stop_programming", "pb_inst_dds2", "pb_start",
+             "pb_stop", "pb_reset", "pb_close", "pb_inst_pbonly"]
+function_index = {name: i for i, name in enumerate(functions)}
+
+header = struct.Struct("<BdB")
+int_value = struct.Struct("<cq")
+float_value = struct.Struct("<cd")
+str_length = struct.Struct("<cH")
+number_formats = {int: (b"i", "q"), float: (b"d", "d")} # type: (tag, struct format), the same as encode()
+
+def encode(value):
+    if value is None:
+        return b"n"
+    elif isinstance(value, numbers.Integral):
+        return int_value.pack(b"i", int(value))
+    elif isinstance(value, numbers.Real):
+        return float_value.pack(b"d", float(value))
+    else:
+        data = str(value).encode("utf-8")[:65535]
+        return str_length.pack(b"s", len(data)) + data
+
+# decode a tagged value at "pos", return (value, next position)
+def decode(buf, pos):
+    tag = buf[pos:pos+1]
+    if tag == b"n":
+        return None, pos+1
+    elif tag == b"i":
+        return int_value.unpack_from(buf, pos)[1], pos+int_value.size
+    elif tag == b"d":
+        return float_value.unpack_from(buf, pos)[1], pos+float_value.size
+    elif tag in [b"s", b"e"]:
+        length = str_length.unpack_from(buf, pos)[1]
+        start = pos+str_length.size
+        value = buf[start:start+length].decode("utf-8")
+        return (value if tag == b"s" else traceException(value)), start+length
+    else:
+        raise ValueError(f"Unknown value type {tag!r} at byte {pos}.")
+
+# a recorded exception, in place of a return value
+class traceException(str):
+    pass
+
+# writes records to a trace file, thread safe. Records are buffered, the file is flushed when closed (also at exit).
+class traceWriter:
+    def __init__(self, filename):
+        self.file = open(filename, "wb", buffering=1024*1024)
+        self.file.write(magic)
+        self.t0 = time.perf_counter()
+        self.lock = threading.Lock()
+        self.packers = {} # signature: (struct, tags)
+        atexit.register(self.close)
+
+    def write(self, name, t, args, ret, error=None):
+        # records of numbers only (e.g. every pb_inst_pbonly call) are packed with one struct per signature
+        signature = (name, len(args)) + tuple(map(type, args)) + (type(ret),)
+        packer = self.packers.get(signature)
+        if (packer is None) and (error is None) and all(x in number_formats for x in signature[2:]):
+            packer = self.packers[signature] = (struct.Struct("<BdB" + "".join("c" + number_formats[x][1] for x in signature[2:])),
+                                                [number_formats[x][0] for x in signature[2:]])
+        if (packer is not None) and (error is None):
+            values = [function_index[name], t-self.t0, len(args)]
+            for tag, value in zip(packer[1], args + (ret,)):
+                values += [tag, value]
+            record = packer[0].pack(*values)
+        else:
+            record = header.pack(function_index[name], t-self.t0, len(args)) + b"".join(encode(a) for a in args)
+            if error is None:
+                record += encode(ret)
+            else:
+                data = str(error).encode("utf-8")[:65535]
+                record += str_length.pack(b"e", len(data)) + data
+        with self.lock:
+            if self.file is not None:
+                self.file.write(record)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+# wrap a function so that every call is written to a traceWriter
+def traced(name, func, writer):
+    def wrapper(*args):
+        t = time.perf_counter()
+        try:
+            ret = func(*args)
+        except Exception as err:
+            writer.write(name, t, args, None, err)
+            raise
+        writer.write(name, t, args, ret)
+        return ret
+
+    wrapper.__name__ = name
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+# wrap pb_* functions in a namespace (e.g. globals() of spinapi.py) in place
+def trace_namespace(namespace, filename):
+    writer = traceWriter(filename)
+    for name in functions:
+        if name in namespace:
+            namespace[name] = traced(name, namespace[name], writer)
+
+    return writer
+
+# an api object (the spinapi module, or e.g. pb_emulator.emulator) whose pb_* calls are traced
+class tracedApi:
+    def __init__(self, api, filename):
+        self.api = api
+        self.writer = traceWriter(filename)
+        for name in functions:
+            if hasattr(api, name):
+                setattr(self, name, traced(name, getattr(api, name), self.writer))
+
+    def __getattr__(self, name):
+        return getattr(self.api, name)
+
+# read a trace file, return a list of records (function name, time in s, args, return value)
+def read_trace(filename):
+    with open(filename, "rb") as f:
+        buf = f.read()
+    if not buf.startswith(magic):
+        raise ValueError(f"{filename} is not a SpinAPI trace.")
+
+    records = []
+    pos = len(magic)
+    while pos < len(buf):
+        # a trace of a crashed program can end in the middle of a record
+        if pos+header.size > len(buf):
+            break
+        func, t, num_args = header.unpack_from(buf, pos)
+        pos += header.size
+        args = []
+        try:
+            for i in range(num_args):
+                value, pos = decode(buf, pos)
+                args.append(value)
+            ret, pos = decode(buf, pos)
+        except (struct.error, UnicodeDecodeError):
+            break
+        records.append((functions[func], t, tuple(args), ret))
+
+    return records
+
+# a backend that accepts every call and returns 0, to time the replay loop itself
+class stubApi:
+    def __init__(self):
+        self.ret = 0
+
+    def __getattr__(self, name):
+        if name not in function_index:
+            raise AttributeError(name)
+        return lambda *args: self.ret
+
+# number of boards a trace uses
+def num_boards_of(records):
+    for name, t, args, ret in records:
+        if name == "pb_count_boards" and isinstance(ret, int):
+            return ret
+
+    return max([args[0] for name, t, args, ret in records if name == "pb_select_board"], default=0) + 1
+
+# replay records into an api object, return a dictionary:
+#   "mismatches": list of (record index, function name, args, recorded return value, replayed return value)
+#   "elapsed": time of the replay in s; "duration": time of the recorded calls in s; "calls": {function name: [count, total s]}
+# speed: "original" keeps the recorded time between calls, "max" calls as fast as possible
+# compare: which functions' return values to compare, by default every one except those returning library texts
+def replay(records, api, speed="max", compare=None):
+    if compare is None:
+        compare = set(functions) - {"pb_get_version", "pb_get_error"}
+    result = {"mismatches": [], "calls": {}, "duration": records[-1][1]-records[0][1] if records else 0}
+
+    t_start = time.perf_counter()
+    t_first = records[0][1] if records else 0
+    for i, (name, t, args, ret) in enumerate(records):
+        if speed == "original":
+            delay = (t-t_first) - (time.perf_counter()-t_start)
+            if delay > 0:
+                time.sleep(delay)
+
+        t0 = time.perf_counter()
+        try:
+            new_ret = getattr(api, name)(*args)
+        except Exception as err:
+            new_ret = traceException(str(err))
+        stats = result["calls"].setdefault(name, [0, 0.0])
+        stats[0] += 1
+        stats[1] += time.perf_counter()-t0
+
+        if (name in compare) and (new_ret != ret) and not isinstance(api, stubApi):
+            result["mismatches"].append((i, name, args, ret, new_ret))
+
+    result["elapsed"] = time.perf_counter()-t_start
+
+    return result
+
+def print_records(records, limit=None):
+    for i, (name, t, args, ret) in enumerate(records[:limit]):
+        ret = f"raised {ret}" if isinstance(ret, traceException) else f"-> {ret!r}"
+        print(f"{i:>8d} {t*1e3:>12.3f} ms  {name}({', '.join(repr(a) for a in args)}) {ret}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Show or replay a SpinAPI trace.")
+    parser.add_argument("command", choices=["show", "replay"])
+    parser.add_argument("trace", help="trace file")
+    parser.add_argument("--limit", type=int, default=None, help="show: show at most this number of records")
+    parser.add_argument("--backend", choices=["emulator", "stub"], default="emulator", help="replay: backend to replay into")
+    parser.add_argument("--speed", choices=["original", "max"], default="max", help="replay: original timing or as fast as possible")
+    args = parser.parse_args()
+
+    records = read_trace(args.trace)
+    if args.command == "show":
+        print_records(records, args.limit)
+        print(f"{len(records)} call(s) in {(records[-1][1]-records[0][1] if records else 0)*1e3:.3f} ms.")
+        sys.exit()
+
+    if args.backend == "emulator":
+        import pb_emulator
+        api = pb_emulator.emulator(num_boards_of(records))
+    else:
+        api = stubApi()
+
+    result = replay(records, api, args.speed)
+    for name, (count, total) in sorted(result["calls"].items(), key=lambda x: -x[1][1]):
+        print(f"{name:>22}: {count:>8d} call(s), {total/count*1e6:>9.2f} us mean")
+    print(f"{len(records)} call(s) replayed in {result['elapsed']*1e3:.3f} ms (recorded in {result['duration']*1e3:.3f} ms).")
+    for i, name, call_args, ret, new_ret in result["mismatches"][:20]:
+        print(f"Mismatch (record {i}): {name}{call_args} returned {new_ret!r}, recorded {ret!r}.")
+    if result["mismatches"]:
+        print(f"{len(result['mismatches'])} mismatch(es).")
+        sys.exit(1)
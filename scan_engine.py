@@ -0,0 +1,79 @@
+# The per-cycle part of a scan, without GUI: in every cycle, load the next element of a precompiled scan sequence into boards.
+# Used by scannerBox in main.py, and by the hardware daemon in pb_daemon.py.
+
+import logging
+import pb_program
+import daq_trigger
+import metrics
+
+scan_point_counter = metrics.new_counter("scan_points_applied_total", "Number of scan points loaded into boards.")
+missed_cycle_counter = metrics.new_counter("scan_missed_cycles_total", "Number of cycles counted by the DAQ edge counter but missed by callbacks.")
+doubled_callback_counter = metrics.new_counter("scan_doubled_callbacks_total", "Number of DAQ callbacks without a new cycle on the DAQ edge counter.")
+
+class scanEngine:
+    # write_boards: a function that writes compiled instructions (in the format of instrTable.compile_instr()) to boards,
+    # with an argument skip_unchanged, whether boards that already have their program can be skipped (see board_queue.py)
+    def __init__(self, write_boards):
+        self.write_boards = write_boards
+        self.counter = 0
+        self.length = 0
+        self.finished = False
+        self.edge_counter = None
+        self.cycle_accounting = daq_trigger.cycleAccounting()
+
+    # instr_list: compiled program; programs and program_index: interleaved programs and the program of every element, see pb_program.interleave
+    # counter: the first element to load; edge_counter: an optional daq_trigger.edgeCounter that's already counting, with hardware_count edges so far
+    def start(self, instr_list, scan_sequence_list, programs=None, program_index=None, counter=0, edge_counter=None, hardware_count=0):
+        self.instr_list = instr_list
+        self.scan_sequence_list = scan_sequence_list
+        self.programs = programs
+        self.program_index = program_index
+        self.counter = counter
+        self.length = len(scan_sequence_list[0]["sequence"])
+        self.finished = False
+        self.edge_counter = edge_counter
+        self.cycle_accounting = daq_trigger.cycleAccounting(base=counter-hardware_count)
+        self.last_point = None # program and scanned values of the last element written to boards
+
+    # replace the program (program A if interleaved), e.g. after a watched configuration changes
+    def replace_program(self, instr_list):
+        self.instr_list = instr_list
+        if self.programs:
+            self.programs[0] = instr_list
+        self.last_point = None
+
+    # load the next element into boards, return its index, or None if nothing is loaded.
+    # from_trigger: whether it's called because of a trigger (then the scan index is resynchronized to the edge counter)
+    def step(self, from_trigger=True):
+        # resynchronize the scan index to the hardware cycle count
+        if (self.edge_counter is not None) and from_trigger:
+            num_missed = len(self.cycle_accounting.missed)
+            counter = self.cycle_accounting.resync(self.counter, self.edge_counter.read(), self.length)
+            if counter is None:
+                doubled_callback_counter.inc()
+                logging.warning(f"DAQ callback without a new cycle, sequence element {self.counter} is not loaded yet.")
+                return None
+
+            missed = self.cycle_accounting.missed[num_missed:]
+            if missed:
+                missed_cycle_counter.inc(len(missed))
+                logging.warning(f"Missed cycle(s), sequence element(s) {missed} not loaded.")
+            self.counter = counter
+
+        if self.counter < self.length:
+            program = self.instr_list if self.program_index is None else self.programs[self.program_index[self.counter]]
+            # boards already have the program of an element that's the same as the last one, e.g. in a blocked scan order
+            point = (id(program),) + tuple(s["sequence"][self.counter] for s in self.scan_sequence_list)
+            if point != self.last_point:
+                # instructions are compiled when the scan starts, only scanned durations change.
+                # Boards that don't change are skipped, except in the first upload of a scan.
+                self.write_boards(pb_program.apply_scan_point(program, self.scan_sequence_list, self.counter),
+                                  skip_unchanged=self.last_point is not None)
+                self.last_point = point
+            scan_point_counter.inc()
+            self.counter += 1
+            return self.counter-1
+
+        # scanning finishes
+        self.finished = True
+        return None
@@ -0,0 +1,201 @@
+# End-to-end soak test of the scan loop, to find the highest trigger rate it keeps up with, without hardware.
+# Simulated WAITING edges (trigger_sources.simulatedTrigger) drive the same loop as the hardware daemon (pb_daemon.py):
+# every trigger resynchronizes to the edge count, loads the next element into emulated boards (pb_emulator.py)
+# and updates the checkpoint. Every rate runs a number of cycles; a rate is sustained if the scan loop misses no cycle,
+# i.e. every load finishes before the next edge, so no shot runs with the parameters of another element.
+# The simulator's own dispatch thread can also merge edges, e.g. when it isn't scheduled in time on a busy machine. A missed
+# cycle is only counted against the scan loop if the load before it (from the callback to the end of loading) took longer
+# than a period, others are reported separately as simulator misses. Before every rate the simulator runs alone with a
+# callback that does nothing; if it merges edges by itself (the baseline), the machine is too busy to judge the scan loop,
+# and a run without scan loop misses is marked invalid instead of sustained. Latencies are from the edge to the end of
+# loading. The rate is ramped up until the first failure.
+#
+# Examples:
+#   python soak_test.py
+#   python soak_test.py --config saved_configs/dcfluor_MOT.ini --rates 1000,2000,5000 --cycles 100000
+
+import sys, os, io, gc, time, math, argparse, tempfile, contextlib, logging
+import numpy as np
+import pb_program
+import pb_emulator
+import pb_daemon
+import trigger_sources
+
+# resident memory of this process in MB, None if it can't be read
+def memory_mb():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss/2**20
+    except ImportError:
+        pass
+
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1])*os.sysconf("SC_PAGE_SIZE")/2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+# number of edges the simulator merges at a rate with a callback that does nothing, scaled to a number of cycles;
+# runs at most max_time seconds
+def simulator_baseline(rate, cycles, jitter=0.0, seed=None, max_time=10):
+    num = max(min(cycles, int(rate*max_time)), 1)
+    source = trigger_sources.simulatedTrigger(f"{rate}, {jitter}", num=num, seed=seed)
+    num_callbacks = 0
+
+    def on_trigger(task_handle, signal_type, callback_data):
+        nonlocal num_callbacks
+        num_callbacks += 1
+        return 0
+
+    source.start(on_trigger)
+    deadline = time.perf_counter() + 2*num/rate + 10
+    while source.handled < num and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    source.stop()
+
+    # every edge gets its own callback unless the simulator merged it with the next one
+    return (source.count-num_callbacks)*cycles/num
+
+# run one rate, return a dictionary of results
+def run_rate(config, rate, cycles, jitter=0.0, seed=None):
+    baseline = simulator_baseline(rate, cycles, jitter, seed)
+
+    instr_list = pb_program.compile_config(config)
+    samp_num = config.getint("Scanner settings", "sample number")
+    scan_instr_list = pb_program.compile_scan_instr(config)
+    scan_sequence_list = pb_program.generate_sequence(scan_instr_list, samp_num, math.ceil(cycles/samp_num), True, seed)
+    for scan_sequence in scan_sequence_list:
+        scan_sequence["sequence"] = scan_sequence["sequence"][:cycles]
+
+    daemon = pb_daemon.hardwareDaemon(pb_emulator.emulator(len(instr_list)))
+    with contextlib.redirect_stdout(io.StringIO()):
+        daemon.init_boards()
+
+    # the same steps as scanSession.start, with a simulated source that stops after "cycles" edges
+    source = trigger_sources.simulatedTrigger(f"{rate}, {jitter}", num=cycles, seed=seed)
+    latencies = np.zeros(cycles)
+    num_callbacks = 0
+    missed = [] # elements missed because the scan loop was too slow
+    simulator_missed = [] # elements missed because the simulator merged edges
+    last_load_time = 0
+
+    # time from the (last) edge to the end of loading
+    def on_trigger(task_handle, signal_type, callback_data):
+        nonlocal num_callbacks, last_load_time
+        t_edge = source.last_edge_time
+        t_callback = time.perf_counter()
+        num_missed = len(session.engine.cycle_accounting.missed)
+        session.on_trigger(task_handle, signal_type, callback_data)
+        t_loaded = time.perf_counter()
+        latency = t_loaded-t_edge
+        # edges since the last callback were missed by the loop if the last load took longer than a period
+        new_missed = session.engine.cycle_accounting.missed[num_missed:]
+        (missed if last_load_time > 1/rate else simulator_missed).extend(new_missed)
+        last_load_time = t_loaded-t_callback
+        if num_callbacks < cycles:
+            latencies[num_callbacks] = latency
+        num_callbacks += 1
+
+        return 0
+
+    checkpoint_file = tempfile.NamedTemporaryFile(suffix=".ini", delete=False)
+    checkpoint_file.close()
+
+    gc.collect()
+    mem0 = memory_mb()
+    session = pb_daemon.scanSession(daemon, "soak test")
+    session.task = source
+    session.edge_counter = source.edge_counter()
+    session.engine.start(instr_list, scan_sequence_list, counter=0, edge_counter=session.edge_counter)
+    session.checkpoint = pb_program.scanCheckpoint(checkpoint_file.name)
+    session.checkpoint.start("soak test", "", seed, "", cycles)
+    daemon.restart_boards()
+    session.on_trigger()
+    session.scanning = True
+
+    t0 = time.perf_counter()
+    source.start(on_trigger)
+    deadline = t0 + 2*cycles/rate + 10
+    while session.scanning and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    elapsed = time.perf_counter()-t0
+    timed_out = session.scanning
+    session.stop()
+    os.remove(checkpoint_file.name)
+
+    gc.collect()
+    mem1 = memory_mb()
+    latencies = latencies[:min(num_callbacks, cycles)]*1e3 # ms
+
+    return {"rate": rate,
+            "cycles": source.count,
+            "loaded": session.engine.counter,
+            "throughput": session.engine.counter/elapsed,
+            "latency": np.percentile(latencies, [50, 90, 99, 100]) if len(latencies) else np.full(4, np.nan),
+            "missed": missed,
+            "simulator missed": simulator_missed,
+            "baseline": baseline,
+            "timed out": timed_out,
+            "memory": (mem1-mem0) if (mem0 is not None and mem1 is not None) else None,
+            "ok": not missed and not timed_out,
+            "valid": baseline == 0}
+
+def print_header():
+    print(f"{'Rate (Hz)':>10} {'Cycles':>8} {'Throughput (Hz)':>16} {'Latency p50/p90/p99/max (ms)':>30} {'Missed':>7} {'Sim. missed':>12} {'Baseline':>9} {'Memory (MB)':>12}")
+
+def print_result(result):
+    latency = "/".join(f"{x:.3f}" for x in result["latency"])
+    memory = f"{result['memory']:+.1f}" if result["memory"] is not None else "n/a"
+    line = f"{result['rate']:>10g} {result['cycles']:>8d} {result['throughput']:>16.1f} {latency:>30} {len(result['missed']):>7d} {len(result['simulator missed']):>12d} {result['baseline']:>9.1f} {memory:>12}"
+    if result["timed out"]:
+        line += "  (timed out)"
+    elif result["ok"] and not result["valid"]:
+        line += "  (invalid, the simulator merges edges by itself)"
+    print(line)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Soak test of the scan loop with simulated triggers and emulated boards.")
+    parser.add_argument("--config", default="saved_configs/dcfluor_MOT.ini", help="configuration with scanner settings to scan")
+    parser.add_argument("--rates", default="1000,2000,5000,10000,20000", help="trigger rates (Hz) to ramp through, comma separated")
+    parser.add_argument("--cycles", type=int, default=100000, help="number of cycles at every rate")
+    parser.add_argument("--jitter", type=float, default=0.0, help="standard deviation of the trigger period, relative to the period")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the scan order and the jitter")
+    parser.add_argument("--keep-going", action="store_true", help="run all rates, instead of stopping at the first failure")
+    args = parser.parse_args()
+
+    # missed cycles are counted in the results, a warning for each of them would slow down the loop
+    logging.disable(logging.WARNING)
+
+    config = pb_program.read_config(args.config)
+    rates = [float(x) for x in args.rates.split(",") if x.strip()]
+    print(f"Soak test of {args.config}: {args.cycles} cycles per rate, jitter {args.jitter}.")
+    print_header()
+
+    sustained = None
+    failure = None
+    invalid = []
+    for rate in rates:
+        result = run_rate(config, rate, args.cycles, args.jitter, args.seed)
+        print_result(result)
+        if result["ok"] and result["valid"]:
+            sustained = result
+        elif result["ok"]:
+            invalid.append(result["rate"])
+        elif failure is None:
+            failure = result
+            if not args.keep_going:
+                break
+
+    if sustained is not None:
+        print(f"Sustained: {sustained['rate']:g} Hz, {sustained['throughput']:.1f} cycles/s over {sustained['cycles']} cycles.")
+    else:
+        print("Sustained: none of the rates.")
+    if invalid:
+        print(f"Invalid: {', '.join(f'{rate:g}' for rate in invalid)} Hz, no cycle missed by the scan loop, but the simulator merges edges by itself on this machine.")
+    if failure is not None:
+        if failure["missed"]:
+            print(f"First failure: {failure['rate']:g} Hz, {len(failure['missed'])} cycles missed by the scan loop, first missed cycle {failure['missed'][0]} of {failure['cycles']}.")
+        else:
+            print(f"First failure: {failure['rate']:g} Hz, the scan didn't finish in time.")
+
+    sys.exit(0 if sustained is not None else 1)
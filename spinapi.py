@@ -182,3 +182,9 @@ spinapi.pb_inst_pbonly.argtype = (
 	ctypes.c_double, #timing value (double)
 )
 spinapi.pb_inst_pbonly.restype = (ctypes.c_int)
+
+# Following codes are added to record every pb_* call into a trace file, if SPINAPI_TRACE is set, see pb_trace.py
+import os
+if os.environ.get("SPINAPI_TRACE"):
+    import pb_trace
+    pb_trace.trace_namespace(globals(), os.environ["SPINAPI_TRACE"])
@@ -0,0 +1,280 @@
+# Compile per-channel pulse lists into instructions, an alternative to choosing TTL states per instruction in the table.
+# Every channel has a list of pulses (start, stop) and a latency, e.g. of an AOM or a shutter. A channel's edges are moved
+# earlier by its latency, so the device responds at the given times (in a repeated cycle with a period, edges moved before
+# time 0 wrap around to the end of the cycle, so the cycle stays the period). Edges are rounded to the 10 ns grid, so edges within
+# 5 ns of each other coincide, then one sweep over the sorted edges gives the output pattern of every interval between
+# edges, and an instruction per interval in which any pattern changes. Intervals shorter than 50 ns are errors.
+# Compiling E edges is O(E log E), the sort. The result is in the format of instrTable.compile_instr(),
+# so it can be written to boards directly (mainWindow.write_boards) or saved as a configuration (timeline_config).
+#
+# A timeline file:
+#   [Timeline]
+#   number of boards = 1
+#   period = 100 ms           # optional, time from the start to the end of the last instruction, the cycle time if repeated
+#   wait for trigger = True   # optional, wait for a trigger at the start of every cycle
+#   repeat = True             # optional, BRANCH to the start after the last instruction, otherwise STOP
+#
+#   [Board 0 Ch 3]
+#   name = AOM
+#   delay = 350 ns
+#   pulses = 1 ms to 2 ms, 5 ms to 6.5 ms
+#
+# "Load Config" in the GUI accepts timeline files. From command line:
+#   python timeline.py timeline.ini --output saved_configs/timeline.ini
+#   python timeline.py --benchmark 10000
+
+import sys, time, re, configparser, argparse
+import numpy as np
+import pb_program
+from pb_program import num_ch_per_board, op_codes, duration_units
+
+time_resolution = 10 # ns
+min_duration = 50 # ns, the shortest acceptable instruction duration
+
+class timelineError(Exception):
+    pass
+
+# duration values and unit indices shown in the table, the largest unit with values at least 1
+def duration_values_units(durations):
+    units = np.select([durations >= 1e6, durations >= 1e3], [duration_units.index("ms"), duration_units.index("us")], duration_units.index("ns"))
+    values = np.round(durations/1000.0**(2-units), 5)
+
+    return values, units
+
+# compile pulses into instructions
+# pulses: {(board, channel): [(start, stop), ...]} in ns; delays: {(board, channel): latency in ns}, a channel is switched this much earlier
+# period: time (ns) from the start to the end of the last instruction, None to end 50 ns after the last edge
+# wait: wait for a trigger at time 0; repeat: BRANCH to the start at the end, otherwise STOP
+# With repeat and a period, a cycle is exactly the period: edges that latencies move before time 0 wrap around to the end of
+# the previous cycle, and with wait the instruction that arms the WAIT takes the last 50 ns of the period.
+# Otherwise every channel is off at time 0, and if latencies move edges before time 0, the whole timeline is delayed by
+# the largest such lead, so the program is longer by it. The applied shift (ns) is the second item of the result.
+def compile_timeline(pulses, delays=None, num_boards=1, period=None, wait=False, repeat=True):
+    delays = delays or {}
+    wrap = repeat and (period is not None)
+    if wrap:
+        cycle = int(round(period/time_resolution))*time_resolution
+
+    # edges of every channel, rounded to the grid, overlapping or touching pulses of a channel merged
+    times = []
+    boards = []
+    bits = []
+    for (board, ch), channel_pulses in pulses.items():
+        if not (0 <= board < num_boards) or not (0 <= ch < num_ch_per_board):
+            raise timelineError(f"Error: Board {board} channel {ch} doesn't exist.")
+        if len(channel_pulses) == 0:
+            continue
+
+        p = np.asarray(channel_pulses, dtype=float).reshape(-1, 2) - delays.get((board, ch), 0)
+        p = (np.round(p/time_resolution)*time_resolution).astype(np.int64)
+        short = np.nonzero(p[:, 1] <= p[:, 0])[0]
+        if len(short):
+            start, stop = np.asarray(channel_pulses[short[0]], dtype=float)
+            raise timelineError(f"Error (Board {board} Ch {ch}): Pulse from {start:g} ns to {stop:g} ns is shorter than {time_resolution} ns.")
+
+        if wrap:
+            early = np.nonzero(p[:, 0] < -cycle)[0]
+            if len(early):
+                start, stop = np.asarray(channel_pulses[early[0]], dtype=float)
+                raise timelineError(f"Error (Board {board} Ch {ch}): The delay moves the pulse from {start:g} ns to {stop:g} ns more than a period earlier.")
+            # pulses before time 0 move to the end of the cycle, a pulse across time 0 is split at the end of the cycle
+            p[p[:, 1] <= 0] += cycle
+            across = p[:, 0] < 0
+            p = np.concatenate([p, np.stack([p[across, 0]+cycle, np.full(np.count_nonzero(across), cycle)], axis=1)])
+            p[np.nonzero(across)[0], 0] = 0
+
+        p = p[np.argsort(p[:, 0], kind="stable")]
+        # a pulse starts a new merged pulse if it starts after every earlier pulse stopped
+        stops = np.maximum.accumulate(p[:, 1])
+        new = np.ones(len(p), dtype=bool)
+        new[1:] = p[1:, 0] > stops[:-1]
+        starts = p[new, 0]
+        ends = stops[np.append(np.nonzero(new)[0][1:]-1, len(p)-1)]
+
+        times.append(np.concatenate([starts, ends]))
+        boards.append(np.full(2*len(starts), board))
+        bits.append(np.full(2*len(starts), 1 << ch, dtype=np.int64))
+
+    if not times:
+        raise timelineError("Error: The timeline has no pulses.")
+
+    times = np.concatenate(times)
+    boards = np.concatenate(boards)
+    bits = np.concatenate(bits)
+    if wrap:
+        # an edge at the end of the cycle is the edge at time 0 of the next cycle
+        kept = times != cycle
+        times = times[kept]
+        boards = boards[kept]
+        bits = bits[kept]
+    shift = max(0, -int(times.min()))
+    times += shift
+
+    # sweep: every edge toggles one bit, the pattern of an interval is the XOR of all earlier edges
+    order = np.argsort(times, kind="stable")
+    times = times[order]
+    boards = boards[order]
+    bits = bits[order]
+    edge_times, last = np.unique(times[::-1], return_index=True)
+    last = len(times)-1-last # index of the last edge at every time
+    patterns = np.zeros((len(edge_times), num_boards), dtype=np.int64)
+    for j in range(num_boards):
+        toggles = np.where(boards == j, bits, 0)
+        patterns[:, j] = np.bitwise_xor.accumulate(toggles)[last]
+
+    # intervals start at 0 and at every edge, the one before the first edge has every channel off
+    if wrap:
+        end = cycle - min_duration if wait else cycle
+    else:
+        end = edge_times[-1] + min_duration if period is None else int(round((period+shift)/time_resolution))*time_resolution
+    if end <= edge_times[-1]:
+        arming = f", the last {min_duration} ns arm the WAIT" if (wrap and wait) else ""
+        raise timelineError(f"Error: The period ({period:g} ns{arming}) ends before the last edge ({edge_times[-1]-shift} ns).")
+    starts = np.concatenate([[0], edge_times]) if edge_times[0] > 0 else edge_times
+    patterns = np.concatenate([np.zeros((1, num_boards), dtype=np.int64), patterns]) if edge_times[0] > 0 else patterns
+
+    # an instruction only where a pattern changes
+    changed = np.ones(len(starts), dtype=bool)
+    changed[1:] = np.any(patterns[1:] != patterns[:-1], axis=1)
+    starts = starts[changed]
+    patterns = patterns[changed]
+    durations = np.diff(np.append(starts, end))
+
+    short = np.nonzero(durations < min_duration)[0]
+    if len(short):
+        i = short[0]
+        raise timelineError(f"Error: The interval from {starts[i]-shift} ns to {starts[i]+durations[i]-shift} ns is shorter than {min_duration} ns, "
+                            "move edges apart or change delays.")
+
+    op = [op_codes.index("CONTINUE")] * len(starts)
+    op_data = [0] * len(starts)
+    notes = [f"t = {t:g} ms" for t in ((starts-shift)/1e6).tolist()]
+    if wait:
+        # the board waits before the first interval, an instruction has to run before WAIT, it keeps the outputs of the end of the cycle
+        op[0] = op_codes.index("WAIT")
+        op.insert(0, op_codes.index("CONTINUE"))
+        op_data.insert(0, 0)
+        notes.insert(0, "")
+        durations = np.concatenate([[min_duration], durations])
+        patterns = np.concatenate([patterns[-1:], patterns])
+    op[-1] = op_codes.index("BRANCH") if repeat else op_codes.index("STOP")
+
+    values, units = duration_values_units(durations)
+    instr_columns = [durations.astype(float).tolist(), values.tolist(), units.tolist()]
+    instr_list = []
+    for j in range(num_boards):
+        instr_list.append([list(instr) for instr in zip(notes, patterns[:, j].tolist(), op, op_data, *instr_columns)])
+
+    return instr_list, shift
+
+# a saved configuration is a timeline file if it has a "Timeline" section
+def is_timeline(config):
+    return config.has_section("Timeline")
+
+# read pulses, delays, channel names and settings from a timeline configuration
+def read_timeline(config):
+    settings = config["Timeline"]
+    num_boards = int(settings.get("number of boards", "1"))
+    pulses = {}
+    delays = {}
+    names = {}
+    for section in config.sections():
+        matched = re.fullmatch(r"Board\s*([0-9]+)\s*Ch\s*([0-9]+)", section.strip(), re.IGNORECASE)
+        if not matched:
+            continue
+        key = (int(matched.group(1)), int(matched.group(2)))
+        names[key] = config[section].get("name", "")
+        delays[key] = pb_program.parse_duration(config[section].get("delay", "0"))
+        pulses[key] = []
+        for pulse in config[section].get("pulses", "").split(","):
+            if not pulse.strip():
+                continue
+            start_stop = re.split(r"\s+to\s+|\s*-\s+", pulse.strip())
+            if len(start_stop) != 2:
+                raise timelineError(f"Error ({section}): Pulse ({pulse.strip()}) should be like \"1 ms to 2 ms\".")
+            pulses[key].append((pb_program.parse_duration(start_stop[0]), pb_program.parse_duration(start_stop[1])))
+
+    period = settings.get("period")
+    return {"pulses": pulses,
+            "delays": delays,
+            "names": names,
+            "num_boards": num_boards,
+            "period": pb_program.parse_duration(period) if period else None,
+            "wait": settings.getboolean("wait for trigger", False),
+            "repeat": settings.getboolean("repeat", True)}
+
+# compile a timeline configuration into a configuration in the saved format, which instrTable.load_config accepts
+def timeline_config(config):
+    timeline = read_timeline(config)
+    instr_list, shift = compile_timeline(timeline["pulses"], timeline["delays"], timeline["num_boards"],
+                                         timeline["period"], timeline["wait"], timeline["repeat"])
+    if shift:
+        print(f"The timeline is delayed by {shift} ns, so delays don't move edges before time 0, the program is {shift} ns longer.")
+
+    new_config = configparser.ConfigParser()
+    new_config.optionxform = str
+    new_config["General settings"] = {}
+    new_config["General settings"]["number of boards"] = str(timeline["num_boards"])
+    new_config["General settings"]["number of instructions"] = str(len(instr_list[0]))
+    for i in range(timeline["num_boards"]):
+        notes = [timeline["names"].get((i, j), "") for j in range(num_ch_per_board)]
+        new_config["General settings"][f"board {i} connections"] = ", ".join(notes[::-1])
+
+    for j, instr in enumerate(instr_list[0]):
+        new_config[f"Instr {j}"] = {}
+        new_config[f"Instr {j}"]["instr note"] = instr[0]
+        for i in range(timeline["num_boards"]):
+            new_config[f"Instr {j}"][f"board {i} ttl output pattern"] = '0b' + bin(instr_list[i][j][1])[2:].zfill(num_ch_per_board)
+        new_config[f"Instr {j}"]["op code"] = op_codes[instr[2]]
+        new_config[f"Instr {j}"]["op data"] = str(instr[3])
+        new_config[f"Instr {j}"]["duration time"] = str(instr[5])
+        new_config[f"Instr {j}"]["duration unit"] = duration_units[instr[6]]
+
+    return new_config
+
+# random pulses with num_edges edges on 24 channels of one board, for timing
+def random_pulses(num_edges, seed=0):
+    rng = np.random.default_rng(seed)
+    pulses = {}
+    per_channel = num_edges//2//num_ch_per_board
+    for ch in range(num_ch_per_board):
+        # pulses of at least 100 ns on a 100 ns grid, so they are never shorter than 50 ns
+        edges = np.sort(rng.choice(10*num_edges, 2*per_channel, replace=False))*100
+        pulses[(0, ch)] = edges.reshape(-1, 2).tolist()
+
+    return pulses
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compile per-channel pulse lists into PulseBlaster instructions.")
+    parser.add_argument("timeline", nargs="?", help="timeline file")
+    parser.add_argument("--output", help="save the compiled configuration to this file, print instructions if not given")
+    parser.add_argument("--benchmark", type=int, metavar="NUM_EDGES", help="time compiling random pulses with this number of edges")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        pulses = random_pulses(args.benchmark)
+        t0 = time.perf_counter()
+        try:
+            instr_list, shift = compile_timeline(pulses)
+            print(f"{sum(2*len(p) for p in pulses.values())} edges compiled into {len(instr_list[0])} instructions "
+                  f"in {(time.perf_counter()-t0)*1e3:.2f} ms.")
+        except timelineError as err:
+            print(err)
+        sys.exit()
+
+    if not args.timeline:
+        parser.error("a timeline file is needed")
+
+    try:
+        config = timeline_config(pb_program.read_config(args.timeline))
+    except timelineError as err:
+        print(err)
+        sys.exit(1)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            config.write(f)
+        print(f"{config['General settings']['number of instructions']} instructions saved to {args.output}.")
+    else:
+        for instr in pb_program.compile_config(config)[0]:
+            print(f"{op_codes[instr[2]]:>10} {instr[4]:>14.0f} ns  0b{instr[1]:024b}  {instr[0]}")
@@ -0,0 +1,264 @@
+# Trigger sources of a scan. A source calls a callback once per PulseBlaster cycle (a rising edge of the "WAITING" signal),
+# the same way as a nidaqmx signal event: callback(task_handle, signal_type, callback_data), where task_handle isn't None.
+#
+#   "DAQ Change Detection": a DAQ DI line with change detection, address e.g. "Dev1/port0/line0"
+#   "DAQ Counter": a DAQ counter with buffered edge counting, every edge latches a sample, address e.g. "Dev1/ctr0, /Dev1/PFI0"
+#                  (counter and the terminal of the WAITING signal)
+#   "Socket": every line received on a local TCP port is a trigger, address e.g. "6342"
+#   "Simulated": triggers generated in this process, address "rate in Hz, jitter", e.g. "1000, 0.05",
+#                jitter is the standard deviation of the period, relative to the period
+#
+# The simulated source needs no hardware, so the scan loop can be run and profiled at kHz rates on any computer.
+
+import re, time, threading, logging
+import socketserver
+import numpy as np
+import daq_discovery
+
+sources = ["DAQ Change Detection", "DAQ Counter", "Socket", "Simulated"]
+default_socket_port = 6342
+
+# example addresses, shown as placeholder texts
+placeholders = {"DAQ Change Detection": "Dev_/port_/line_",
+                "DAQ Counter": "Dev_/ctr_, /Dev_/PFI_",
+                "Socket": str(default_socket_port),
+                "Simulated": "1000, 0.05"}
+
+# DAQ DI change detection, the trigger used since the beginning
+class daqChangeDetection:
+    debounce = 0.02 # seconds, important in the case of trigger signal has oscillations at rising/falling edge
+
+    # nidaqmx_module: the nidaqmx module, or a replacement with the same interface
+    def __init__(self, address, nidaqmx_module=None):
+        self.address = address.strip()
+        self.nidaqmx = nidaqmx_module
+        self.task = None
+
+    def load_nidaqmx(self):
+        if self.nidaqmx is None:
+            import nidaqmx
+            self.nidaqmx = nidaqmx
+
+        return self.nidaqmx
+
+    # return None if the source can be used, otherwise an error message
+    def check(self):
+        # check whether the channel name is legitimate
+        if not re.match("Dev[0-9]{1,}/port[0-9]{1,}/line[0-9]{1,}", self.address):
+            return f"Error: DAQ channel name ({self.address}) can't be recognized."
+
+        # check whether the channel exists in this computer, channels are enumerated once in the background, see daq_discovery.py
+        if not daq_discovery.get_service(self.load_nidaqmx()).has("di lines", self.address):
+            return f"Error: Specified DAQ channel ({self.address}) doesn't exist in this computer."
+
+        return None
+
+    def start(self, callback):
+        nidaqmx = self.load_nidaqmx()
+        const = nidaqmx.constants
+        self.task = nidaqmx.Task("DI task")
+        self.task.di_channels.add_di_chan(self.address)
+        self.task.timing.cfg_change_detection_timing(rising_edge_chan=self.address, sample_mode=const.AcquisitionType.CONTINUOUS)
+        # see https://nidaqmx-python.readthedocs.io/en/latest/task.html for an example of the callback method
+        self.task.register_signal_event(const.Signal.CHANGE_DETECTION_EVENT, callback)
+        self.task.start()
+
+    def stop(self):
+        if self.task is not None:
+            self.task.stop()
+
+    def close(self):
+        if self.task is not None:
+            self.task.close()
+            self.task = None
+
+# DAQ counter with buffered edge counting: the WAITING signal is the sample clock, every rising edge latches the count into the buffer
+class daqCounter(daqChangeDetection):
+    debounce = 0 # edges are counted in hardware, oscillations don't produce extra samples after the first edge
+    max_rate = 100000 # Hz, the highest expected trigger rate, sets the buffer size
+
+    def parse(self):
+        names = [x.strip() for x in self.address.split(",")]
+        counter_ch = names[0]
+        edge_term = names[1] if len(names) > 1 else ""
+
+        return counter_ch, edge_term
+
+    def check(self):
+        counter_ch, edge_term = self.parse()
+        if not re.match("Dev[0-9]{1,}/ctr[0-9]{1,}$", counter_ch):
+            return f"Error: DAQ counter name ({counter_ch}) can't be recognized."
+        if not edge_term:
+            return f"Error: DAQ Counter needs the terminal of the WAITING signal, e.g. {placeholders['DAQ Counter']}."
+
+        if not daq_discovery.get_service(self.load_nidaqmx()).has("counters", counter_ch):
+            return f"Error: Specified DAQ counter ({counter_ch}) doesn't exist in this computer."
+
+        return None
+
+    def start(self, callback):
+        nidaqmx = self.load_nidaqmx()
+        const = nidaqmx.constants
+        counter_ch, edge_term = self.parse()
+        self.callback = callback
+        self.task = nidaqmx.Task("Trigger counter task")
+        ch = self.task.ci_channels.add_ci_count_edges_chan(counter_ch, edge=const.Edge.RISING,
+                                                            initial_count=0, count_direction=const.CountDirection.COUNT_UP)
+        ch.ci_count_edges_term = edge_term
+        self.task.timing.cfg_samp_clk_timing(self.max_rate, source=edge_term, active_edge=const.Edge.RISING,
+                                             sample_mode=const.AcquisitionType.CONTINUOUS)
+        self.task.register_every_n_samples_acquired_into_buffer_event(1, self.on_samples)
+        self.task.start()
+
+    def on_samples(self, task_handle, event_type, num_samples, callback_data):
+        # empty the buffer, a callback may cover more than one edge, then the scan engine's edge counter finds the missed ones
+        self.task.read(number_of_samples_per_channel=self.nidaqmx.constants.READ_ALL_AVAILABLE)
+
+        return self.callback(task_handle, event_type, callback_data)
+
+# every line received on a local TCP port is a trigger, e.g. from another program that watches the WAITING signal
+class socketTrigger:
+    debounce = 0
+
+    def __init__(self, address, nidaqmx_module=None):
+        self.address = address.strip()
+        self.server = None
+
+    def check(self):
+        if not self.address.isdigit() or not (0 < int(self.address) < 65536):
+            return f"Error: Trigger port ({self.address}) should be a number from 1 to 65535."
+
+        return None
+
+    def start(self, callback):
+        class handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    callback(self.request.fileno(), None, None)
+
+        class server(socketserver.ThreadingTCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        self.server = server(("127.0.0.1", int(self.address)), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+
+    def close(self):
+        if self.server is not None:
+            self.server.server_close()
+            self.server = None
+
+# triggers generated at a given rate with jitter, without hardware.
+# Edges are generated in one thread and the callback runs in another one. Like a DAQ, edges that come while the callback
+# is still running are reported by one callback, so a slow callback misses cycles. "count" is the number of edges so far,
+# "last_edge_time" the time (time.perf_counter()) of the last edge.
+class simulatedTrigger:
+    debounce = 0
+
+    # num: stop after this number of edges, None to run until stopped; seed: seed of the jitter
+    def __init__(self, address, nidaqmx_module=None, num=None, seed=None):
+        self.address = address.strip()
+        self.num = num
+        self.rng = np.random.default_rng(seed)
+        self.count = 0
+        self.last_edge_time = None
+        self.handled = 0
+        self.cond = threading.Condition()
+        self.running = False
+        self.threads = []
+
+    def parse(self):
+        values = [float(x) for x in self.address.split(",") if x.strip()]
+        rate = values[0]
+        jitter = values[1] if len(values) > 1 else 0.0
+
+        return rate, jitter
+
+    def check(self):
+        try:
+            rate, jitter = self.parse()
+        except (ValueError, IndexError):
+            return f"Error: Simulated trigger ({self.address}) should be \"rate in Hz, jitter\", e.g. {placeholders['Simulated']}."
+        if rate <= 0 or jitter < 0:
+            return "Error: Simulated trigger rate should be positive and jitter can't be negative."
+
+        return None
+
+    def start(self, callback):
+        self.rate, self.jitter = self.parse()
+        self.callback = callback
+        self.running = True
+        self.threads = [threading.Thread(target=self.generate, daemon=True), threading.Thread(target=self.dispatch, daemon=True)]
+        for thread in self.threads:
+            thread.start()
+
+    # generate edges on schedule, regardless of the callback
+    def generate(self):
+        period = 1/self.rate
+        next_t = time.perf_counter()
+        while self.running and ((self.num is None) or (self.count < self.num)):
+            next_t += max(period*(1+self.jitter*self.rng.standard_normal()), 0)
+            delay = next_t-time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            with self.cond:
+                self.count += 1
+                self.last_edge_time = time.perf_counter()
+                self.cond.notify()
+
+    # call the callback once for all edges since the last call
+    def dispatch(self):
+        while True:
+            with self.cond:
+                while self.running and self.count == self.handled:
+                    self.cond.wait(0.1)
+                if not self.running:
+                    return
+                self.handled = self.count
+            try:
+                self.callback(self, None, None)
+            except Exception as err:
+                logging.warning(err)
+
+    # an edge counter (see daq_trigger.edgeCounter) that reads the number of generated edges
+    def edge_counter(self):
+        source = self
+
+        class counter:
+            def start(self):
+                pass
+
+            def read(self):
+                return source.count
+
+            def close(self):
+                pass
+
+        return counter()
+
+    def stop(self):
+        self.running = False
+        with self.cond:
+            self.cond.notify_all()
+        for thread in self.threads:
+            if thread is not threading.current_thread():
+                thread.join()
+
+    def close(self):
+        self.threads = []
+
+source_classes = {"DAQ Change Detection": daqChangeDetection,
+                  "DAQ Counter": daqCounter,
+                  "Socket": socketTrigger,
+                  "Simulated": simulatedTrigger}
+
+# create a trigger source by its name in "sources"
+def new_source(kind, address, nidaqmx_module=None):
+    if kind not in source_classes:
+        raise ValueError(f"Unsupported trigger source: {kind}.")
+
+    return source_classes[kind](address, nidaqmx_module)